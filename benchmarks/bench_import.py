@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Cold-start benchmark : measures how long a fresh interpreter takes to import eakon (and one model), in milliseconds.
+Each measurement runs in a new process, the interpreter startup time (python -c pass) being subtracted.
+
+usage : python benchmarks/bench_import.py [runs]
+"""
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "import eakon": "import eakon",
+    "import eakon + Daikin": "import eakon; eakon.Daikin",
+    "import eakon + Daikin().wave": "import eakon; from eakon.enums import daikin_enum; "
+                                    "eakon.Daikin(power=daikin_enum.Power.ON, temperature=21).wave",
+}
+
+
+def _run(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, {!r}); {}".format(str(ROOT), code)],
+                   check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def _median_ms(code: str, runs: int) -> float:
+    return statistics.median(_run(code) for _ in range(runs))
+
+
+def main(runs=20):
+    baseline = _median_ms("pass", runs)
+    print("interpreter startup : {:.1f} ms".format(baseline))
+    for name, code in SCENARIOS.items():
+        print("{:<30}: {:.1f} ms".format(name, _median_ms(code, runs) - baseline))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
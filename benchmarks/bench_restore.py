@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Restore benchmark : time to build units restoring their state from json files, the first time (files parsed) and
+again (files unchanged, only stat'ed), one by one and in bulk (eakon.restore_units).
+
+usage : python benchmarks/bench_restore.py [units] [rounds]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import eakon  # noqa: E402
+from eakon.daikin import Daikin  # noqa: E402
+from eakon.enums import daikin_enum  # noqa: E402
+
+
+def _build(paths):
+    units = []
+    for path in paths:
+        unit = Daikin()
+        unit.json_file = path
+        units.append(unit)
+    return units
+
+
+def main(units=50, rounds=20):
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [Path(directory) / "unit{}.json".format(i) for i in range(units)]
+        for i, path in enumerate(paths):
+            unit = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=18 + i % 12)
+            unit.json_file = path
+            unit.save_on_update = True
+            unit.save()
+
+        for name, restore in (("one by one", lambda built: [unit.restore() for unit in built]),
+                              ("bulk", eakon.restore_units)):
+            eakon._restored_states.clear()
+            built = _build(paths)
+            start = time.perf_counter()
+            restore(built)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(rounds):
+                restore(_build(paths))
+            warm = (time.perf_counter() - start) / rounds
+            print("{:<11}: {} units, first restore {:.2f} ms, unchanged files {:.2f} ms (build included)".format(
+                name, units, cold * 1000, warm * 1000))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+End-to-end load test against simulated receivers : commands are applied to a fleet, scheduled on emitters, delivered
+to the simulated units of each room, decoded and checked. Reports the throughput and the receivers statistics, and
+verifies that every simulated unit ends in the state of its fleet unit.
+
+usage : python benchmarks/bench_sim.py [--units 1000] [--commands 20000] [--jitter 0] [--drop-rate 0]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+MODELS = ("daikin", "panasonic", "toshiba", "hitachi")
+SETTINGS = {"mode": ("COOL", "HEAT"), "temperature": tuple(range(18, 29))}
+
+
+async def main(units, commands, room_size, jitter, drop_rate):
+    from eakon.fleet import Fleet
+    from eakon.scheduler import Scheduler
+    from eakon.sim import Simulation
+
+    fleet = Fleet()
+    simulation = Simulation(jitter=jitter, drop_rate=drop_rate, seed=1)
+    for i in range(units):
+        unit_id = "unit{}".format(i)
+        fleet.add(unit_id, MODELS[i % len(MODELS)])
+        # the units of a room all see the emitter of the room, whatever their model
+        simulation.add(unit_id, MODELS[i % len(MODELS)], emitter="room{}".format(i // room_size))
+    fleet.apply(power="ON", mode="COOL", temperature=24)
+    scheduler = Scheduler(simulation.transmitter, min_gap=0)
+    unit_ids = list(fleet)
+    rooms = {unit_id: "room{}".format(i // room_size) for i, unit_id in enumerate(unit_ids)}
+
+    random.seed(1)
+    start = time.perf_counter()
+    async with simulation:
+        futures = []
+        for i in range(commands):
+            unit_id = random.choice(unit_ids)
+            field = random.choice(tuple(SETTINGS))
+            result = fleet.apply(unit_id, **{field: random.choice(SETTINGS[field])})[unit_id]
+            if result.error is None:
+                futures.append(scheduler.submit(unit_id, result.wave, emitter=rooms[unit_id]))
+            if i % 1000 == 999:
+                await asyncio.sleep(0)
+        await asyncio.gather(*futures, return_exceptions=True)
+        await scheduler.join()
+    elapsed = time.perf_counter() - start
+
+    stats = simulation.stats()
+    print("{} commands to {} units in {:.2f}s : {:.0f} commands/s".format(commands, units, elapsed,
+                                                                        commands / elapsed))
+    print("scheduler : {} submitted, {} coalesced, {} transmitted".format(scheduler.submitted, scheduler.coalesced,
+                                                                         scheduler.transmitted))
+    print("receivers : {} accepted, {} rejected {}, {} dropped".format(
+        stats["accepted"], stats["rejected"], stats["reasons"], simulation.transmitter.dropped))
+    mismatches = [unit_id for unit_id in unit_ids
+                  if simulation[unit_id].accepted and simulation[unit_id].unit.mode != fleet[unit_id].mode]
+    print("units whose simulated mode differs from the fleet : {}".format(len(mismatches)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--units", type=int, default=1000)
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--room-size", type=int, default=4)
+    parser.add_argument("--jitter", type=int, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0.)
+    args = parser.parse_args()
+    asyncio.run(main(args.units, args.commands, args.room_size, args.jitter, args.drop_rate))
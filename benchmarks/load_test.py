@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Load test of the eakon HTTP service : many concurrent keep-alive clients reading states, updating units and fetching
+waves. Reports the throughput and the p50/p99 latencies per kind of request.
+
+usage : python benchmarks/load_test.py [--url http://127.0.0.1:8080] [--clients 200] [--requests 50]
+Without --url, a server with --units daikin/toshiba units is started in process.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+async def _request(reader, writer, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write("{} {} HTTP/1.1\r\nHost: eakon\r\nContent-Length: {}\r\n\r\n".format(
+        method, path, len(payload)).encode() + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, unit_ids, requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            unit_id = random.choice(unit_ids)
+            kind = random.choice(("state", "state", "update", "wave", "wave"))
+            if kind == "state":
+                method, path, body = "GET", "/units/{}".format(unit_id), None
+            elif kind == "update":
+                method, path, body = "POST", "/units/{}".format(unit_id), {
+                    "power": "ON", "mode": random.choice(("COOL", "HEAT")), "temperature": random.randint(20, 26)}
+            else:
+                method, path, body = "GET", "/units/{}/wave?format={}".format(
+                    unit_id, random.choice(("pigpio", "binary"))), None
+            start = time.perf_counter()
+            status = await _request(reader, writer, method, path, body)
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def main(url, clients, requests, units):
+    server = None
+    if url is None:
+        from eakon.fleet import Fleet
+        from eakon.server import FleetServer
+        fleet = Fleet()
+        for i in range(units):
+            fleet.add("unit{}".format(i), ("daikin", "toshiba")[i % 2], )
+        fleet.apply(power="ON", mode="COOL", temperature=25)
+        server = await asyncio.start_server(FleetServer(fleet)._handle_connection, "127.0.0.1", 0, backlog=4096)
+        host, port = server.sockets[0].getsockname()[:2]
+        unit_ids = list(fleet)
+    else:
+        split = urlsplit(url)
+        host, port = split.hostname, split.port or 80
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"GET /units HTTP/1.1\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        unit_ids = list(json.loads(response.split(b"\r\n\r\n", 1)[1]))
+
+    latencies, errors = {}, []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, unit_ids, requests, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+
+    total = sum(len(values) for values in latencies.values())
+    print("{} requests from {} clients in {:.2f}s : {:.0f} req/s, {} errors".format(
+        total, clients, elapsed, total / elapsed, len(errors)))
+    for kind, values in sorted(latencies.items()):
+        print("{:<8} n={:<6} p50={:.2f} ms  p99={:.2f} ms  mean={:.2f} ms".format(
+            kind, len(values), _percentile(values, 50) * 1000, _percentile(values, 99) * 1000,
+            statistics.mean(values) * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--units", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.clients, args.requests, args.units))
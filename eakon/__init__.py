@@ -6,22 +6,59 @@ Air conditioner classes
 __available_models__ = ["daikin", "hitachi", "panasonic", "toshiba"]
 
 import abc
-import json
 import logging
-from abc import ABC
-from importlib import import_module
-from pathlib import Path
+import os
+import threading
+from collections import OrderedDict
 from typing import Union
 
-from eakon.enums import common_enum
+from eakon.registry import ModelRegistry
 from eakon.version import __version__
 
+# model classes exported by this package, loaded on first access (see __getattr__)
+__lazy_classes__ = {model.capitalize(): model for model in __available_models__}
+# other attributes loaded on first access : name -> module
+__lazy_attributes__ = {"Fleet": "eakon.fleet"}
+# json file path -> (stat signature, model enumeration, parsed state), see HVAC.restore
+_restored_states = OrderedDict()
+_restored_states_lock = threading.Lock()
+_RESTORED_STATES_SIZE = 1024
+# below this number of json files, restore_units reads them in the calling thread (a pool costs more than it saves)
+_RESTORE_POOL_THRESHOLD = 64
+
+
+class _LazyModule:
+    """
+    Stands in for a module which is only imported when one of its attributes is first accessed.
+    Attributes are cached on the instance, so only the first access pays for the lookup.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, item):
+        if self.__module is None:
+            from importlib import import_module
+            self.__module = import_module(self.__name)
+        value = getattr(self.__module, item)
+        setattr(self, item, value)
+        return value
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self.__name)
+
 
 class HVAC:
     """
     Parent class for air conditioner
     """
-    __enum = common_enum
+    # enumeration module of the model, declared by subclasses : class Daikin(HVAC, enum=daikin_enum)
+    _model_enum = None
+    # mode name -> fields which have no effect on the signal in that mode
+    _ignored_fields_by_mode = {}
+    # default timings of the model (see eakon.calibration.TIMINGS), declared by subclasses
+    _timings = None
 
     one_mark = None
     one_space = None
@@ -31,13 +68,28 @@ class HVAC:
 
     def __init__(self, power=None, mode=None, temperature=None, wide_vanne_mode=None, area_mode=None, fan_power=None,
                  fan_high_power=None, fan_long=None, fan_vertical_mode=None, fan_horizontal_mode=None,
-                 save_on_update=False, restore=False, room_clean=False, enum=common_enum):
+                 save_on_update=False, restore=False, room_clean=False, enum=None, profile=None):
 
         self.__name = type(self).__name__
+        if enum is None:
+            enum = self._model_enum
+        if enum is None:
+            from eakon.enums import common_enum as enum
         self._enum = enum
-        self._json_file = Path().cwd() / "eakon_{}.json".format(self.__name)
-        if restore:
-            self.restore()
+        self._json_file = None
+        self._last_sent_key = None
+        self._last_sent_time = None
+        self.sends = 0
+        self.skipped_sends = 0
+        self._observers = []
+        self._batch = None
+        self._journal = None
+        self._profile = None
+        self._pulse_tables = None
+        if self._timings is not None:
+            self.one_mark = self.zero_mark = self._timings["mark"]
+            self.one_space = self._timings["one_space"]
+            self.zero_space = self._timings["zero_space"]
 
         self._mode = self._enum.Mode.UNDEFINED
         self._wide_vanne_mode = None
@@ -52,6 +104,9 @@ class HVAC:
         self._room_clean = None
         self._save_on_update = False
         self._save_power_on_update = False
+        # the saved state provides the settings which aren't given
+        if restore:
+            self.restore()
 
         self.power = power
         self.mode = mode
@@ -72,15 +127,25 @@ class HVAC:
             self.fan_horizontal_mode = fan_horizontal_mode
         if room_clean:
             self.room_clean = room_clean
+        if profile is not None:
+            self.profile = profile
         self.save_on_update = save_on_update
         logging.info(f"Eakon {__version__} - Instance of {self.__name} initialized")
 
+    def __init_subclass__(cls, enum=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if enum is not None:
+            cls._model_enum = enum
+            # capabilities are computed once, when the model is loaded
+            from eakon.capabilities import get_capabilities
+            get_capabilities(cls)
+
     def to_dict(self):
         """
         Stores the current state in a dictionary
         :return: dict
         """
-        return {
+        hvac_dict = {
             "mode": "Mode.{}".format(self.mode.name),
             "wide_vanne_mode": "WideVanneMode.{}".format(self.wide_vanne_mode.name),
             "area_mode": "AreaMode.{}".format(self.area_mode.name),
@@ -91,57 +156,192 @@ class HVAC:
             "fan_horizontal_mode": "FanHorizontalMode.{}".format(self.fan_horizontal_mode.name),
             "power": "Power.{}".format(self.power.name),
             "temperature": self.temperature,
-            "room_clean": "RoomClean.{}".format(self.room_clean),
+            "room_clean": "RoomClean.{}".format(self.room_clean.name),
         }
+        if self._profile is not None:
+            hvac_dict["profile"] = self._profile.name
+        if self._last_sent_key is not None:
+            hvac_dict["last_sent"] = self._last_sent_dict()
+        return hvac_dict
+
+    def _last_sent_dict(self) -> dict:
+        fields = self.capabilities.fields
+        last_sent = {
+            "state": {field: value if field == "temperature" or value is None else "{}.{}".format(
+                type(value).__name__, value.name)
+                      for field, value in zip(fields, self._last_sent_key[1:1 + len(fields)])},
+            "time": self._last_sent_time,
+        }
+        if len(self._last_sent_key) > 1 + len(fields):
+            last_sent["profile"] = self._last_sent_key[-1].name
+        return last_sent
+
+    def load_dict(self, hvac_dict: dict, source=None):
+        """
+        Sets the state from a dictionary, as produced by to_dict
+        :param hvac_dict:
+        :param source: where the dictionary comes from, for logging purpose
+        """
+        self._apply_state(self._parse_dict(hvac_dict, source), source)
+
+    def _parse_dict(self, hvac_dict: dict, source=None) -> tuple:
+        """
+        Resolves the values of a dictionary produced by to_dict
+        :return: tuple of (key, value)
+        """
+        items = []
+        for k, v in hvac_dict.items():
+            if v is None:
+                continue
+            if k == "last_sent":
+                last_sent = self._parse_last_sent(v, source)
+                if last_sent is not None:
+                    items.append((k, last_sent))
+                continue
+            if k == "profile":
+                items.append((k, v))
+                continue
+            if isinstance(v, int) or isinstance(v, float):
+                val = v
+            else:
+                split = v.split(".")
+                if len(split) == 2:
+                    val = getattr(self._enum, split[0])[split[1]]
+                else:
+                    logging.error(
+                        "{} has an improperly formatted value for key {} : {}".format(source, k, v)
+                    )
+                    continue
+            items.append((k, val))
+        return tuple(items)
+
+    def _apply_state(self, items, source=None):
+        for k, val in items:
+            if k == "last_sent":
+                values, self._last_sent_time, profile = val
+                self._last_sent_key = (type(self),) + values
+                if profile is not None:
+                    # state_key of a calibrated unit ends with its profile
+                    from eakon.calibration import get_profile
+                    try:
+                        self._last_sent_key += (get_profile(self, profile),)
+                    except KeyError:
+                        logging.error("{} refers to an unknown profile : {}".format(source, profile))
+            elif k == "profile":
+                try:
+                    self.profile = val
+                except (KeyError, ValueError):
+                    logging.error("{} refers to an unknown profile : {}".format(source, val))
+            else:
+                self.__setattr__(k, val)
+
+    def _parse_last_sent(self, last_sent: dict, source=None):
+        """
+        :return: (field values, time, profile name or None), or None when improperly formatted
+        """
+        try:
+            state = last_sent["state"]
+            values = []
+            for field in self.capabilities.fields:
+                value = state.get(field)
+                if isinstance(value, str):
+                    enum_name, name = value.split(".")
+                    value = getattr(self._enum, enum_name)[name]
+                values.append(value)
+            return tuple(values), last_sent["time"], last_sent.get("profile")
+        except (KeyError, ValueError, AttributeError, TypeError):
+            logging.error("{} has an improperly formatted last_sent value : {}".format(source, last_sent))
+            return None
 
     def restore(self):
         """
-        restore the state of the class from file.
+        restore the state of the class from file (or from the journal, when set).
+        The parsed state is cached until the file changes : restoring from an unchanged file only costs a stat.
+        """
+        if self._journal is not None:
+            if not self._journal.restore(self):
+                logging.warning("failed to load from {} : journal is empty.".format(self._journal.path))
+            return
+        items = self._read_state()
+        if items is not None:
+            self._apply_state(items, self.json_file)
+
+    def _read_state(self):
+        """
+        Parsed state of the json file, cached by (path, mtime, size, inode) and model enumeration
+        :return: tuple of (key, value), or None when it can't be read
         """
+        json_file = self.json_file
         try:
-            if self.json_file.exists():
-                logging.info("loading state from {}".format(self.json_file))
-                hvac_dict = json.loads(self.json_file.read_text())
-                for k, v in hvac_dict.items():
-                    if isinstance(v, int) or isinstance(v, float):
-                        val = v
-                    else:
-                        split = v.split(".")
-                        if len(split) == 2:
-                            val = getattr(self._enum, split[0])[split[1]]
-                        else:
-                            logging.error(
-                                "{} has an improperly formatted value for key {} : {}".format(self.json_file, k, v)
-                            )
-                            continue
-                    self.__setattr__(k, val)
-            else:
-                logging.warning("failed to load from {} : file doesn't exists.".format(self.json_file))
+            stat = json_file.stat()
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            path = str(json_file)
+            with _restored_states_lock:
+                cached = _restored_states.get(path)
+            if cached is not None and cached[0] == signature and cached[1] is self._enum:
+                return cached[2]
+            logging.info("loading state from {}".format(json_file))
+            import json
+            items = self._parse_dict(json.loads(json_file.read_text()), source=json_file)
+            with _restored_states_lock:
+                _restored_states[path] = (signature, self._enum, items)
+                if len(_restored_states) > _RESTORED_STATES_SIZE:
+                    _restored_states.popitem(last=False)
+            return items
+        except FileNotFoundError:
+            logging.warning("failed to load from {} : file doesn't exists.".format(json_file))
         except IOError:
-            logging.exception("failed to load from {}".format(self.json_file))
+            logging.exception("failed to load from {}".format(json_file))
         except Exception as exc:
             logging.exception(exc)
+        return None
 
     def save(self):
         """
-        Saves the current state in a json file
+        Saves the current state in a json file (unless a journal records the changes)
         """
-        if self._save_on_update:
+        if self._save_on_update and self._journal is None:
             try:
                 state = self.to_dict()
                 if not self.save_power_on_update:
                     state.pop("power")
+                import json
                 self.json_file.write_text(json.dumps(state))
+                with _restored_states_lock:
+                    _restored_states.pop(str(self.json_file), None)
                 logging.info("save state to {}".format(self.json_file))
             except IOError:
                 logging.exception("failed to save {}".format(self.json_file))
 
     @property
-    def json_file(self) -> Path:
+    def journal(self):
+        """
+        Get/Set the journal recording the changes, replacing the json file (see eakon.journal)
+        :return: Journal
+        """
+        return self._journal
+
+    @journal.setter
+    def journal(self, value):
+        from eakon.journal import Journal
+        if self._journal is not None:
+            self._journal.close()
+        if value is not None and not isinstance(value, Journal):
+            value = Journal(value)
+        if value is not None:
+            value.attach(self)
+        self._journal = value
+
+    @property
+    def json_file(self) -> "Path":
+        if self._json_file is None:
+            from pathlib import Path
+            self._json_file = Path().cwd() / "eakon_{}.json".format(self.__name)
         return self._json_file
 
     @json_file.setter
-    def json_file(self, value: Union[str, Path]):
+    def json_file(self, value: Union[str, "Path"]):
+        from pathlib import Path
         _json_file = Path(value)
         _json_file.parent.mkdir(parents=True, exist_ok=True)
         self._json_file = _json_file
@@ -174,7 +374,8 @@ class HVAC:
         if power:
             if not isinstance(power, self._enum.Power):
                 raise TypeError('must be an instance of Power Enum')
-            self._power = power
+            old, self._power = self.power, power
+            self._changed("power", old, power)
             if self.save_power_on_update:
                 self.save()
 
@@ -191,7 +392,8 @@ class HVAC:
         if mode:
             if not isinstance(mode, self._enum.Mode):
                 raise TypeError('must be an instance of Mode Enum')
-            self._mode = mode
+            old, self._mode = self.mode, mode
+            self._changed("mode", old, mode)
             self.save()
 
     @property
@@ -229,12 +431,14 @@ class HVAC:
     @temperature.setter
     def temperature(self, temperature: Union[int, float]):
         if temperature:
+            old = self.temperature
             if temperature < self.min_temp:
                 self._temperature = self.min_temp
             elif temperature > self.max_temp:
                 self._temperature = self.max_temp
             else:
                 self._temperature = temperature
+            self._changed("temperature", old, self._temperature)
             self.save()
 
     @property
@@ -250,7 +454,8 @@ class HVAC:
         if wide_vanne_mode:
             if not isinstance(wide_vanne_mode, self._enum.WideVanneMode):
                 raise TypeError('must be an instance of WideVanneMode Enum')
-            self._wide_vanne_mode = wide_vanne_mode
+            old, self._wide_vanne_mode = self.wide_vanne_mode, wide_vanne_mode
+            self._changed("wide_vanne_mode", old, wide_vanne_mode)
             self.save()
 
     @property
@@ -266,7 +471,8 @@ class HVAC:
         if area_mode:
             if not isinstance(area_mode, self._enum.AreaMode):
                 raise TypeError('must be an instance of AreaMode Enum')
-            self._area_mode = area_mode
+            old, self._area_mode = self.area_mode, area_mode
+            self._changed("area_mode", old, area_mode)
             self.save()
 
     @property
@@ -282,7 +488,8 @@ class HVAC:
         if fan_power:
             if not isinstance(fan_power, self._enum.FanPower):
                 raise TypeError('must be an instance of FanPower Enum')
-            self._fan_power = fan_power
+            old, self._fan_power = self.fan_power, fan_power
+            self._changed("fan_power", old, fan_power)
             self.save()
 
     @property
@@ -298,7 +505,8 @@ class HVAC:
         if fan_high_power:
             if not isinstance(fan_high_power, self._enum.FanHighPower):
                 raise TypeError('must be an instance of FanHighPower Enum')
-            self._fan_high_power = self._enum.FanHighPower.NOT_AVAILABLE
+            old, self._fan_high_power = self.fan_high_power, fan_high_power
+            self._changed("fan_high_power", old, fan_high_power)
             self.save()
 
     @property
@@ -314,7 +522,8 @@ class HVAC:
         if fan_long:
             if not isinstance(fan_long, self._enum.FanLong):
                 raise TypeError('must be an instance of FanLong Enum')
-            self._fan_long = self._enum.FanLong.NOT_AVAILABLE
+            old, self._fan_long = self.fan_long, fan_long
+            self._changed("fan_long", old, fan_long)
             self.save()
 
     @property
@@ -330,10 +539,12 @@ class HVAC:
         if fan_vertical_mode:
             if not isinstance(fan_vertical_mode, self._enum.FanVerticalMode):
                 raise TypeError('must be an instance of FanVerticalMode Enum')
-            self._fan_vertical_mode = fan_vertical_mode
+            old, self._fan_vertical_mode = self.fan_vertical_mode, fan_vertical_mode
+            self._changed("fan_vertical_mode", old, fan_vertical_mode)
             self.save()
         else:
-            self._fan_vertical_mode = self._enum.FanVerticalMode.UNDEFINED
+            old, self._fan_vertical_mode = self.fan_vertical_mode, self._enum.FanVerticalMode.UNDEFINED
+            self._changed("fan_vertical_mode", old, self._fan_vertical_mode)
 
     @property
     def fan_horizontal_mode(self):
@@ -348,10 +559,12 @@ class HVAC:
         if fan_horizontal_mode:
             if not isinstance(fan_horizontal_mode, self._enum.FanHorizontalMode):
                 raise TypeError('must be an instance of FanHorizontalMode Enum')
-            self._fan_horizontal_mode = fan_horizontal_mode
+            old, self._fan_horizontal_mode = self.fan_horizontal_mode, fan_horizontal_mode
+            self._changed("fan_horizontal_mode", old, fan_horizontal_mode)
             self.save()
         else:
-            self._fan_horizontal_mode = self._enum.FanHorizontalMode.UNDEFINED
+            old, self._fan_horizontal_mode = self.fan_horizontal_mode, self._enum.FanHorizontalMode.UNDEFINED
+            self._changed("fan_horizontal_mode", old, self._fan_horizontal_mode)
 
     @property
     def room_clean(self):
@@ -366,10 +579,137 @@ class HVAC:
         if room_clean:
             if not isinstance(room_clean, self._enum.RoomClean):
                 raise TypeError('must be an instance of RoomClean Enum')
-            self._room_clean = room_clean
+            old, self._room_clean = self.room_clean, room_clean
+            self._changed("room_clean", old, room_clean)
             self.save()
         else:
-            self._room_clean = self._enum.RoomClean.UNDEFINED
+            old, self._room_clean = self.room_clean, self._enum.RoomClean.UNDEFINED
+            self._changed("room_clean", old, self._room_clean)
+
+    def _changed(self, field, old, new):
+        if old == new or not (self._observers or self._batch is not None):
+            return
+        if self._batch is not None:
+            # only the first old value and the last new value of a field are kept
+            first = self._batch.get(field)
+            self._batch[field] = (old if first is None else first[0], new)
+            return
+        from eakon.events import create_event
+        self._dispatch((create_event(self, field, old, new),))
+
+    def _dispatch(self, events):
+        for callback in list(self._observers):
+            try:
+                callback(events)
+            except Exception:
+                logging.exception("observer {} failed".format(callback))
+
+    def subscribe(self, callback):
+        """
+        Registers a callback called on each change with a tuple of ChangeEvent (see eakon.events) : one event per
+        property set, or all the changes made in a batch
+        :param callback:
+        :return: the callback, to be passed to unsubscribe
+        """
+        self._observers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        """
+        Removes a callback registered with subscribe
+        :param callback:
+        """
+        self._observers.remove(callback)
+
+    def batch(self):
+        """
+        Context manager aggregating the changes made within it in a single notification, sent on exit :
+            with d.batch():
+                d.mode = Mode.COOL
+                d.temperature = 25
+        :return:
+        """
+        from eakon.events import Batch
+        return Batch(self)
+
+    def changes(self, maxsize=0):
+        """
+        Asynchronous iterator of the changes, to be created in the running event loop :
+            async for events in d.changes():
+                ...
+        :param maxsize: maximum number of notifications queued, 0 for unbounded
+        :return: ChangeFeed
+        """
+        from eakon.events import ChangeFeed
+        return ChangeFeed([self], maxsize=maxsize)
+
+    @property
+    def state(self) -> dict:
+        """
+        Current settings, as a dictionary of property name -> value which can be passed to the constructor
+        :return: dict
+        """
+        return {field: getattr(self, field) for field in self.capabilities.fields}
+
+    @property
+    def state_key(self) -> tuple:
+        """
+        Hashable key identifying the model and its current settings, i.e. for caching encoded waves.
+        Calibrated units (see profile) have their profile appended.
+        :return: tuple
+        """
+        key = (type(self),) + tuple(getattr(self, field) for field in self.capabilities.fields)
+        if self._profile is not None:
+            key += (self._profile,)
+        return key
+
+    def send(self, transmit):
+        """
+        Transmits the current wave, remembering the state sent (persisted along with the state)
+        :param transmit: callable receiving the wave
+        :return: whatever transmit returns
+        """
+        import time
+        key = self.state_key
+        result = transmit(self.wave)
+        self._last_sent_key = key
+        self._last_sent_time = time.time()
+        self.sends += 1
+        if self._journal is not None:
+            self._journal.append(self._last_sent_time, "last_sent", self._last_sent_dict())
+        self.save()
+        return result
+
+    def send_if_changed(self, transmit, refresh_interval: float = None) -> bool:
+        """
+        Transmits the current wave unless this very state was the last one sent, in which case neither encoding nor
+        transmission take place.
+        :param transmit: callable receiving the wave
+        :param refresh_interval: seconds after which the last state sent is sent again anyway, never when None
+        :return: True if the wave was transmitted, False if skipped
+        """
+        if self._last_sent_key is not None and self._last_sent_key == self.state_key:
+            import time
+            if refresh_interval is None or time.time() - self._last_sent_time < refresh_interval:
+                self.skipped_sends += 1
+                return False
+        self.send(transmit)
+        return True
+
+    @property
+    def last_sent(self):
+        """
+        Last state transmitted through send / send_if_changed and when (epoch seconds), or None.
+        The state of a calibrated unit also holds the name of its profile.
+        :return: (dict, float)
+        """
+        if self._last_sent_key is None:
+            return None
+        fields = self.capabilities.fields
+        state = dict(zip(fields, self._last_sent_key[1:1 + len(fields)]))
+        if len(self._last_sent_key) > 1 + len(fields):
+            state["profile"] = self._last_sent_key[-1].name
+        return state, self._last_sent_time
 
     @property
     def save_on_update(self):
@@ -401,6 +741,48 @@ class HVAC:
                 raise TypeError('must be an instance of bool')
             self._save_power_on_update = save_power_on_update
 
+    @property
+    def profile(self):
+        """
+        Get/Set the calibration profile the wave is encoded with (see eakon.calibration) : a Profile, or the name of a
+        profile registered for the model. None goes back to the default timings of the model.
+        :return: Profile
+        """
+        from eakon.calibration import default_profile
+        return self._profile or default_profile(self)
+
+    @profile.setter
+    def profile(self, value):
+        from eakon.calibration import DEFAULT, Profile, default_profile, get_profile, model_name
+        if value is None:
+            value = DEFAULT
+        if isinstance(value, str):
+            value = get_profile(self, value)
+        if not isinstance(value, Profile):
+            raise TypeError("must be an instance of Profile or a profile name")
+        if value.model != model_name(self):
+            raise ValueError("profile {} is for model {}".format(value.name, value.model))
+        old = self.profile
+        # units with the default timings keep the plain state_key
+        self._profile = None if value == default_profile(self) else value
+        self._pulse_tables = None
+        self.one_mark = self.zero_mark = value.mark
+        self.one_space = value.one_space
+        self.zero_space = value.zero_space
+        self._changed("profile", old, value)
+        self.save()
+
+    def _get_pulses(self, bits: str) -> list:
+        """
+        Pulses of a bitstring, from the lookup tables compiled for the profile
+        :param bits: string of "0" and "1"
+        :return: list of durations
+        """
+        from eakon.calibration import compile_tables, encode_bits
+        if self._pulse_tables is None:
+            self._pulse_tables = compile_tables(self.profile)
+        return encode_bits(self._pulse_tables, bits)
+
     def _get_one(self):
         return [self.one_mark, self.one_space]
 
@@ -431,43 +813,109 @@ class HVAC:
         """
         return self._get_wave()
 
+    def export(self, output_format: str):
+        """
+        returns the wave in the format of another transmitter : binary, pronto, lirc or broadlink (see eakon.export).
+        Results are cached per (state, format).
+        :param output_format:
+        :return: bytes for binary, str otherwise
+        """
+        from eakon.export import export
+        return export(self, output_format)
+
+    @property
+    def capabilities(self):
+        """
+        Precomputed and immutable capability matrix of the model
+        :return: Capabilities
+        """
+        from eakon.capabilities import get_capabilities
+        return get_capabilities(type(self), self._enum)
+
+    @classmethod
+    def state_space(cls, exclude=None, dedupe=True, **constraints):
+        """
+        Returns the space of valid states of the model, optionally constrained,
+        i.e. Daikin.state_space(power=Power.ON, mode=(Mode.COOL, Mode.HEAT), exclude={"fan_power": "QUIET"})
+        :param exclude: dict of field -> value(s) to leave out
+        :param dedupe: when set, fields having no effect in a mode are set to None instead of being enumerated
+        :param constraints: field -> value (fixed) or iterable of values (restricted)
+        :return: StateSpace
+        """
+        from eakon.states import StateSpace
+        return StateSpace(cls, exclude=exclude, dedupe=dedupe, **constraints)
+
+    @classmethod
+    def iter_states(cls, exclude=None, dedupe=True, **constraints):
+        """
+        Lazily yields all valid states of the model as dictionaries, which can be passed to the constructor.
+        See state_space for the arguments.
+        :return: generator of dict
+        """
+        return iter(cls.state_space(exclude=exclude, dedupe=dedupe, **constraints))
+
+    @classmethod
+    def state_to_index(cls, state, exclude=None, dedupe=True, **constraints) -> int:
+        """
+        Stable ordinal index of a state (dict or instance) in the (constrained) state space of the model
+        :return: int
+        """
+        return cls.state_space(exclude=exclude, dedupe=dedupe, **constraints).state_to_index(state)
+
+    @classmethod
+    def index_to_state(cls, index, exclude=None, dedupe=True, **constraints) -> dict:
+        """
+        State at a given ordinal index of the (constrained) state space of the model
+        :return: dict
+        """
+        return cls.state_space(exclude=exclude, dedupe=dedupe, **constraints).index_to_state(index)
+
     @property
     def enums(self):
         """
         Facility dictionary for accessing the different enums for a given model
         :return: dict of _enum
         """
-        return self._enum.get_enums_dict()
+        return dict(self.capabilities.enums)
 
     @property
     def actions_options_dict(self) -> dict:
         """
-        returns a dictionary of actions:options
+        returns a dictionary of actions:options (options being a tuple)
         :return:
         """
-        hvac_actions = {}
-        for action, options in self.enums.items():
-            hvac_actions[action] = [x for x in options.__members__.keys() if x != "UNDEFINED"]
-        return hvac_actions
+        return dict(self.capabilities.options)
 
 
-def get_eakon_instance_by_model(model_name) -> HVAC:
+_registry = ModelRegistry(__available_models__)
+
+
+def get_eakon_instance_by_model(model_name, *args, **kwargs) -> HVAC:
     """
     A helper function to instantiate a new class using a model name.
+    Extra arguments are passed to the model constructor.
     :param model_name:
     :return:
     """
-    model_name = model_name.lower()
-    class_name = model_name.capitalize()
-    try:
-        module_type = import_module(name="eakon.{}".format(model_name))
-        model_class = getattr(module_type, class_name)
-        return ABC.register(type(class_name, (model_class,), {}))()
-    except (ModuleNotFoundError, TypeError) as exc:
-        logging.debug("Exception was {}".format(exc))
-        raise NotImplementedError(
-            "No module {} implementing class {} was found. Model {} is unsupported.".format(model_name, class_name,
-                                                                                            model_name))
+    return _registry.get(model_name)(*args, **kwargs)
+
+
+def get_model_class(model_name):
+    """
+    Returns the class implementing a model, without instantiating it.
+    :param model_name:
+    :return: HVAC subclass
+    """
+    return _registry.get(model_name)
+
+
+def register_model(model_name, model_class):
+    """
+    Makes a model class available by name, i.e. for models which aren't published as an entry point.
+    :param model_name:
+    :param model_class:
+    """
+    _registry.register(model_name, model_class)
 
 
 def get_available_models() -> [str]:
@@ -475,10 +923,60 @@ def get_available_models() -> [str]:
     list of models available for creating an instance
     :return:
     """
-    return __available_models__
+    return _registry.names()
+
+
+def restore_units(units, max_workers=8):
+    """
+    Restores many units at once : their json files are read and parsed in a thread pool (hitting the restore cache
+    when unchanged), then the states are applied in the calling thread, where the observers get notified.
+    Fewer files than _RESTORE_POOL_THRESHOLD, or a single worker (max_workers <= 1 or a single cpu), are read inline
+    without a pool, as parsing holds the GIL and the pool would only add its overhead.
+    Units with a journal are restored from it.
+    :param units: iterable of HVAC instances
+    :param max_workers: number of threads reading the files
+    """
+    units = list(units)
+    from_files = [unit for unit in units if unit._journal is None]
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if max_workers <= 1 or len(from_files) < _RESTORE_POOL_THRESHOLD:
+        states = [HVAC._read_state(unit) for unit in from_files]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers) as executor:
+            states = list(executor.map(HVAC._read_state, from_files))
+    for unit, items in zip(from_files, states):
+        if items is not None:
+            unit._apply_state(items, unit.json_file)
+    for unit in units:
+        if unit._journal is not None:
+            unit.restore()
+
+
+def __getattr__(name):
+    """
+    Lazily imports the model classes (i.e. eakon.Daikin) and other helpers (i.e. eakon.Fleet),
+    so that only what is requested is loaded.
+    :param name:
+    :return:
+    """
+    if name in __lazy_classes__:
+        model_class = _registry.get(__lazy_classes__[name])
+        globals()[name] = model_class
+        return model_class
+    if name in __lazy_attributes__:
+        from importlib import import_module
+        value = globals()[name] = getattr(import_module(__lazy_attributes__[name]), name)
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__lazy_classes__.keys()) | set(__lazy_attributes__.keys()))
 
 
-__all__ = ["__version__", "get_eakon_instance_by_model", "get_available_models"]
+__all__ = ["__version__", "get_eakon_instance_by_model", "get_model_class", "register_model", "get_available_models",
+           "restore_units", "Fleet"]
 
 if __name__ == '__main__':
     from pap_logger import PaPLogger
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Timing calibration profiles.
+
+Models encode their waves with the timings of their remote control. Some units only respond reliably with slightly
+different durations : a calibration profile holds the timings (mark, one/zero space, header and gap) to use instead,
+and can be assigned per instance :
+
+    register_profile("old_units", "daikin", mark=460, one_space=1300)
+    d = Daikin(profile="old_units")   # or d.profile = "old_units", d.profile = None going back to the defaults
+
+Each profile compiles its byte -> pulses lookup tables once, shared by all the units using it. The profile of a
+calibrated unit is part of its state_key, so that the wave caches keep one entry per (state, profile).
+Profiles can be kept in a json file, see load_profiles and save_profiles.
+"""
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+TIMINGS = ("mark", "one_space", "zero_space", "header_mark", "header_space", "gap")
+
+Profile = namedtuple("Profile", ("name", "model") + TIMINGS)
+Profile.__doc__ = """
+Timings of a model, in microseconds : gap is the space separating the frames (Daikin, Panasonic, Toshiba), or
+following the leader mark (Hitachi)
+"""
+PulseTables = namedtuple("PulseTables", ["bits", "bytes"])
+PulseTables.__doc__ = """
+Compiled pulses of a profile : bits maps "0" and "1" to their (mark, space), bytes holds the 16 durations of each
+byte value, most significant bit first
+"""
+
+DEFAULT = "default"
+_profiles = {}
+
+
+def model_name(model) -> str:
+    """
+    :param model: model name, class or instance
+    :return: model name, lower case
+    """
+    if isinstance(model, str):
+        return model.lower()
+    if not isinstance(model, type):
+        model = type(model)
+    return getattr(model, "_unbound_class", model).__name__.lower()
+
+
+def _model_class(model):
+    if isinstance(model, str):
+        from eakon import get_model_class
+        return get_model_class(model)
+    return model if isinstance(model, type) else type(model)
+
+
+def default_profile(model) -> Profile:
+    """
+    Profile of the timings a model is implemented with
+    :param model: model name, class or instance
+    :return: Profile
+    """
+    name = model_name(model)
+    profile = _profiles.get((name, DEFAULT))
+    if profile is None:
+        profile = _profiles[(name, DEFAULT)] = Profile(DEFAULT, name, **_model_class(model)._timings)
+    return profile
+
+
+def register_profile(name: str, model, **timings) -> Profile:
+    """
+    Registers (or replaces) a profile, units then refer to it by name
+    :param name:
+    :param model: model name, class or instance
+    :param timings: durations in microseconds (see TIMINGS), the missing ones being the default ones of the model
+    :return: Profile
+    """
+    if name == DEFAULT:
+        raise ValueError("the default profile of a model can't be replaced")
+    unknown = set(timings) - set(TIMINGS)
+    if unknown:
+        raise TypeError("unknown timings {}".format(", ".join(sorted(unknown))))
+    profile = default_profile(model)._replace(name=name, **{timing: int(round(value)) for timing, value in timings.items()})
+    if any(getattr(profile, timing) <= 0 for timing in TIMINGS):
+        raise ValueError("timings must be positive : {}".format(profile))
+    _profiles[(profile.model, name)] = profile
+    return profile
+
+
+def get_profile(model, name: str) -> Profile:
+    """
+    :param model: model name, class or instance
+    :param name:
+    :return: Profile
+    :raise KeyError: when there is no such profile
+    """
+    if name == DEFAULT:
+        return default_profile(model)
+    try:
+        return _profiles[(model_name(model), name)]
+    except KeyError:
+        raise KeyError("no profile {} for model {}".format(name, model_name(model)))
+
+
+def get_profiles(model=None) -> list:
+    """
+    Registered profiles (default ones being only listed once used)
+    :param model: model name, class or instance, all models when None
+    :return: list of Profile
+    """
+    model = None if model is None else model_name(model)
+    return [profile for (name, _), profile in sorted(_profiles.items()) if model is None or name == model]
+
+
+def load_profiles(path) -> list:
+    """
+    Registers the profiles of a json file : list of {"name": ..., "model": ..., "mark": ..., ...}
+    :param path:
+    :return: list of the Profile registered
+    """
+    import json
+    from pathlib import Path
+    loaded = []
+    for profile_dict in json.loads(Path(path).read_text()):
+        profile_dict = dict(profile_dict)
+        try:
+            loaded.append(register_profile(profile_dict.pop("name"), profile_dict.pop("model"), **profile_dict))
+        except (KeyError, TypeError, ValueError, NotImplementedError):
+            logging.exception("{} has an improperly formatted profile : {}".format(path, profile_dict))
+    return loaded
+
+
+def save_profiles(path, profiles=None):
+    """
+    Writes profiles to a json file, atomically
+    :param path:
+    :param profiles: iterable of Profile, all the registered ones (but default ones) when None
+    """
+    import json
+    from pathlib import Path
+    if profiles is None:
+        profiles = [profile for profile in get_profiles() if profile.name != DEFAULT]
+    path = Path(path)
+    tmp_file = path.with_name(path.name + ".tmp")
+    tmp_file.write_text(json.dumps([profile._asdict() for profile in profiles], indent=1))
+    tmp_file.replace(path)
+
+
+@lru_cache(maxsize=None)
+def compile_tables(profile: Profile) -> PulseTables:
+    """
+    Compiles the pulses of a profile, once
+    :param profile:
+    :return: PulseTables
+    """
+    zero, one = (profile.mark, profile.zero_space), (profile.mark, profile.one_space)
+    return PulseTables({"0": zero, "1": one},
+                       tuple(sum((one if byte >> bit & 1 else zero for bit in range(7, -1, -1)), ())
+                             for byte in range(256)))
+
+
+def encode_bits(tables: PulseTables, bits: str) -> list:
+    """
+    Pulses of a bitstring
+    :param tables: PulseTables
+    :param bits: string of "0" and "1", most significant bit first
+    :return: list of durations
+    """
+    pulses = []
+    whole = len(bits) - len(bits) % 8
+    if whole:
+        byte_pulses = tables.bytes
+        for byte in int(bits[:whole], 2).to_bytes(whole // 8, "big"):
+            pulses.extend(byte_pulses[byte])
+    for bit in bits[whole:]:
+        pulses.extend(tables.bits[bit])
+    return pulses
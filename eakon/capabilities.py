@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Capability matrix of a model : which actions and options it supports, its temperature range, and which settings are
+ignored in a given mode.
+Capabilities are computed once per model, when the model class is loaded, and are immutable.
+"""
+from types import MappingProxyType
+
+# HVAC property name of each enumeration, in the order of common_enum.get_enums_dict()
+FIELDS = MappingProxyType({
+    "power": "Power",
+    "mode": "Mode",
+    "fan_vertical_mode": "FanVerticalMode",
+    "fan_horizontal_mode": "FanHorizontalMode",
+    "wide_vanne_mode": "WideVanneMode",
+    "area_mode": "AreaMode",
+    "fan_power": "FanPower",
+    "fan_high_power": "FanHighPower",
+    "fan_long": "FanLong",
+    "room_clean": "RoomClean",
+})
+ACTIONS = MappingProxyType({action: field for field, action in FIELDS.items()})
+
+_cache = {}
+
+
+class Capabilities:
+    """
+    Immutable capability matrix of a model.
+    - enums : action -> enumeration, for the actions the model exposes
+    - options : action -> tuple of the option names (UNDEFINED excluded)
+    - temperatures : tuple of all the settable temperatures
+    - fields : property names of the settings the model implements, temperature included
+    - not_available : frozenset of the fields (property names) the model doesn't implement
+    - ignored_fields : mode name -> frozenset of the fields which have no effect in that mode
+    """
+    __slots__ = ("model", "enums", "options", "min_temp", "max_temp", "temp_step", "temperatures", "fields",
+                 "not_available", "ignored_fields", "_valid", "_temperature_set")
+
+    def __init__(self, model_class, enum):
+        """
+        Computes the capabilities of a model
+        :param model_class: HVAC subclass
+        :param enum: enumeration module of the model
+        """
+        enums = enum.get_enums_dict()
+        options = {action: tuple(name for name in options.__members__.keys() if name != "UNDEFINED")
+                   for action, options in enums.items()}
+        not_available = frozenset(field for field, action in FIELDS.items()
+                                  if "NOT_AVAILABLE" in getattr(enum, action).__members__)
+        min_temp, max_temp, temp_step = enum.TempRange.MIN.value, enum.TempRange.MAX.value, enum.TempRange.STEP.value
+        count = int(round((max_temp - min_temp) / temp_step)) + 1
+        if float(temp_step).is_integer():
+            temperatures = tuple(int(min_temp + i * temp_step) for i in range(count))
+        else:
+            temperatures = tuple(min_temp + i * temp_step for i in range(count))
+        ignored_fields = {mode: frozenset(fields)
+                          for mode, fields in getattr(model_class, "_ignored_fields_by_mode", {}).items()}
+        valid = {}
+        for action, names in options.items():
+            members = frozenset(names) | frozenset(getattr(enum, action)[name] for name in names)
+            valid[action] = valid[ACTIONS[action]] = members
+
+        init = object.__setattr__
+        init(self, "model", model_class.__name__)
+        init(self, "enums", MappingProxyType(dict(enums)))
+        init(self, "options", MappingProxyType(options))
+        init(self, "min_temp", min_temp)
+        init(self, "max_temp", max_temp)
+        init(self, "temp_step", temp_step)
+        init(self, "temperatures", temperatures)
+        init(self, "fields", tuple(ACTIONS[action] for action in enums if ACTIONS[action] not in not_available) + (
+            "temperature",))
+        init(self, "not_available", not_available)
+        init(self, "ignored_fields", MappingProxyType(ignored_fields))
+        init(self, "_valid", MappingProxyType(valid))
+        init(self, "_temperature_set", frozenset(temperatures))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Capabilities are read-only")
+
+    def __delattr__(self, item):
+        raise AttributeError("Capabilities are read-only")
+
+    def __repr__(self):
+        return "<Capabilities of {}>".format(self.model)
+
+    def is_valid(self, field: str, value) -> bool:
+        """
+        Checks whether an option is valid for an action (or property name), i.e. is_valid("Mode", "COOL").
+        :param field: action ("FanPower") or property name ("fan_power"), or "temperature"
+        :param value: option name, enumeration member, or temperature
+        :return:
+        """
+        if field == "temperature":
+            return value in self._temperature_set
+        valid = self._valid.get(field)
+        return valid is not None and value in valid
+
+    def is_relevant(self, field: str, mode) -> bool:
+        """
+        Checks whether a field has an effect on the emitted signal in a given mode,
+        i.e. Daikin ignores the temperature in FAN mode.
+        :param field: property name
+        :param mode: mode name or Mode member
+        :return:
+        """
+        ignored = self.ignored_fields.get(getattr(mode, "name", mode))
+        return ignored is None or field not in ignored
+
+    def to_dict(self) -> dict:
+        """
+        JSON serializable representation of the capabilities
+        :return: dict
+        """
+        return {
+            "model": self.model,
+            "actions": {action: list(options) for action, options in self.options.items()},
+            "temperature": {"min": self.min_temp, "max": self.max_temp, "step": self.temp_step,
+                            "values": list(self.temperatures)},
+            "not_available": sorted(self.not_available),
+            "ignored_fields": {mode: sorted(fields) for mode, fields in self.ignored_fields.items()},
+        }
+
+
+def get_capabilities(model_class, enum=None) -> Capabilities:
+    """
+    Returns the capabilities of a model, computing them on first call.
+    :param model_class: HVAC subclass
+    :param enum: enumeration module, defaults to the one the model class was declared with
+    :return: Capabilities
+    """
+    if enum is None:
+        enum = model_class._model_enum
+        if enum is None:
+            from eakon.enums import common_enum as enum
+    key = (model_class, enum)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+    capabilities = _cache[key] = Capabilities(model_class, enum)
+    return capabilities
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Command line interface.
+
+    eakon encode [--format bitstring|pulses|binary] [--jobs N] [input.jsonl]
+
+encode reads one JSON record per line, i.e. {"model": "daikin", "power": "ON", "mode": "COOL", "temperature": 25},
+(from stdin when no file is given) and writes one encoded result per record, in the input order :
+- bitstring : the bits as a line of 0 and 1,
+- pulses : the mark/space durations in microseconds as a JSON list per line,
+- binary : a record per wave in the binary format of eakon.export,
+- pronto, broadlink : a line of Pronto hex / Broadlink base64 per record,
+- lirc : a LIRC raw code block per record, named after its "id" when given.
+Records failing to encode are reported on stderr and give an empty line (or an empty binary record), so that outputs
+stay aligned with the inputs. Records are processed in bounded batches, so memory use doesn't depend on the input size.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from functools import lru_cache
+
+FORMATS = ("bitstring", "pulses", "binary", "pronto", "lirc", "broadlink")
+_BATCH_SIZE = 256
+
+
+def instance_from_record(record: dict):
+    """
+    Creates an HVAC instance from a record : the model name, and settings given by option names
+    :param record: dict, i.e. {"model": "daikin", "power": "ON", "mode": "COOL", "temperature": 25}
+    :return: HVAC
+    """
+    from eakon import get_eakon_instance_by_model
+    from eakon.capabilities import FIELDS
+    settings = dict(record)
+    settings.pop("id", None)
+    unit = get_eakon_instance_by_model(settings.pop("model"))
+    for field, value in settings.items():
+        if isinstance(value, str) and field != "temperature":
+            value = unit.capabilities.enums[FIELDS[field]][value]
+        setattr(unit, field, value)
+    return unit
+
+
+@lru_cache(maxsize=4096)
+def _encode(key: str, output_format: str) -> bytes:
+    unit = instance_from_record(json.loads(key))
+    if output_format == "bitstring":
+        return unit.bitstring.encode() + b"\n"
+    if output_format == "pulses":
+        return json.dumps(list(unit.wave), separators=(",", ":")).encode() + b"\n"
+    if output_format == "binary":
+        return unit.export("binary")
+    return unit.export(output_format).rstrip("\n").encode() + b"\n"
+
+
+def _encode_line(args) -> tuple:
+    line, output_format = args
+    try:
+        record = json.loads(line)
+        code_name = record.pop("id", None)
+        # identical commands are encoded once
+        payload = _encode(json.dumps(record, sort_keys=True), output_format)
+        if output_format == "lirc" and code_name is not None:
+            payload = payload.replace(b"name command", "name {}".format(code_name).encode(), 1)
+        return payload, None
+    except Exception as exc:
+        empty = b"\x00\x00\x00\x00" if output_format == "binary" else b"\n"
+        return empty, "{}: {}".format(type(exc).__name__, exc)
+
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        if line.strip():
+            batch.append(line)
+            if len(batch) == size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def encode(lines, output, output_format="pulses", jobs=1) -> tuple:
+    """
+    Encodes JSONL records, writing the results as they are produced
+    :param lines: iterable of JSON lines
+    :param output: binary file-like object
+    :param output_format: one of FORMATS
+    :param jobs: number of worker processes (encoding in the current process when 1)
+    :return: (number of records, number of errors)
+    """
+    if output_format not in FORMATS:
+        raise ValueError("unknown format {}".format(output_format))
+    records = errors = 0
+    pool = None
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+    try:
+        for batch in _batches(lines, _BATCH_SIZE * jobs):
+            tasks = [(line, output_format) for line in batch]
+            results = pool.map(_encode_line, tasks, chunksize=_BATCH_SIZE) if pool else map(_encode_line, tasks)
+            for payload, error in results:
+                records += 1
+                if error is not None:
+                    errors += 1
+                    logging.error("record {} : {}".format(records, error))
+                output.write(payload)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return records, errors
+
+
+def _encode_command(args):
+    start = time.perf_counter()
+    source = open(args.input, encoding="utf-8") if args.input else sys.stdin
+    try:
+        records, errors = encode(source, sys.stdout.buffer, args.format, max(1, args.jobs))
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        # output closed early, i.e. piped to head
+        sys.stderr.close()
+        return 1
+    finally:
+        if args.input:
+            source.close()
+    elapsed = time.perf_counter() - start
+    print("encoded {} records ({} errors) in {:.2f}s : {:.0f} records/s".format(
+        records, errors, elapsed, records / elapsed if elapsed else 0), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="eakon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    encode_parser = subparsers.add_parser("encode", help="encodes JSONL records to waves")
+    encode_parser.add_argument("input", nargs="?", help="JSONL file, stdin when not given")
+    encode_parser.add_argument("--format", choices=FORMATS, default="pulses")
+    encode_parser.add_argument("--jobs", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    if args.command == "encode":
+        return _encode_command(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,47 +5,46 @@ Air conditioner classes
 """
 
 import logging
-
-import bitstring
 import sys
-from bitstring import BitArray
 
-from eakon import HVAC
+from eakon import HVAC, _LazyModule
 from eakon.enums import daikin_enum
 
+bitstring = _LazyModule("bitstring")
+
 
-class Daikin(HVAC):
+class Daikin(HVAC, enum=daikin_enum):
     """
     Daikin ARC478A5
     """
+    __GAP = 25194
+    __HDR_MARK = 3495
+    __HDR_SPACE = 1746
     __MARK = 433
     __ONE_SPACE = 1288
     __ZERO_SPACE = 440
     __temp_max = 30
     __temp_min = 16
-    __init_mark = [__MARK, __ZERO_SPACE] * 5
-    __start_mark = [__MARK, 25194, 3495, 1746]
+    _timings = {"mark": __MARK, "one_space": __ONE_SPACE, "zero_space": __ZERO_SPACE, "header_mark": __HDR_MARK,
+                "header_space": __HDR_SPACE, "gap": __GAP}
 
     frame = None
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs, enum=daikin_enum)
-        self.one_mark = self.__MARK
-        self.one_space = self.__ONE_SPACE
-        self.zero_mark = self.__MARK
-        self.zero_space = self.__ZERO_SPACE
+    # the temperature is only sent in COOL and HEAT modes, horizontal sweeping isn't encoded
+    _ignored_fields_by_mode = {
+        mode.name: ("fan_horizontal_mode",) if mode in (daikin_enum.Mode.COOL, daikin_enum.Mode.HEAT) else (
+            "fan_horizontal_mode", "temperature") for mode in daikin_enum.Mode}
 
     def _get_wave(self):
-        wave = self.__init_mark.copy()
-        wave.extend(self.__start_mark)
+        profile = self.profile
+        start_mark = [profile.mark, profile.gap, profile.header_mark, profile.header_space]
+        wave = [profile.mark, profile.zero_space] * 5
+        wave.extend(start_mark)
 
-        for x in self._get_bitstring_frame1():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend(self.__start_mark)
+        wave.extend(self._get_pulses(self._get_bitstring_frame1()))
+        wave.extend(start_mark)
 
-        for x in self._get_bitstring_frame2():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        wave.extend(self._get_pulses(self._get_bitstring_frame2()))
+        wave.append(profile.mark)
 
         return wave
 
@@ -163,7 +162,7 @@ class Daikin(HVAC):
             checksum += b
         for k, b in data.items():
             b = bitstring.Bits(uint=b, length=8)
-            ba = BitArray(b)
+            ba = bitstring.BitArray(b)
             ba.reverse()
             data[k] = ba.uint
 
@@ -175,7 +174,7 @@ class Daikin(HVAC):
             logging.exception("Checksum value before reverse after masking : {}".format(checksum & 0xff))
             logging.exception("data was\r\n{}".format(pformat(data)))
             sys.exit(0)
-        csa = BitArray(cs)
+        csa = bitstring.BitArray(cs)
         csa.reverse()
         checksum = {
             "cs": csa.uint
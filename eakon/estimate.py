@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Timing estimator : derives the timings of a remote control from raw captures, as a calibration profile.
+
+The marks and the spaces of all the captures are clustered (log-scale histogram peaks, refined by a 1-D k-means) :
+- the most frequent mark is the bit mark, and the two most frequent spaces following it are the zero and one spaces,
+- the (mark, space) pairs preceding a run of bits are the headers,
+- the spaces preceding a header are the gaps.
+Each timing is then estimated from its samples, with a confidence interval of its mean.
+
+    python -m eakon.estimate captures.jsonl --model daikin --name old_units --output profiles.json
+
+Captures are json lines, either lists of durations or {"pulses": [...]} objects (as for eakon.reverse).
+"""
+import argparse
+import json
+import logging
+import sys
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+TimingEstimate = namedtuple("TimingEstimate", ["value", "low", "high", "std", "count"])
+TimingEstimate.__doc__ = """
+Estimate of a duration in microseconds : mean of the samples, confidence interval of the mean, standard deviation and
+number of samples
+"""
+
+
+def _pairs(captures):
+    """
+    :return: (marks, spaces, index of the first pair of each capture), trailing marks getting a 0 space
+    """
+    arrays = [np.asarray(capture, dtype=np.int32) for capture in captures]
+    arrays = [np.append(array, 0) if len(array) % 2 else array for array in arrays]
+    lengths = np.array([len(array) // 2 for array in arrays], dtype=np.int64)
+    pairs = np.concatenate(arrays).reshape(-1, 2) if arrays else np.empty((0, 2), dtype=np.int32)
+    return pairs[:, 0], pairs[:, 1], np.cumsum(lengths) - lengths
+
+
+def histogram_peaks(values, resolution: float = 0.02, min_share: float = 0.001,
+                    min_ratio: float = 1.25) -> np.ndarray:
+    """
+    Durations around which values gather : local maxima of their log-scale histogram
+    :param values: durations
+    :param resolution: relative width of the histogram bins
+    :param min_share: minimum share of the values a peak must hold
+    :param min_ratio: minimum ratio between two peaks, the smaller peak of closer ones being dropped (jitter making
+    several local maxima out of one duration)
+    :return: sorted array of the peak durations
+    """
+    values = values[values > 0]
+    if not len(values):
+        return np.empty(0)
+    logs = np.log(values)
+    bins = max(1, int(np.ceil((logs.max() - logs.min()) / resolution)))
+    counts, edges = np.histogram(logs, bins=bins)
+    # smoothed over 5 bins, then peaks closer than min_ratio are merged
+    smooth = np.convolve(np.pad(counts, 2), np.ones(5), mode="valid")
+    padded = np.pad(smooth, 1, constant_values=-1)
+    peaks = np.flatnonzero((padded[1:-1] > padded[:-2]) & (padded[1:-1] >= padded[2:]) &
+                           (smooth >= min_share * len(values)))
+    kept = []
+    for peak in peaks[np.argsort(smooth[peaks])[::-1]]:
+        if all(abs(edges[peak] - edges[other]) >= np.log(min_ratio) for other in kept):
+            kept.append(peak)
+    kept = np.sort(np.array(kept, dtype=np.intp))
+    return np.exp((edges[kept] + edges[kept + 1]) / 2)
+
+
+def kmeans_1d(values, centers, iterations: int = 20) -> tuple:
+    """
+    1-D k-means : on sorted centers, the clusters are intervals between the midpoints
+    :param values: array of durations
+    :param centers: initial centers
+    :param iterations: maximum number of iterations
+    :return: (centers, cluster index of each value)
+    """
+    centers = np.sort(np.asarray(centers, dtype=np.float64))
+    labels = np.zeros(len(values), dtype=np.intp)
+    for _ in range(iterations):
+        labels = np.searchsorted((centers[1:] + centers[:-1]) / 2, values)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.bincount(labels, weights=values, minlength=len(centers))
+        updated = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return centers, labels
+
+
+def _cluster(values) -> tuple:
+    """
+    :return: (centers, cluster index of each value, size of each cluster)
+    """
+    peaks = histogram_peaks(values)
+    if not len(peaks):
+        return np.empty(0), np.zeros(len(values), dtype=np.intp), np.empty(0, dtype=np.int64)
+    centers, labels = kmeans_1d(values.astype(np.float64), peaks)
+    return centers, labels, np.bincount(labels, minlength=len(centers))
+
+
+def _estimate(samples, z) -> TimingEstimate:
+    samples = np.asarray(samples, dtype=np.float64)
+    count = len(samples)
+    if not count:
+        return None
+    mean = samples.mean()
+    std = samples.std(ddof=1) if count > 1 else 0.
+    margin = z * std / np.sqrt(count)
+    return TimingEstimate(float(mean), float(mean - margin), float(mean + margin), float(std), count)
+
+
+def estimate_timings(captures, confidence: float = 0.95) -> dict:
+    """
+    Estimates the timings of a remote from its captures
+    :param captures: iterable of pulse buffers (mark/space durations in microseconds)
+    :param confidence: level of the confidence intervals
+    :return: dict of timing name (see eakon.calibration.TIMINGS) -> TimingEstimate, timings without samples (i.e.
+    gap for single frame captures) being left out
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    marks, spaces, starts = _pairs(captures)
+    if not len(marks):
+        raise ValueError("no pulses to estimate timings from")
+
+    mark_centers, mark_labels, mark_sizes = _cluster(marks)
+    data_mark = int(np.argmax(mark_sizes))
+    # trailing marks have no space
+    after_mark = (mark_labels == data_mark) & (spaces > 0)
+    space_centers, space_labels, _ = _cluster(spaces[after_mark])
+    if len(space_centers) < 2:
+        raise ValueError("spaces following the marks don't fall in two clusters")
+    # the two most frequent spaces after a mark are the bits, refined by a 2-means on them
+    bit_clusters = np.argsort(np.bincount(space_labels, minlength=len(space_centers)))[-2:]
+    in_bits = np.isin(space_labels, bit_clusters)
+    bit_centers, bit_labels = kmeans_1d(spaces[after_mark][in_bits].astype(np.float64),
+                                        space_centers[np.sort(bit_clusters)])
+    is_bit = np.zeros(len(marks), dtype=bool)
+    is_bit[np.flatnonzero(after_mark)[in_bits]] = True
+    bit_spaces = spaces[is_bit]
+
+    first = np.zeros(len(marks), dtype=bool)
+    first[starts[starts < len(marks)]] = True
+    # header : a pair which isn't a bit, followed by a bit of the same capture
+    header = np.flatnonzero(~is_bit[:-1] & is_bit[1:] & ~first[1:])
+    # gap : the space preceding a header, in the same capture
+    gap = header[~first[header]] - 1
+    gap = gap[~is_bit[gap]]
+
+    estimates = {
+        "mark": _estimate(marks[is_bit], z),
+        "zero_space": _estimate(bit_spaces[bit_labels == 0], z),
+        "one_space": _estimate(bit_spaces[bit_labels == 1], z),
+        "header_mark": _estimate(marks[header], z),
+        "header_space": _estimate(spaces[header], z),
+        "gap": _estimate(spaces[gap], z),
+    }
+    return {timing: estimate for timing, estimate in estimates.items() if estimate is not None}
+
+
+def to_profile(estimates: dict, name: str, model, register: bool = True):
+    """
+    Calibration profile of estimated timings, the timings which couldn't be estimated keeping the model defaults
+    :param estimates: dict of timing name -> TimingEstimate, as returned by estimate_timings
+    :param name: profile name
+    :param model: model name, class or instance
+    :param register: registers the profile, so that units can refer to it by name
+    :return: eakon.calibration.Profile
+    """
+    from eakon.calibration import default_profile, register_profile
+    timings = {timing: int(round(estimate.value)) for timing, estimate in estimates.items()}
+    if register:
+        return register_profile(name, model, **timings)
+    return default_profile(model)._replace(name=name, **timings)
+
+
+def report(estimates: dict, model=None) -> str:
+    """
+    Human readable table of the estimates, along with the model defaults when given
+    """
+    defaults = None
+    if model is not None:
+        from eakon.calibration import default_profile
+        defaults = default_profile(model)
+    lines = ["{:<13}{:>9}{:>20}{:>9}{:>10}{}".format("timing", "value", "interval", "std", "samples",
+                                                     "   default" if defaults else "")]
+    for timing, estimate in estimates.items():
+        lines.append("{:<13}{:>9.1f}{:>20}{:>9.1f}{:>10}{}".format(
+            timing, estimate.value, "[{:.1f}, {:.1f}]".format(estimate.low, estimate.high), estimate.std,
+            estimate.count, "{:>10}".format(getattr(defaults, timing)) if defaults else ""))
+    return "\n".join(lines)
+
+
+def load_captures(lines) -> list:
+    """
+    Reads pulse buffers from json lines : lists of durations, or {"pulses": [...]} objects
+    :param lines: iterable of str
+    :return: list of lists of durations
+    """
+    captures = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            captures.append(record["pulses"] if isinstance(record, dict) else list(record))
+        except (KeyError, TypeError, ValueError):
+            logging.error("line {} isn't a capture".format(number))
+    return captures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m eakon.estimate", description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", nargs="?", help="json lines of captures, standard input when omitted")
+    parser.add_argument("--model", help="model the profile is for, also showing its default timings")
+    parser.add_argument("--name", default="estimated", help="name of the profile")
+    parser.add_argument("--output", help="json file the profile is added to (see eakon.calibration.load_profiles)")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    args = parser.parse_args(argv)
+    if args.output and not args.model:
+        parser.error("--output requires --model")
+
+    if args.input is None:
+        captures = load_captures(sys.stdin)
+    else:
+        with open(args.input) as input_file:
+            captures = load_captures(input_file)
+    estimates = estimate_timings(captures, args.confidence)
+    print(report(estimates, args.model))
+    if args.output:
+        from pathlib import Path
+        from eakon.calibration import load_profiles, save_profiles
+        profile = to_profile(estimates, args.name, args.model, register=False)
+        profiles = load_profiles(args.output) if Path(args.output).exists() else []
+        profiles = [other for other in profiles if (other.model, other.name) != (profile.model, profile.name)]
+        save_profiles(args.output, profiles + [profile])
+        print("profile {} for {} written to {}".format(profile.name, profile.model, args.output))
+
+
+def _bench_estimate(model="daikin", captures=2000, jitter=60):
+    """
+    Estimates the timings of captures from a unit whose remote deviates from the model timings
+    """
+    from time import perf_counter
+    from eakon import get_model_class
+    from eakon.calibration import default_profile, register_profile
+    model_class = get_model_class(model)
+    defaults = default_profile(model_class)
+    actual = register_profile("_bench", model_class, mark=defaults.mark + 25, one_space=defaults.one_space - 40,
+                              header_mark=defaults.header_mark + 100)
+    space = model_class.state_space()
+    rng = np.random.default_rng(1)
+    waves = [np.array(model_class(profile=actual, **space.index_to_state(int(index))).wave)
+             for index in rng.integers(len(space), size=32)]
+    pulses = [np.maximum(1, waves[i % len(waves)] + rng.normal(0, jitter, len(waves[i % len(waves)]))).astype(int)
+              for i in range(captures)]
+    start = perf_counter()
+    estimates = estimate_timings(pulses)
+    elapsed = perf_counter() - start
+    print(report(estimates, model))
+    print("actual : {}".format(", ".join("{}={}".format(timing, getattr(actual, timing)) for timing in estimates)))
+    print("{} pulses in {:.2f}s".format(sum(len(capture) for capture in pulses), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Change events of HVAC units.
+
+Each property set which actually changes a value produces a ChangeEvent (unit, field, old, new, seq), seq being a
+monotonic sequence number shared by all units, so that events of different units can be ordered.
+Observers receive tuples of events : a single event per property set, or all the changes of a batch at once.
+"""
+import asyncio
+import itertools
+from collections import namedtuple
+
+_sequence = itertools.count(1)
+
+ChangeEvent = namedtuple("ChangeEvent", ["unit", "field", "old", "new", "seq"])
+ChangeEvent.__doc__ = """
+Change of a field of a unit, seq being a monotonic sequence number
+"""
+
+
+def create_event(unit, field, old, new) -> ChangeEvent:
+    """
+    Creates a change event, with the next sequence number
+    """
+    return ChangeEvent(unit, field, old, new, next(_sequence))
+
+
+class Batch:
+    """
+    Context manager aggregating the changes of a unit, notified in one call on exit.
+    Batches can be nested, the outermost one sending the notification.
+    """
+
+    def __init__(self, unit):
+        self.unit = unit
+        self._outer = False
+
+    def __enter__(self):
+        if self.unit._batch is None:
+            self.unit._batch = {}
+            self._outer = True
+        return self.unit
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._outer:
+            return
+        changes, self.unit._batch = self.unit._batch, None
+        events = tuple(create_event(self.unit, field, old, new) for field, (old, new) in changes.items()
+                       if old != new)
+        if events:
+            self.unit._dispatch(events)
+
+
+class ChangeFeed:
+    """
+    Asynchronous iterator of the changes of a set of units, yielding tuples of ChangeEvent.
+    Changes made from other threads are handed over to the event loop the feed was created in.
+    """
+
+    def __init__(self, units, maxsize=0):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._units = list(units)
+        self.dropped = 0
+        for unit in self._units:
+            unit.subscribe(self._on_change)
+
+    def _put(self, events):
+        try:
+            self._queue.put_nowait(events)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _on_change(self, events):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._put(events)
+        else:
+            self._loop.call_soon_threadsafe(self._put, events)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._units is None:
+            raise StopAsyncIteration
+        return await self._queue.get()
+
+    def close(self):
+        """
+        Stops listening to the units
+        """
+        if self._units is not None:
+            for unit in self._units:
+                unit.unsubscribe(self._on_change)
+            self._units = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+async def _demo_events():
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+    units = [Daikin(power=daikin_enum.Power.ON) for _ in range(3)]
+    with ChangeFeed(units) as feed:
+        units[0].temperature = 22
+        with units[1].batch():
+            units[1].mode = daikin_enum.Mode.COOL
+            units[1].temperature = 24
+            units[1].temperature = 25
+        units[2].mode = daikin_enum.Mode.AUTO  # no change
+        for _ in range(2):
+            for event in await feed.__anext__():
+                print(event.seq, units.index(event.unit), event.field, event.old, "->", event.new)
+
+
+if __name__ == '__main__':
+    asyncio.run(_demo_events())
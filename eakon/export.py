@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Conversions of the waves (mark/space durations in microseconds, as given by HVAC.wave) to the formats of other
+transmitters :
+- binary : a little-endian uint32 count, followed by count uint16 durations in microseconds, starting with a mark.
+  Durations longer than 65535us are split into 65535, 0, remainder, so that marks and spaces keep alternating.
+- pronto : Pronto hex (learned, unmodulated code), durations in carrier periods,
+- lirc : a LIRC raw_codes block (see lirc_remote for a complete lircd.conf remote),
+- broadlink : base64 of a Broadlink IR packet, durations in 2^-15s ticks.
+
+export(unit, format) caches its results per (state, format), and the wave of a state is computed once for all formats.
+Waves are converted as a whole with NumPy when it is installed, duration by duration otherwise.
+"""
+import base64
+import struct
+from array import array
+from collections import OrderedDict
+
+FORMATS = ("binary", "pronto", "lirc", "broadlink")
+_UINT16_MAX = 0xFFFF
+_BIG_ENDIAN = struct.pack("=H", 1) == struct.pack(">H", 1)
+
+_cache = OrderedDict()
+_waves = OrderedDict()
+_cache_size = 1024
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def to_binary(wave) -> bytes:
+    """
+    Packs a wave in the binary format
+    :param wave: sequence of mark/space durations in microseconds
+    :return:
+    """
+    if max(wave, default=0) > _UINT16_MAX:
+        split = []
+        for duration in wave:
+            while duration > _UINT16_MAX:
+                split.extend((_UINT16_MAX, 0))
+                duration -= _UINT16_MAX
+            split.append(duration)
+        wave = split
+    durations = array("H", wave)
+    if _BIG_ENDIAN:
+        durations.byteswap()
+    return struct.pack("<I", len(durations)) + durations.tobytes()
+
+
+def from_binary(data: bytes, offset: int = 0) -> tuple:
+    """
+    Unpacks a wave from the binary format
+    :param data:
+    :param offset: position of the record in data
+    :return: (tuple of durations, offset of the next record)
+    """
+    count, = struct.unpack_from("<I", data, offset)
+    offset += 4
+    durations = array("H")
+    durations.frombytes(data[offset:offset + 2 * count])
+    if _BIG_ENDIAN:
+        durations.byteswap()
+    return tuple(durations), offset + 2 * count
+
+
+def to_pronto(wave, frequency: int = 38000) -> str:
+    """
+    Converts a wave to Pronto hex
+    :param wave: sequence of mark/space durations in microseconds
+    :param frequency: carrier frequency in Hz
+    :return: space separated 4 digits hex words
+    """
+    # Pronto frequency words count 0.241246us units per carrier period
+    frequency_word = round(1000000 / (frequency * 0.241246))
+    period = 1000000 / frequency
+    np = _numpy()
+    if np is not None and len(wave):
+        periods = np.maximum(1, np.rint(np.asarray(wave, dtype=np.float64) / period))
+        if len(periods) % 2:
+            # the sequence is made of (mark, space) pairs : the trailing mark gets a space
+            periods = np.append(periods, periods[-1])
+        words = np.concatenate(([0, frequency_word, len(periods) // 2, 0], np.minimum(periods, _UINT16_MAX)))
+        return words.astype(">u2").tobytes().hex(" ", 2).upper()
+    periods = [max(1, round(duration / period)) for duration in wave]
+    if len(periods) % 2:
+        periods.append(periods[-1])
+    words = [0, frequency_word, len(periods) // 2, 0] + periods
+    return " ".join(["{:04X}".format(min(word, _UINT16_MAX)) for word in words])
+
+
+def to_lirc(wave, name: str = "command", per_line: int = 6) -> str:
+    """
+    Converts a wave to a LIRC raw code block, to be put in the raw_codes section of a remote
+    :param wave: sequence of mark/space durations in microseconds
+    :param name: name of the code
+    :param per_line: number of durations on each line
+    :return:
+    """
+    durations = list(wave)
+    if len(durations) % 2 == 0:
+        # LIRC raw codes end with a pulse, the gap comes from the remote definition
+        durations.pop()
+    lines = ["    name {}".format(name)]
+    # a line is formatted at once
+    line_format = "      " + " ".join(["{:>6}"] * per_line)
+    whole = len(durations) - len(durations) % per_line
+    lines.extend([line_format.format(*durations[i:i + per_line]) for i in range(0, whole, per_line)])
+    if whole < len(durations):
+        lines.append("      " + " ".join(["{:>6}"] * (len(durations) - whole)).format(*durations[whole:]))
+    return "\n".join(lines) + "\n"
+
+
+def lirc_remote(codes: dict, name: str = "eakon", frequency: int = 38000, gap: int = 100000) -> str:
+    """
+    Builds a complete lircd.conf remote with raw codes
+    :param codes: dict of code name -> wave
+    :param name: remote name
+    :param frequency: carrier frequency in Hz
+    :param gap: gap between codes in microseconds
+    :return:
+    """
+    blocks = "".join([to_lirc(wave, code_name) for code_name, wave in codes.items()])
+    return ("begin remote\n  name  {}\n  flags RAW_CODES\n  eps   30\n  aeps  100\n  frequency {}\n  gap   {}\n"
+            "  begin raw_codes\n{}  end raw_codes\nend remote\n").format(name, frequency, gap, blocks)
+
+
+def to_broadlink(wave, repeat: int = 0) -> str:
+    """
+    Converts a wave to a base64 Broadlink IR packet
+    :param wave: sequence of mark/space durations in microseconds
+    :param repeat: number of repetitions
+    :return:
+    """
+    np = _numpy()
+    if np is not None:
+        ticks = np.asarray(wave, dtype=np.int64) * 269 // 8192
+        # durations of 256 ticks or more take 3 bytes : 0, then the ticks in big endian. All the durations get 3
+        # bytes, the last 2 being kept for the long ones only.
+        long = ticks >= 256
+        clipped = np.minimum(ticks, _UINT16_MAX)
+        columns = np.empty((len(ticks), 3), dtype=np.uint8)
+        columns[:, 0] = np.where(long, 0, ticks)
+        columns[:, 1] = clipped >> 8
+        columns[:, 2] = clipped & 0xFF
+        keep = np.empty((len(ticks), 3), dtype=bool)
+        keep[:, 0] = True
+        keep[:, 1] = keep[:, 2] = long
+        data = bytearray(columns[keep].tobytes())
+    else:
+        data = bytearray()
+        for duration in wave:
+            ticks = duration * 269 // 8192
+            if ticks < 256:
+                data.append(ticks)
+            else:
+                data.append(0)
+                data += min(ticks, _UINT16_MAX).to_bytes(2, "big")
+    packet = bytearray((0x26, repeat)) + len(data).to_bytes(2, "little") + data + bytearray((0x0D, 0x05))
+    # packets are sent in 16 bytes blocks, after a 4 bytes header
+    remainder = (len(packet) + 4) % 16
+    if remainder:
+        packet += bytearray(16 - remainder)
+    return base64.b64encode(bytes(packet)).decode("ascii")
+
+
+_CONVERTERS = {"binary": to_binary, "pronto": to_pronto, "lirc": to_lirc, "broadlink": to_broadlink}
+
+
+def _lru_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_set(cache, key, value):
+    cache[key] = value
+    if len(cache) > _cache_size:
+        cache.popitem(last=False)
+
+
+def export(unit, output_format: str):
+    """
+    Exports the wave of a unit in its current state
+    :param unit: HVAC instance
+    :param output_format: one of FORMATS
+    :return: bytes for binary, str otherwise
+    """
+    converter = _CONVERTERS.get(output_format)
+    if converter is None:
+        raise ValueError("unknown format {}, expected one of {}".format(output_format, ", ".join(FORMATS)))
+    state_key = unit.state_key
+    key = (state_key, output_format)
+    result = _lru_get(_cache, key)
+    if result is None:
+        wave = _lru_get(_waves, state_key)
+        if wave is None:
+            wave = tuple(unit.wave)
+            _lru_set(_waves, state_key, wave)
+        result = converter(wave)
+        _lru_set(_cache, key, result)
+    return result
+
+
+def cache_clear():
+    """
+    Empties the export caches
+    """
+    _cache.clear()
+    _waves.clear()
+
+
+def _bench_export(repeat=1000):
+    from time import perf_counter
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+    unit = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=25)
+    wave = unit.wave
+    for output_format in FORMATS:
+        # first conversion excluded, as it may import NumPy
+        _CONVERTERS[output_format](wave)
+        start = perf_counter()
+        for _ in range(repeat // 10):
+            _CONVERTERS[output_format](wave)
+        convert = (perf_counter() - start) / (repeat // 10)
+        start = perf_counter()
+        for _ in range(repeat):
+            export(unit, output_format)
+        cached = (perf_counter() - start) / repeat
+        print("{:<10} conversion {:8.1f} us, cached export {:6.2f} us".format(output_format, convert * 1e6,
+                                                                             cached * 1e6))
+
+
+if __name__ == '__main__':
+    _bench_export()
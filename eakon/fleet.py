@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+A fleet of air conditioner units, identified by id, to which group commands can be applied.
+
+Units sharing the same model and settings emit the same wave : a group command encodes each distinct
+(model, state) pair only once, and all the targeted units share the resulting (immutable) wave.
+"""
+import logging
+from collections import OrderedDict, namedtuple
+from typing import Union
+
+from eakon import HVAC, get_eakon_instance_by_model
+
+UnitResult = namedtuple("UnitResult", ["unit_id", "wave", "error"])
+UnitResult.__doc__ = """
+Outcome of a command for one unit : the wave to emit (shared between units in the same state), or the error raised
+"""
+
+
+class Fleet:
+    """
+    Holds many HVAC units, and applies settings to all or part of them at once.
+    """
+
+    def __init__(self, json_file=None, cache_size=256):
+        self._units = OrderedDict()
+        self._models = {}
+        self._groups = {}
+        self._waves = OrderedDict()
+        self._cache_size = cache_size
+        self._json_file = None
+        self.encodes = 0
+        if json_file is not None:
+            self.json_file = json_file
+
+    def add(self, unit_id: str, model: Union[str, HVAC], **settings) -> HVAC:
+        """
+        Adds a unit to the fleet
+        :param unit_id:
+        :param model: model name (see get_available_models) or an HVAC instance
+        :param settings: initial settings passed to the model constructor
+        :return: the unit
+        """
+        if unit_id in self._units:
+            raise KeyError("unit {} already exists".format(unit_id))
+        if isinstance(model, HVAC):
+            unit = model
+            model = type(unit).__name__.lower()
+        else:
+            unit = get_eakon_instance_by_model(model, **settings)
+        self._units[unit_id] = unit
+        self._models[unit_id] = model.lower()
+        return unit
+
+    def remove(self, unit_id: str) -> HVAC:
+        """
+        Removes a unit from the fleet (and from the groups it belongs to)
+        :param unit_id:
+        :return: the unit
+        """
+        unit = self._units.pop(unit_id)
+        self._models.pop(unit_id)
+        for members in self._groups.values():
+            members.pop(unit_id, None)
+        return unit
+
+    def group(self, name: str, unit_ids=None) -> frozenset:
+        """
+        Get/Set the unit ids of a group
+        :param name:
+        :param unit_ids: when given, (re)defines the group
+        :return: frozenset of unit ids
+        """
+        if unit_ids is not None:
+            missing = set(unit_ids) - set(self._units)
+            if missing:
+                raise KeyError("unknown units {}".format(", ".join(sorted(missing))))
+            # members are kept in insertion order, the order the commands are applied in
+            self._groups[name] = OrderedDict.fromkeys(unit_ids)
+        return frozenset(self._groups[name])
+
+    def model(self, unit_id: str) -> str:
+        """
+        model name of a unit
+        :param unit_id:
+        :return:
+        """
+        return self._models[unit_id]
+
+    def __getitem__(self, unit_id: str) -> HVAC:
+        return self._units[unit_id]
+
+    def __contains__(self, unit_id):
+        return unit_id in self._units
+
+    def __iter__(self):
+        return iter(self._units)
+
+    def __len__(self):
+        return len(self._units)
+
+    def _targets(self, targets) -> list:
+        if targets is None:
+            return list(self._units)
+        if isinstance(targets, str):
+            targets = list(self._groups[targets]) if targets in self._groups else [targets]
+        unit_ids = []
+        for target in targets:
+            unit_ids.extend(self._groups[target] if target in self._groups else [target])
+        return list(OrderedDict.fromkeys(unit_ids))
+
+    @staticmethod
+    def _resolve(unit: HVAC, field: str, value):
+        from eakon.capabilities import FIELDS
+        if field not in unit.capabilities.fields:
+            raise ValueError("{} isn't a setting of {}".format(field, unit.capabilities.model))
+        if isinstance(value, str) and field != "temperature":
+            return unit.capabilities.enums[FIELDS[field]][value]
+        if field in FIELDS and not unit.capabilities.is_valid(field, value):
+            raise ValueError("{} isn't a valid {} for {}".format(value, field, unit.capabilities.model))
+        return value
+
+    def apply(self, targets=None, persist=True, **settings) -> dict:
+        """
+        Applies settings to a set of units, and returns the wave each of them has to emit.
+        Settings are given as enumeration members or as option names (i.e. mode="COOL"), the latter allowing to
+        address units of different models at once. Only the fields of the unit capabilities can be set.
+        Each distinct (model, state) is encoded once, and the units are persisted in one batch.
+        :param targets: unit id, group name, or iterable of those. All units when None.
+        :param persist: when unset, saving is left to the caller (i.e. to do it asynchronously)
+        :param settings: property name -> value
+        :return: dict of unit id -> UnitResult
+        """
+        results = OrderedDict()
+        updated = []
+        for unit_id in self._targets(targets):
+            unit = self._units.get(unit_id)
+            if unit is None:
+                results[unit_id] = UnitResult(unit_id, None, KeyError("unknown unit {}".format(unit_id)))
+                continue
+            try:
+                # resolved and checked before being set, so that an invalid setting leaves the unit untouched
+                values = [(field, self._resolve(unit, field, value)) for field, value in settings.items()]
+            except (KeyError, ValueError) as exc:
+                results[unit_id] = UnitResult(unit_id, None, exc)
+                continue
+            save_on_update, unit.save_on_update = unit.save_on_update, False
+            state = unit.state
+            try:
+                # observers get the changes of the unit in one notification
+                with unit.batch():
+                    try:
+                        for field, value in values:
+                            setattr(unit, field, value)
+                    except Exception:
+                        # the settings are applied all or none
+                        for field, value in state.items():
+                            setattr(unit, field, value)
+                        raise
+            except (TypeError, ValueError, AttributeError) as exc:
+                results[unit_id] = UnitResult(unit_id, None, exc)
+                continue
+            finally:
+                unit.save_on_update = save_on_update
+            updated.append(unit_id)
+            results[unit_id] = None
+
+        for unit_id in updated:
+            try:
+                results[unit_id] = UnitResult(unit_id, self.wave(unit_id), None)
+            except Exception as exc:
+                logging.exception("failed to encode the wave of unit {}".format(unit_id))
+                results[unit_id] = UnitResult(unit_id, None, exc)
+        if persist:
+            self.persist(updated)
+        return results
+
+    def wave(self, unit_id: str) -> tuple:
+        """
+        Wave of a unit in its current state, shared with the other units in the same state
+        :param unit_id:
+        :return: tuple of pulse durations
+        """
+        unit = self._units[unit_id]
+        key = unit.state_key
+        wave = self._waves.get(key)
+        if wave is None:
+            wave = self._waves[key] = tuple(unit.wave)
+            self.encodes += 1
+            if len(self._waves) > self._cache_size:
+                self._waves.popitem(last=False)
+        else:
+            self._waves.move_to_end(key)
+        return wave
+
+    def persist(self, unit_ids):
+        """
+        Saves units : the whole fleet in a single write if it has a json file, else each unit on its own
+        :param unit_ids:
+        """
+        if not unit_ids:
+            return
+        if self._json_file is not None:
+            self.save()
+        else:
+            for unit_id in unit_ids:
+                self._units[unit_id].save()
+
+    def to_dict(self) -> dict:
+        """
+        Stores the state of all units in a dictionary
+        :return: dict of unit id -> {"model": ..., "state": ...}
+        """
+        return {unit_id: {"model": self._models[unit_id], "state": unit.to_dict()}
+                for unit_id, unit in self._units.items()}
+
+    @property
+    def json_file(self):
+        return self._json_file
+
+    @json_file.setter
+    def json_file(self, value):
+        from pathlib import Path
+        _json_file = Path(value)
+        _json_file.parent.mkdir(parents=True, exist_ok=True)
+        self._json_file = _json_file
+
+    def save(self, fleet_dict=None):
+        """
+        Saves the state of all units in the fleet json file, in a single write
+        :param fleet_dict: snapshot to write (see to_dict), taken now when None
+        """
+        import json
+        try:
+            tmp_file = self._json_file.with_name(self._json_file.name + ".tmp")
+            tmp_file.write_text(json.dumps(self.to_dict() if fleet_dict is None else fleet_dict))
+            tmp_file.replace(self._json_file)
+            logging.info("save fleet state to {}".format(self._json_file))
+        except IOError:
+            logging.exception("failed to save {}".format(self._json_file))
+
+    def restore(self):
+        """
+        Restores the units from the fleet json file, creating the ones which don't exist yet
+        """
+        import json
+        try:
+            if not self._json_file.exists():
+                logging.warning("failed to load from {} : file doesn't exists.".format(self._json_file))
+                return
+            for unit_id, unit_dict in json.loads(self._json_file.read_text()).items():
+                if unit_id not in self._units:
+                    self.add(unit_id, unit_dict["model"])
+                self._units[unit_id].load_dict(unit_dict["state"], source=self._json_file)
+        except IOError:
+            logging.exception("failed to load from {}".format(self._json_file))
+
+
+def _bench_fleet(units=1000):
+    from time import perf_counter
+    fleet = Fleet()
+    for i in range(units):
+        fleet.add("unit{}".format(i), ("daikin", "panasonic", "toshiba", "hitachi")[i % 4])
+    for temperature in (20, 21, 22):
+        start = perf_counter()
+        results = fleet.apply(power="ON", mode="COOL", temperature=temperature)
+        elapsed = perf_counter() - start
+        errors = [r for r in results.values() if r.error]
+        print("{} units, {} encodes, {} errors : {:.1f} ms".format(len(results), fleet.encodes, len(errors),
+                                                                    elapsed * 1000))
+
+
+if __name__ == '__main__':
+    _bench_fleet()
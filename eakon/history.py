@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Compact history of the states of units, in fixed capacity ring buffers.
+
+Each record holds a timestamp, the index of the unit and its packed state (see eakon.packing : an ordinal per field
+plus the temperature, 12 bytes), in columns, so that thousands of units can be recorded at high frequency :
+- StateHistory records the transitions of one unit,
+- FleetHistory records the transitions of all the units of a fleet in a shared buffer.
+When full, the oldest records are overwritten. Records are kept in time order, range queries are binary searches.
+Columns can be exported to NumPy arrays (numpy being only needed for that export).
+"""
+import time
+from array import array
+
+from eakon.packing import FIELD_ORDER, NO_TEMPERATURE, STATE, get_codec
+
+_RECORD_SIZE = STATE.size
+
+
+class StateHistory:
+    """
+    Ring buffer of timestamped states
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._units = array("H", bytes(2 * capacity))
+        self._states = bytearray(_RECORD_SIZE * capacity)
+        self._head = 0
+        self._count = 0
+        self._models = []
+        self._unit_ids = []
+        self._unit_index = {}
+        self._subscriptions = []
+        self.overwritten = 0
+
+    def __len__(self):
+        return self._count
+
+    # --- recording ---
+
+    def _register(self, unit_id, unit) -> int:
+        index = self._unit_index.get(unit_id)
+        if index is None:
+            if len(self._unit_ids) > 0xFFFF:
+                raise OverflowError("too many units")
+            index = self._unit_index[unit_id] = len(self._unit_ids)
+            self._unit_ids.append(unit_id)
+            self._models.append(getattr(unit, "_unbound_class", type(unit)))
+        return index
+
+    def attach(self, unit, unit_id=None):
+        """
+        Records the current state of a unit, then each of its transitions
+        :param unit: HVAC instance
+        :param unit_id: identifier of the unit in the history
+        """
+        index = self._register(unit_id, unit)
+        codec = get_codec(self._models[index])
+
+        def on_change(events):
+            self._append(time.time(), index, codec.values(unit))
+
+        self._append(time.time(), index, codec.values(unit))
+        self._subscriptions.append((unit, unit.subscribe(on_change)))
+
+    def detach(self):
+        """
+        Stops recording
+        """
+        for unit, callback in self._subscriptions:
+            unit.unsubscribe(callback)
+        self._subscriptions = []
+
+    def record(self, unit, unit_id=None, timestamp: float = None):
+        """
+        Records the current state of a unit
+        :param unit: HVAC instance
+        :param unit_id: identifier of the unit in the history
+        :param timestamp: time.time() when None
+        """
+        index = self._register(unit_id, unit)
+        self._append(time.time() if timestamp is None else timestamp, index,
+                     get_codec(self._models[index]).values(unit))
+
+    def _append(self, timestamp, index, values):
+        position = self._head
+        if self._count and timestamp < self._times[(position - 1) % self.capacity]:
+            # keeps the records in time order, for the binary searches
+            timestamp = self._times[(position - 1) % self.capacity]
+        self._times[position] = timestamp
+        self._units[position] = index
+        STATE.pack_into(self._states, position * _RECORD_SIZE, *values)
+        self._head = (position + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self.overwritten += 1
+
+    # --- queries ---
+
+    def _position(self, i) -> int:
+        return (self._head - self._count + i) % self.capacity
+
+    def _bisect(self, timestamp, right=True) -> int:
+        # first record after timestamp (or at timestamp when not right)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            value = self._times[self._position(middle)]
+            if value < timestamp or (right and value == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _record(self, i) -> tuple:
+        position = self._position(i)
+        index = self._units[position]
+        values = STATE.unpack_from(self._states, position * _RECORD_SIZE)
+        return self._times[position], self._unit_ids[index], get_codec(self._models[index]).state(values)
+
+    def range(self, start: float = None, end: float = None, unit_id=None) -> list:
+        """
+        Records in a time range
+        :param start: included, from the oldest record when None
+        :param end: excluded, up to the last record when None
+        :param unit_id: only the records of that unit when given
+        :return: list of (timestamp, unit id, state dict)
+        """
+        first = 0 if start is None else self._bisect(start, right=False)
+        last = self._count if end is None else self._bisect(end, right=False)
+        index = None if unit_id is None else self._unit_index.get(unit_id, -1)
+        return [self._record(i) for i in range(first, last)
+                if index is None or self._units[self._position(i)] == index]
+
+    def state_at(self, timestamp: float, unit_id=None):
+        """
+        State of a unit at a given time
+        :param timestamp:
+        :param unit_id:
+        :return: state dict, or None when the history doesn't go back that far
+        """
+        index = self._unit_index.get(unit_id)
+        if index is None:
+            return None
+        for i in range(self._bisect(timestamp) - 1, -1, -1):
+            if self._units[self._position(i)] == index:
+                return self._record(i)[2]
+        return None
+
+    def durations(self, field: str, start: float = None, end: float = None, unit_id=None) -> dict:
+        """
+        Time spent in each value of a field, i.e. durations("power") for the duty cycle
+        :param field: property name
+        :param start: beginning of the period, the first record of the unit when None
+        :param end: end of the period, now when None
+        :param unit_id:
+        :return: dict of value -> seconds
+        """
+        end = time.time() if end is None else end
+        records = self.range(None, end, unit_id)
+        totals = {}
+        for i, (timestamp, _, state) in enumerate(records):
+            following = records[i + 1][0] if i + 1 < len(records) else end
+            begin = timestamp if start is None else max(start, timestamp)
+            if following > begin:
+                value = state.get(field)
+                totals[value] = totals.get(value, 0.) + following - begin
+        return totals
+
+    # --- export ---
+
+    def to_numpy(self, unit_id=None) -> dict:
+        """
+        Exports the records as NumPy arrays, oldest first
+        :param unit_id: only the records of that unit when given
+        :return: dict of column -> array : time (float64), unit (uint16 index, see unit_ids), the ordinal of each field
+        (uint8, 255 when unset, see members) and temperature (float, NaN when unset)
+        """
+        import numpy as np
+        order = (np.arange(self._count) + self._head - self._count) % self.capacity
+        states = np.frombuffer(self._states, dtype=np.uint8).reshape(self.capacity, _RECORD_SIZE)[order]
+        columns = {"time": np.frombuffer(self._times, dtype=np.float64)[order],
+                   "unit": np.frombuffer(self._units, dtype=np.uint16)[order]}
+        for i, field in enumerate(FIELD_ORDER):
+            columns[field] = states[:, i].copy()
+        temperature = states[:, len(FIELD_ORDER):].copy().view("<i2").reshape(-1)
+        columns["temperature"] = np.where(temperature == NO_TEMPERATURE, np.nan, temperature / 10.)
+        if unit_id is not None:
+            selected = columns["unit"] == self._unit_index.get(unit_id, -1)
+            columns = {column: values[selected] for column, values in columns.items()}
+        return columns
+
+    @property
+    def unit_ids(self) -> list:
+        """
+        unit ids, in the order of their indexes
+        :return:
+        """
+        return list(self._unit_ids)
+
+    def members(self, field: str, unit_id=None) -> tuple:
+        """
+        values of a field of a unit model, indexed by the ordinals of to_numpy
+        :param field:
+        :param unit_id:
+        :return:
+        """
+        return get_codec(self._models[self._unit_index[unit_id]]).members[FIELD_ORDER.index(field)]
+
+
+class FleetHistory(StateHistory):
+    """
+    Ring buffer of the timestamped states of all the units of a fleet
+    """
+
+    def attach_fleet(self, fleet):
+        """
+        Records the current state of each unit of the fleet, then their transitions
+        :param fleet: eakon.fleet.Fleet
+        """
+        for unit_id in fleet:
+            self.attach(fleet[unit_id], unit_id)
+
+
+def _bench_history(units=1000, changes=100000):
+    import random
+    from time import perf_counter
+    from eakon.fleet import Fleet
+    fleet = Fleet()
+    for i in range(units):
+        fleet.add("unit{}".format(i), ("daikin", "toshiba")[i % 2], )
+    fleet.apply(power="ON", mode="COOL", temperature=25)
+    history = FleetHistory(capacity=changes)
+    history.attach_fleet(fleet)
+    unit_ids = list(fleet)
+    start = perf_counter()
+    for i in range(changes):
+        fleet[random.choice(unit_ids)].temperature = random.randint(20, 28)
+    elapsed = perf_counter() - start
+    print("{} changes : {:.1f} us per recorded change, {} KiB".format(
+        changes, elapsed / changes * 1e6, (len(history._states) + 10 * history.capacity) // 1024))
+    now = time.time()
+    start = perf_counter()
+    records = history.range(now - 0.01, now + 1)
+    print("range query : {} records in {:.2f} ms".format(len(records), (perf_counter() - start) * 1000))
+    try:
+        start = perf_counter()
+        columns = history.to_numpy()
+        print("numpy export : {} rows in {:.2f} ms, mean setpoint {:.2f}".format(
+            len(columns["time"]), (perf_counter() - start) * 1000, columns["temperature"].mean()))
+    except ImportError:
+        print("numpy isn't installed")
+
+
+if __name__ == '__main__':
+    _bench_history()
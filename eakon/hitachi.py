@@ -5,13 +5,13 @@ Hitachi air conditioner classes
 """
 import logging
 
-import bitstring
-
-from eakon import HVAC
+from eakon import HVAC, _LazyModule
 from eakon.enums import hitachi_enum
 
+bitstring = _LazyModule("bitstring")
+
 
-class Hitachi(HVAC):
+class Hitachi(HVAC, enum=hitachi_enum):
     # TODO : implement at least fan power and vertical mode
     """
     Hitachi SP-RC4
@@ -25,23 +25,21 @@ class Hitachi(HVAC):
     __ZERO_SPACE = 410
     __temp_max = 32
     __temp_min = 16
-    __mark = [__HDR_FIRST_MARK, __HDR_FIRST_SPACE, __HDR_SECOND_MARK, __HDR_SECOND_SPACE]
+    # the leader mark is followed by the gap, then by the header
+    leader_mark = __HDR_FIRST_MARK
+    _timings = {"mark": __MARK, "one_space": __ONE_SPACE, "zero_space": __ZERO_SPACE,
+                "header_mark": __HDR_SECOND_MARK, "header_space": __HDR_SECOND_SPACE, "gap": __HDR_FIRST_SPACE}
 
     frame = None
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs, enum=hitachi_enum)
-        self.one_mark = self.__MARK
-        self.one_space = self.__ONE_SPACE
-        self.zero_mark = self.__MARK
-        self.zero_space = self.__ZERO_SPACE
+    # fan settings aren't encoded yet (see TODO above)
+    _ignored_fields_by_mode = {mode.name: ("fan_vertical_mode", "fan_power") for mode in hitachi_enum.Mode}
 
     def _get_wave(self):
 
-        wave = self.__mark.copy()
-        for x in self._get_bitstring():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        profile = self.profile
+        wave = [self.leader_mark, profile.gap, profile.header_mark, profile.header_space]
+        wave.extend(self._get_pulses(self._get_bitstring()))
+        wave.append(profile.mark)
         return wave
 
     def _get_bitstring(self):
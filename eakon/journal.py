@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Append-only journal of the state changes of a unit, an alternative to rewriting the json file on every change.
+
+Files are organized in generations, <path>.<generation>.snapshot holding the whole state when the generation started
+and <path>.<generation>.log the changes made since, one JSON record [time, field, value] per line : the settings, the
+calibration profile and the last state sent (see HVAC.send).
+Each record is written to the OS as it is appended (the log is line buffered), so that it survives a crash of the
+process. Syncing to the disk (fsync) is batched, a timer enforcing fsync_interval, and the log is compacted into a
+new snapshot every compact_every records. Restoring loads the last snapshot and replays its log (a record torn by a crash is ignored).
+The last keep generations are kept, so that the state at any moment they cover can be recovered (see unit_at).
+
+    d = Daikin()
+    d.journal = "/var/lib/eakon/living"
+    d.restore()
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from eakon.calibration import Profile
+
+
+def _format_value(value):
+    if value is None or isinstance(value, (int, float, dict)):
+        return value
+    if isinstance(value, Profile):
+        return value.name
+    return "{}.{}".format(type(value).__name__, value.name)
+
+
+class Journal:
+    """
+    Journal of the changes of one unit
+    """
+
+    def __init__(self, path, fsync_every: int = 64, fsync_interval: float = 1.0, compact_every: int = 1000,
+                 keep: int = 8):
+        """
+        :param path: base path of the journal files
+        :param fsync_every: number of records after which the log is synced to the disk
+        :param fsync_interval: maximum time in seconds between an append and the sync of the log
+        :param compact_every: number of records after which a new generation is started from a snapshot
+        :param keep: number of generations kept for point in time recovery
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.keep = max(1, keep)
+        self.unit = None
+        self._log = None
+        self._generation = None
+        self._records = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._replaying = False
+        self._lock = threading.RLock()
+        self._timer = None
+        self.appends = 0
+        self.syncs = 0
+        self.compactions = 0
+
+    # --- files ---
+
+    def _file(self, generation, suffix) -> Path:
+        return self.path.with_name("{}.{:06d}.{}".format(self.path.name, generation, suffix))
+
+    def generations(self) -> list:
+        """
+        generations available on disk, oldest first
+        :return: list of int
+        """
+        generations = []
+        for snapshot in self.path.parent.glob("{}.*.snapshot".format(self.path.name)):
+            try:
+                generations.append(int(snapshot.name[len(self.path.name) + 1:].split(".")[0]))
+            except ValueError:
+                continue
+        return sorted(generations)
+
+    def _read_snapshot(self, generation) -> dict:
+        return json.loads(self._file(generation, "snapshot").read_text())
+
+    def _read_log(self, generation):
+        log_file = self._file(generation, "log")
+        if not log_file.exists():
+            return
+        with log_file.open() as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("{} : ignoring torn record {!r}".format(log_file, line))
+                    break
+                yield record
+
+    # --- attachment ---
+
+    def attach(self, unit):
+        """
+        Starts journaling the changes of a unit
+        :param unit: HVAC instance
+        """
+        if self.unit is not None:
+            self.unit.unsubscribe(self._on_change)
+        self.unit = unit
+        unit.subscribe(self._on_change)
+
+    def _on_change(self, events):
+        if self._replaying:
+            return
+        now = time.time()
+        for event in events:
+            self.append(now, event.field, event.new)
+
+    # --- writing ---
+
+    def _open(self):
+        generations = self.generations()
+        if generations:
+            self._generation = generations[-1]
+            self._records = sum(1 for _ in self._read_log(self._generation))
+            self._truncate_torn_record(self._file(self._generation, "log"))
+        else:
+            self._start_generation(0)
+        self._log = self._file(self._generation, "log").open("a", buffering=1)
+
+    @staticmethod
+    def _truncate_torn_record(log_file):
+        # a record torn by a crash would otherwise be merged with the next one
+        if not log_file.exists():
+            return
+        with log_file.open("rb+") as log:
+            data = log.read()
+            if data and not data.endswith(b"\n"):
+                log.truncate(data.rfind(b"\n") + 1)
+
+    def _start_generation(self, generation):
+        snapshot = {"time": time.time(), "state": self.unit.to_dict()}
+        snapshot_file = self._file(generation, "snapshot")
+        tmp_file = snapshot_file.with_name(snapshot_file.name + ".tmp")
+        with tmp_file.open("w") as tmp:
+            tmp.write(json.dumps(snapshot))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        tmp_file.replace(snapshot_file)
+        self._generation = generation
+        self._records = 0
+
+    def append(self, timestamp: float, field: str, value):
+        """
+        Appends a change record
+        :param timestamp: time of the change (time.time())
+        :param field: property name
+        :param value: new value
+        """
+        with self._lock:
+            if self._log is None:
+                self._open()
+            self._log.write(json.dumps([timestamp, field, _format_value(value)], separators=(",", ":")) + "\n")
+            self.appends += 1
+            self._records += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self._sync_timer)
+                self._timer.daemon = True
+                self._timer.start()
+            if self._records >= self.compact_every:
+                self.compact()
+
+    def _sync_timer(self):
+        with self._lock:
+            self._timer = None
+            try:
+                self.sync()
+            except (OSError, ValueError):
+                logging.exception("failed to sync {}".format(self.path))
+
+    def sync(self):
+        """
+        Flushes the pending records to the disk
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._log is not None and self._unsynced:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self.syncs += 1
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def compact(self):
+        """
+        Starts a new generation from a snapshot of the current state, and drops the generations beyond keep
+        """
+        with self._lock:
+            self.sync()
+            if self._log is not None:
+                self._log.close()
+            self._start_generation(0 if self._generation is None else self._generation + 1)
+            self._log = self._file(self._generation, "log").open("a", buffering=1)
+            self.compactions += 1
+            for generation in self.generations()[:-self.keep]:
+                for suffix in ("snapshot", "log"):
+                    try:
+                        self._file(generation, suffix).unlink()
+                    except FileNotFoundError:
+                        pass
+
+    def close(self):
+        """
+        Syncs and closes the log
+        """
+        with self._lock:
+            self.sync()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    # --- reading ---
+
+    def _replay(self, unit, until=None) -> bool:
+        generations = self.generations()
+        if until is not None:
+            generations = [generation for generation in generations
+                           if self._read_snapshot(generation)["time"] <= until]
+        if not generations:
+            return False
+        generation = generations[-1]
+        self._replaying = True
+        try:
+            unit.load_dict(self._read_snapshot(generation)["state"], source=self._file(generation, "snapshot"))
+            for timestamp, field, value in self._read_log(generation):
+                if until is not None and timestamp > until:
+                    break
+                unit.load_dict({field: value}, source=self._file(generation, "log"))
+        finally:
+            self._replaying = False
+        return True
+
+    def restore(self, unit=None) -> bool:
+        """
+        Restores the last state : the last snapshot, and the changes logged after it
+        :param unit: unit to restore, the attached one when None
+        :return: False when the journal is empty
+        """
+        unit = self.unit if unit is None else unit
+        self.sync()
+        return self._replay(unit)
+
+    def unit_at(self, timestamp: float):
+        """
+        Point in time recovery
+        :param timestamp: time.time() value
+        :return: new instance of the unit model, in the state it had at that time, or None if the journal doesn't
+        go back that far
+        """
+        self.sync()
+        unit = type(self.unit)()
+        return unit if self._replay(unit, until=timestamp) else None
+
+
+def _bench_journal(changes=10000):
+    import tempfile
+    from time import perf_counter
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+    with tempfile.TemporaryDirectory() as directory:
+        unit = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=20)
+        unit.json_file = Path(directory) / "unit.json"
+        unit.save_on_update = True
+        start = perf_counter()
+        for i in range(changes // 10):
+            unit.temperature = 20 + i % 10
+        print("json file : {:.1f} us per change".format((perf_counter() - start) / (changes // 10) * 1e6))
+        unit.save_on_update = False
+
+        journal = Journal(Path(directory) / "unit")
+        journal.attach(unit)
+        start = perf_counter()
+        for i in range(changes):
+            unit.temperature = 21 + i % 10
+        middle = time.time()
+        journal.close()
+        print("journal : {:.1f} us per change, {} syncs, {} compactions".format(
+            (perf_counter() - start) / changes * 1e6, journal.syncs, journal.compactions))
+        restored = Daikin()
+        start = perf_counter()
+        journal.restore(restored)
+        print("restore : {:.1f} ms, temperature {} (expected {})".format((perf_counter() - start) * 1000,
+                                                                         restored.temperature, unit.temperature))
+        print("state at {} : temperature {}".format(middle, journal.unit_at(middle).temperature))
+
+
+if __name__ == '__main__':
+    _bench_journal()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Carrier modulation of the waves, for transmitters driving the IR LED themselves (GPIO bit-banging).
+
+A wave only holds the envelope of the signal (mark/space durations). During a mark, the LED blinks at the carrier
+frequency (38kHz for all the supported models) : each mark becomes a number of on/off cycles, and spaces keep the LED
+off.
+
+    modulator = Modulator(frequency=38000, duty_cycle=0.5)
+    modulator.edges(unit)             # carrier on/off durations, starting with on
+    modulator.pulses(unit, gpio=17)   # (gpio_on, gpio_off, delay) triples for pigpio wave_add_generic
+
+Expansion is vectorized with NumPy, and results are cached per unit state (or per wave content) : the returned
+arrays are shared, hence read-only.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from eakon import HVAC
+
+
+class Modulator:
+    """
+    Modulates waves on a carrier of a given frequency and duty cycle
+    """
+
+    def __init__(self, frequency: int = 38000, duty_cycle: float = 0.5, cache_size: int = 256):
+        """
+        :param frequency: carrier frequency in Hz
+        :param duty_cycle: fraction of a carrier period the LED is on
+        :param cache_size: number of modulated waves kept
+        """
+        if not 0 < duty_cycle < 1:
+            raise ValueError("duty cycle must be between 0 and 1, got {}".format(duty_cycle))
+        self.frequency = frequency
+        self.duty_cycle = duty_cycle
+        self.period = 1e6 / frequency
+        self.on = max(1, int(round(self.period * duty_cycle)))
+        self.off = max(1, int(round(self.period)) - self.on)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, kind, wave, extra, expand):
+        if isinstance(wave, HVAC):
+            key = (kind, extra, wave.state_key)
+        else:
+            wave = tuple(wave)
+            key = (kind, extra, wave)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = expand(wave.wave if isinstance(wave, HVAC) else wave)
+        result.setflags(write=False)
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _cycles(self, durations):
+        """
+        :return: (number of carrier cycles of each mark, spaces)
+        """
+        return np.maximum(1, np.rint(durations[0::2] / self.period)).astype(np.int64), durations[1::2]
+
+    def _expand_edges(self, wave):
+        durations = np.asarray(wave, dtype=np.int64)
+        cycles, spaces = self._cycles(durations)
+        edges = np.empty(2 * int(cycles.sum()), dtype=np.uint32)
+        edges[0::2] = self.on
+        edges[1::2] = self.off
+        # the LED stays off from the last cycle of a mark until the next mark
+        last_off = 2 * np.cumsum(cycles) - 1
+        edges[last_off[:len(spaces)]] += spaces.astype(np.uint32)
+        return edges
+
+    def _expand_pulses(self, wave, gpio):
+        durations = np.asarray(wave, dtype=np.int64)
+        cycles, spaces = self._cycles(durations)
+        counts = np.empty(len(durations), dtype=np.int64)
+        counts[0::2] = 2 * cycles
+        counts[1::2] = 1
+        starts = np.cumsum(counts) - counts
+        # index of the "on" pulse of each carrier cycle
+        total_cycles = int(cycles.sum())
+        cycle_starts = np.repeat(starts[0::2], cycles)
+        on_index = cycle_starts + 2 * (np.arange(total_cycles) - np.repeat(np.cumsum(cycles) - cycles, cycles))
+        mask = 1 << gpio
+        pulses = np.zeros((int(counts.sum()), 3), dtype=np.uint32)
+        pulses[on_index, 0] = mask
+        pulses[on_index, 2] = self.on
+        pulses[on_index + 1, 1] = mask
+        pulses[on_index + 1, 2] = self.off
+        pulses[starts[1::2], 2] = spaces
+        return pulses
+
+    def edges(self, wave, absolute: bool = False):
+        """
+        Carrier on/off durations of a wave, starting with on
+        :param wave: sequence of mark/space durations in microseconds, or an HVAC instance (cached by state)
+        :param absolute: returns the times of the edges from the start of the wave instead
+        :return: read-only uint32 array (uint64 when absolute)
+        """
+        edges = self._cached("edges", wave, None, self._expand_edges)
+        if absolute:
+            return np.cumsum(edges, dtype=np.uint64) - edges
+        return edges
+
+    def pulses(self, wave, gpio: int):
+        """
+        pigpio pulses of a wave : rows of (gpio_on, gpio_off, delay), as passed to wave_add_generic
+        :param wave: sequence of mark/space durations in microseconds, or an HVAC instance (cached by state)
+        :param gpio: GPIO of the IR LED
+        :return: read-only uint32 array of shape (n, 3)
+        """
+        return self._cached("pulses", wave, gpio, lambda durations: self._expand_pulses(durations, gpio))
+
+    def metrics(self) -> dict:
+        """
+        :return: dict of the cache counters
+        """
+        return {"size": len(self._cache), "capacity": self._cache_size, "hits": self.hits, "misses": self.misses}
+
+
+def _bench_modulation(repeat=1000):
+    from time import perf_counter
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+
+    unit = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=25)
+    wave = unit.wave
+    modulator = Modulator()
+    for kind, modulate in (("edges", modulator.edges), ("pulses", lambda w: modulator.pulses(w, 17))):
+        start = perf_counter()
+        result = modulate(wave)
+        cold = perf_counter() - start
+        start = perf_counter()
+        for _ in range(repeat):
+            modulate(unit)
+        warm = (perf_counter() - start) / repeat
+        print("{} : {} entries, first expansion {:.3f} ms, cached by state {:.2f} us".format(
+            kind, len(result), cold * 1000, warm * 1e6))
+
+
+if __name__ == '__main__':
+    _bench_modulation()
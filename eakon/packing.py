@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Packed representation of the settings of a unit : the ordinal of each field (uint8, in the order of
+capabilities.FIELDS, UNSET when not set) followed by the temperature in tenth of degrees (int16, NO_TEMPERATURE when
+not set), 12 bytes in all.
+Used by the shared memory structures and the state history.
+"""
+import struct
+
+from eakon.capabilities import FIELDS, get_capabilities
+
+FIELD_ORDER = tuple(FIELDS)
+PRIVATE_FIELDS = tuple("_" + field for field in FIELD_ORDER)
+STATE = struct.Struct("<10Bh")
+UNSET = 255
+NO_TEMPERATURE = -32768
+
+
+class StateCodec:
+    """
+    Conversions between the settings of a model and their ordinals
+    """
+
+    def __init__(self, model_class):
+        capabilities = get_capabilities(model_class)
+        self.model_class = model_class
+        self.fields = capabilities.fields
+        self.enums = tuple(capabilities.enums.get(FIELDS[field]) for field in FIELD_ORDER)
+        self.members = tuple(tuple(enum) if enum is not None else () for enum in self.enums)
+        self.ordinals = tuple({member: i for i, member in enumerate(members)} for members in self.members)
+
+    def ordinal(self, index, value) -> int:
+        if value is None:
+            return UNSET
+        return self.ordinals[index][value]
+
+    def member(self, index, ordinal):
+        if ordinal == UNSET:
+            return None
+        return self.members[index][ordinal]
+
+    def values(self, unit) -> list:
+        """
+        Packed values of the current settings of a unit
+        :param unit: HVAC instance of the model
+        :return: list of the field ordinals and the encoded temperature
+        """
+        ordinals = self.ordinals
+        values = [UNSET if value is None else ordinals[i][value]
+                  for i, value in enumerate([getattr(unit, name) for name in PRIVATE_FIELDS])]
+        values.append(encode_temperature(unit._temperature))
+        return values
+
+    def state(self, values) -> dict:
+        """
+        Settings from packed values
+        :param values: field ordinals and encoded temperature
+        :return: dict of property name -> value, as HVAC.state
+        """
+        state = {field: self.member(i, values[i]) for i, field in enumerate(FIELD_ORDER) if field in self.fields}
+        state["temperature"] = decode_temperature(values[-1])
+        return state
+
+
+_codecs = {}
+
+
+def get_codec(model_class) -> StateCodec:
+    """
+    Codec of a model, created once
+    :param model_class: HVAC subclass
+    :return: StateCodec
+    """
+    codec = _codecs.get(model_class)
+    if codec is None:
+        codec = _codecs[model_class] = StateCodec(model_class)
+    return codec
+
+
+def encode_temperature(temperature) -> int:
+    return NO_TEMPERATURE if temperature is None else int(round(temperature * 10))
+
+
+def decode_temperature(value):
+    if value == NO_TEMPERATURE:
+        return None
+    return value // 10 if value % 10 == 0 else value / 10
+
+
+def pack_state(unit) -> bytes:
+    """
+    Packs the current settings of a unit
+    :param unit: HVAC instance
+    :return: 12 bytes
+    """
+    return STATE.pack(*get_codec(getattr(unit, "_unbound_class", type(unit))).values(unit))
@@ -4,14 +4,13 @@
 Panasonic air conditioner classes
 """
 import logging
-
-import bitstring
 import sys
-from bitstring import BitArray
 
-from eakon import HVAC
+from eakon import HVAC, _LazyModule
 from eakon.enums import panasonic_enum
 
+bitstring = _LazyModule("bitstring")
+
 
 def _convert_byte_endianness(byte: str) -> str:
     assert len(byte) == 8
@@ -25,7 +24,7 @@ def _convert_int_endianness(val: int) -> int:
     return int(_convert_byte_endianness("{:08b}".format(val)), 2)
 
 
-class Panasonic(HVAC):
+class Panasonic(HVAC, enum=panasonic_enum):
     """
     Panasonic basic remote control
     """
@@ -38,29 +37,21 @@ class Panasonic(HVAC):
     __ZERO_SPACE = 430
     __temp_max = 30
     __temp_min = 16
-    __start_mark = [__HDR_FIRST_MARK, __HDR_FIRST_SPACE]
-    __inter_frame_mark = [__MARK, __INTER_FRAME_SPACE]
+    _timings = {"mark": __MARK, "one_space": __ONE_SPACE, "zero_space": __ZERO_SPACE,
+                "header_mark": __HDR_FIRST_MARK, "header_space": __HDR_FIRST_SPACE, "gap": __INTER_FRAME_SPACE}
 
     frame = None
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs, enum=panasonic_enum)
-        self.one_mark = self.__MARK
-        self.one_space = self.__ONE_SPACE
-        self.zero_mark = self.__MARK
-        self.zero_space = self.__ZERO_SPACE
-
     def _get_wave(self):
 
-        wave = self.__start_mark.copy()
-        # for x in self._get_bitstring_frame1():
-        #     wave.extend(self._get_zero() if x == "0" else self._get_one())
-        # wave.extend(self.__inter_frame_mark)
-        # wave.extend(self.__start_mark)
+        profile = self.profile
+        wave = [profile.header_mark, profile.header_space]
+        # wave.extend(self._get_pulses(self._get_bitstring_frame1()))
+        # wave.extend([profile.mark, profile.gap])
+        # wave.extend([profile.header_mark, profile.header_space])
 
-        for x in self._get_bitstring_frame2():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        wave.extend(self._get_pulses(self._get_bitstring_frame2()))
+        wave.append(profile.mark)
         return wave
 
     def _get_bitstring(self):
@@ -164,7 +155,7 @@ class Panasonic(HVAC):
     def _reverse(data):
         for k, b in data.items():
             b = bitstring.Bits(uint=b, length=8)
-            ba = BitArray(b)
+            ba = bitstring.BitArray(b)
             ba.reverse()
             data[k] = ba.uint
 
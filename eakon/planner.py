@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Transmission planner for gateways driving several IR emitters.
+
+Given a batch of (unit, wave) commands and the units each emitter reaches, the planner assigns every command to an
+emitter and a start time so that the whole batch is delivered as early as possible :
+- a wave lasts as long as the sum of its pulses (i.e. ~600 pulses, about 0.4s for a Daikin wave),
+- an emitter sends one wave at a time,
+- two emitters reaching a common unit interfere, so they don't transmit at the same time,
+- emitters reaching disjoint sets of units transmit in parallel.
+
+Assignment follows the longest-processing-time-first heuristic, most constrained commands first.
+All times are in microseconds, relative to the start of the batch.
+"""
+import asyncio
+from collections import namedtuple
+
+PlannedCommand = namedtuple("PlannedCommand", ["unit_id", "emitter", "start", "end", "wave"])
+
+
+def wave_duration(wave) -> int:
+    """
+    Duration of a wave, in microseconds
+    :param wave: sequence of mark/space durations in microseconds
+    :return:
+    """
+    return sum(wave)
+
+
+class Plan:
+    """
+    Result of the planning : when and on which emitter each command is sent
+    """
+
+    def __init__(self, commands, unreachable):
+        self.commands = sorted(commands, key=lambda command: (command.start, str(command.emitter)))
+        self.unreachable = unreachable
+
+    @property
+    def makespan(self) -> int:
+        """
+        estimated time until the whole batch is delivered, in microseconds
+        :return:
+        """
+        return max((command.end for command in self.commands), default=0)
+
+    @property
+    def completion(self) -> dict:
+        """
+        estimated completion time of each unit command, in microseconds
+        :return: dict of unit id -> end time
+        """
+        return {command.unit_id: command.end for command in self.commands}
+
+    def by_emitter(self) -> dict:
+        """
+        commands of each emitter, in transmission order
+        :return: dict of emitter -> list of PlannedCommand
+        """
+        emitters = {}
+        for command in self.commands:
+            emitters.setdefault(command.emitter, []).append(command)
+        return emitters
+
+    async def execute(self, transmitter):
+        """
+        Runs the plan on a transmitter (see eakon.scheduler.Transmitter), following the planned start times
+        :param transmitter:
+        """
+        loop = asyncio.get_running_loop()
+        origin = loop.time()
+
+        async def _run(commands):
+            for command in commands:
+                delay = origin + command.start / 1e6 - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await transmitter.transmit(command.emitter, command.wave)
+
+        await asyncio.gather(*(_run(commands) for commands in self.by_emitter().values()))
+
+
+def plan(commands, reach: dict, gap: int = 0, interference: bool = True) -> Plan:
+    """
+    Plans the transmission of a batch of commands
+    :param commands: iterable of (unit id, wave)
+    :param reach: dict of emitter -> iterable of the unit ids it reaches
+    :param gap: minimum silence between two transmissions of an emitter (or of interfering emitters), in microseconds
+    :param interference: when set, emitters reaching a common unit never transmit at the same time
+    :return: Plan
+    """
+    reach = {emitter: frozenset(units) for emitter, units in reach.items()}
+    emitters_of = {}
+    for emitter, units in reach.items():
+        for unit_id in units:
+            emitters_of.setdefault(unit_id, []).append(emitter)
+    conflicts = {emitter: [other for other, units in reach.items()
+                           if other != emitter and interference and units & reach[emitter]]
+                 for emitter in reach}
+
+    jobs = []
+    unreachable = []
+    for unit_id, wave in commands:
+        if unit_id not in emitters_of:
+            unreachable.append(unit_id)
+        else:
+            jobs.append((unit_id, wave, wave_duration(wave)))
+    # most constrained first, then longest first
+    jobs.sort(key=lambda job: (len(emitters_of[job[0]]), -job[2]))
+
+    busy = {emitter: [] for emitter in reach}
+    free_at = {emitter: 0 for emitter in reach}
+    planned = []
+    for unit_id, wave, duration in jobs:
+        best = None
+        for emitter in emitters_of[unit_id]:
+            start = _earliest_start(free_at[emitter], duration, gap, conflicts[emitter], busy)
+            if best is None or start < best[1]:
+                best = (emitter, start)
+        emitter, start = best
+        busy[emitter].append((start, start + duration))
+        free_at[emitter] = start + duration + gap
+        planned.append(PlannedCommand(unit_id, emitter, start, start + duration, wave))
+    return Plan(planned, unreachable)
+
+
+def _earliest_start(start, duration, gap, conflicting, busy) -> int:
+    moved = True
+    while moved:
+        moved = False
+        for other in conflicting:
+            for begin, end in busy[other]:
+                if start < end + gap and begin < start + duration + gap:
+                    start = end + gap
+                    moved = True
+    return start
+
+
+def _demo_planner():
+    from eakon.enums import daikin_enum, toshiba_enum
+    from eakon.daikin import Daikin
+    from eakon.toshiba import Toshiba
+
+    daikin = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=25).wave
+    toshiba = Toshiba(power=toshiba_enum.Power.ON, mode=toshiba_enum.Mode.COOL, temperature=25).wave
+    commands = [("living", daikin), ("kitchen", toshiba), ("bedroom1", daikin), ("bedroom2", daikin),
+                ("office", toshiba)]
+    reach = {"led1": ["living", "kitchen"], "led2": ["kitchen", "bedroom1"], "led3": ["bedroom2", "office"]}
+    result = plan(commands, reach, gap=100000)
+    for command in result.commands:
+        print("{:<10}{:<6}{:>9}{:>9}".format(command.unit_id, command.emitter, command.start, command.end))
+    print("makespan : {:.3f}s".format(result.makespan / 1e6))
+
+
+if __name__ == '__main__':
+    _demo_planner()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Registry of the air conditioner models which can be instantiated by name.
+Built-in models live in the eakon package, third party models are discovered through the "eakon.models" entry point
+group, i.e. in a setup.py :
+
+    entry_points={"eakon.models": ["mitsubishi = eakon_mitsubishi:Mitsubishi"]}
+
+Model classes are only imported on first use, and resolved once.
+"""
+import logging
+
+
+class ModelRegistry:
+    """
+    Resolves model names to HVAC subclasses, caching each class once it has been loaded
+    """
+    ENTRY_POINT_GROUP = "eakon.models"
+
+    def __init__(self, builtin_models):
+        self._locations = {name: ("eakon.{}".format(name), name.capitalize()) for name in builtin_models}
+        self._classes = {}
+        self._entry_points = None
+
+    def register(self, model_name: str, model_class):
+        """
+        Registers a model class under a given name, overriding any built-in or plugin model with the same name.
+        :param model_name:
+        :param model_class: an HVAC subclass
+        """
+        from eakon import HVAC
+        if not (isinstance(model_class, type) and issubclass(model_class, HVAC)):
+            raise TypeError('must be a subclass of HVAC')
+        self._classes[model_name.lower()] = model_class
+
+    def get(self, model_name: str):
+        """
+        Returns the class implementing a model, loading it on first use.
+        :param model_name:
+        :return: HVAC subclass
+        """
+        try:
+            return self._classes[model_name]
+        except KeyError:
+            pass
+        model_name = model_name.lower()
+        if model_name not in self._classes:
+            self._classes[model_name] = self._load(model_name)
+        return self._classes[model_name]
+
+    def names(self) -> [str]:
+        """
+        list of the built-in, registered and plugin model names
+        :return:
+        """
+        names = list(self._locations)
+        names.extend(name for name in self._classes if name not in names)
+        names.extend(name for name in self._discover() if name not in names)
+        return names
+
+    def _load(self, model_name):
+        from eakon import HVAC
+        model_class = None
+        try:
+            if model_name in self._locations:
+                from importlib import import_module
+                module_name, class_name = self._locations[model_name]
+                model_class = getattr(import_module(module_name), class_name, None)
+            elif model_name in self._discover():
+                model_class = self._discover()[model_name].load()
+        except ImportError as exc:
+            logging.debug("Exception was {}".format(exc))
+        if not (isinstance(model_class, type) and issubclass(model_class, HVAC)):
+            raise NotImplementedError(
+                "No module {} implementing class {} was found. Model {} is unsupported.".format(
+                    model_name, model_name.capitalize(), model_name))
+        logging.debug("Model {} resolved to {}".format(model_name, model_class))
+        return model_class
+
+    def _discover(self) -> dict:
+        if self._entry_points is None:
+            from importlib import metadata
+            entry_points = metadata.entry_points()
+            if hasattr(entry_points, "select"):
+                group = entry_points.select(group=self.ENTRY_POINT_GROUP)
+            else:
+                group = entry_points.get(self.ENTRY_POINT_GROUP, [])
+            self._entry_points = {ep.name.lower(): ep for ep in group}
+        return self._entry_points
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Protocol reverse-engineering assistant : analyses labelled captures of an unknown remote control.
+
+Each capture is a pulse buffer (mark/space durations in microseconds, as recorded by irrp.py) along with the settings
+the remote was showing, i.e. {"pulses": [...], "labels": {"mode": "COOL", "temperature": 25}}.
+The analysis :
+- estimates the mark, zero space and one space durations, headers and gaps being frame delimiters,
+- decodes all captures to a bit matrix (one row per capture) with NumPy,
+- measures how much each bit depends on each labelled field (normalized mutual information),
+- detects constant, checksum (sum or xor of the previous bytes), complement and repeated bytes or nibbles,
+- proposes a frame layout, with the encoding of each field (offset, scale or lookup table).
+
+    python -m eakon.reverse captures.jsonl
+    python -m eakon.reverse --demo toshiba
+"""
+import argparse
+import json
+import logging
+import sys
+from collections import Counter, namedtuple
+
+import numpy as np
+
+Capture = namedtuple("Capture", ["pulses", "labels"])
+Timings = namedtuple("Timings", ["mark", "zero_space", "one_space", "threshold", "delimiter"])
+Timings.__doc__ = """
+Estimated bit timings : spaces above threshold are ones, and spaces above delimiter (or marks far from mark) delimit
+the frames
+"""
+Finding = namedtuple("Finding", ["kind", "position", "source", "detail"])
+Finding.__doc__ = """
+Byte (or nibble) explained by other ones : kind is one of constant, checksum, complement or repeat, position and
+source are byte (or nibble) indexes
+"""
+FieldSlice = namedtuple("FieldSlice", ["field", "byte", "bits", "score", "encoding", "table"])
+FieldSlice.__doc__ = """
+Bits of a byte carrying a field : bits are the value bit positions (0 being the least significant), encoding one of
+"offset N", "scale A offset B" (prefixed by "reversed " when the bits are in the reverse order), "table" (table
+being label -> code) or "partial" when the bits also depend on other fields
+"""
+
+
+def _clusters(values, ratio=1.3) -> list:
+    """
+    Splits sorted durations where two consecutive ones differ by more than ratio
+    :return: list of arrays, most populated first
+    """
+    values = np.sort(values)
+    cuts = np.flatnonzero(values[1:] > values[:-1] * ratio) + 1
+    return sorted(np.split(values, cuts), key=len, reverse=True)
+
+
+def estimate_timings(captures, tolerance: float = 0.35) -> Timings:
+    """
+    Estimates the bit timings from the captures : the most frequent mark is the bit mark, and the spaces following it
+    fall in two clusters, zero and one
+    :param captures: iterable of Capture
+    :param tolerance: accepted relative deviation of the marks
+    :return: Timings
+    """
+    pulses = [np.asarray(capture.pulses, dtype=np.int32) for capture in captures]
+    marks = np.concatenate([capture[0::2] for capture in pulses])
+    mark = int(np.median(_clusters(marks)[0]))
+    spaces = np.concatenate([capture[1::2][np.abs(capture[0:len(capture) - 1:2] - mark) <= mark * tolerance]
+                             for capture in pulses])
+    clusters = _clusters(spaces)
+    if len(clusters) < 2:
+        raise ValueError("spaces don't fall in (at least) two clusters")
+    zero_space, one_space = sorted(int(np.median(cluster)) for cluster in clusters[:2])
+    threshold = (zero_space + one_space) // 2
+    return Timings(mark, zero_space, one_space, threshold, one_space + (one_space - zero_space))
+
+
+def decode_bits(pulses, timings: Timings) -> tuple:
+    """
+    Decodes a pulse buffer to bits, marks longer than twice the bit mark (headers) delimiting the frames as well
+    :param pulses: mark/space durations
+    :param timings: Timings
+    :return: (bits as an uint8 array, tuple of the number of bits of each frame)
+    """
+    pulses = np.asarray(pulses, dtype=np.int32)
+    if len(pulses) % 2:
+        pulses = np.append(pulses, 0)
+    marks, spaces = pulses[0::2], pulses[1::2]
+    is_bit = (marks <= 2 * timings.mark) & (spaces <= timings.delimiter)
+    bits = (spaces[is_bit] > timings.threshold).astype(np.uint8)
+    # runs of bits between delimiters
+    edges = np.diff(np.concatenate(([0], is_bit.astype(np.int8), [0])))
+    frames = tuple(int(length) for length in np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1))
+    return bits, frames
+
+
+def _label_codes(values) -> tuple:
+    """
+    :return: (code of each label as an int array, labels by code, numeric labels as a float array or None)
+    """
+    names = [value.name if hasattr(value, "name") else value for value in values]
+    numeric = None
+    if all(isinstance(name, (int, float)) and not isinstance(name, bool) for name in names):
+        numeric = np.asarray(names, dtype=np.float64)
+    uniques = sorted(set(names), key=lambda name: (not isinstance(name, (int, float)), str(name)))
+    index = {name: code for code, name in enumerate(uniques)}
+    return np.fromiter((index[name] for name in names), dtype=np.intp, count=len(names)), uniques, numeric
+
+
+def _entropy(p):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    return np.nan_to_num(h)
+
+
+def dependence(matrix, codes, classes: int):
+    """
+    Normalized mutual information between each bit and a field : 1 when the bit is a function of the field, 0 when
+    it is independent of it (or constant)
+    :param matrix: bits, one row per capture
+    :param codes: code of the field value of each capture
+    :param classes: number of distinct codes
+    :return: float array, one value per bit
+    """
+    onehot = np.zeros((len(codes), classes))
+    onehot[np.arange(len(codes)), codes] = 1
+    counts = onehot.sum(axis=0)
+    present = counts > 0
+    ones = onehot.T[present] @ matrix
+    conditional = (counts[present, None] / len(codes) * _entropy(ones / counts[present, None])).sum(axis=0)
+    total = _entropy(matrix.mean(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, 1 - conditional / total, 0.)
+
+
+def correlation(matrix, values):
+    """
+    Pearson correlation between each bit and a numeric field
+    :param matrix: bits, one row per capture
+    :param values: float array, the field value of each capture
+    :return: float array, one value per bit (0 for constant bits)
+    """
+    bits = matrix - matrix.mean(axis=0)
+    values = values - values.mean()
+    norm = np.sqrt((bits ** 2).sum(axis=0) * (values ** 2).sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(norm > 0, values @ bits / norm, 0.)
+
+
+def to_bytes(matrix, frames, lsb_first: bool):
+    """
+    Packs a bit matrix to bytes, each frame starting on a new byte
+    :param matrix: bits, one row per capture
+    :param frames: number of bits of each frame
+    :param lsb_first: bit order of the bytes
+    :return: (uint8 matrix, tuple of the number of bytes of each frame)
+    """
+    packed = []
+    start = 0
+    for length in frames:
+        packed.append(np.packbits(matrix[:, start:start + length], axis=1, bitorder="little" if lsb_first else "big"))
+        start += length
+    return np.concatenate(packed, axis=1), tuple(part.shape[1] for part in packed)
+
+
+def find_structure(data, frames, unit: int = 8) -> list:
+    """
+    Detects the bytes (or nibbles) which are constant, or computed from other ones : sum or xor checksums of the
+    previous ones in the frame, complements and repeats
+    :param data: uint8 matrix of bytes (or nibbles), one row per capture
+    :param frames: number of bytes (or nibbles) of each frame
+    :param unit: 8 for bytes, 4 for nibbles
+    :return: list of Finding, one at most per position
+    """
+    mask = (1 << unit) - 1
+    varying = (data != data[0]).any(axis=0)
+    wide = data.astype(np.int64)
+    sums = np.cumsum(wide, axis=1)
+    xors = np.bitwise_xor.accumulate(wide, axis=1)
+    findings = []
+    start = 0
+    for length in frames:
+        for position in range(start, start + length):
+            column = wide[:, position]
+            if not varying[position]:
+                findings.append(Finding("constant", position, None, "0x{:0{}x}".format(data[0, position], unit // 4)))
+                continue
+            finding = None
+            if position:
+                previous = wide[:, :position]
+                for kind, candidates in (("repeat", previous), ("complement", previous ^ mask)):
+                    matches = np.flatnonzero((candidates == column[:, None]).all(axis=0) & varying[:position])
+                    if len(matches):
+                        finding = Finding(kind, position, int(matches[-1]), None)
+                        break
+            # longest range of previous bytes summing (or xoring) to this one
+            for first in range(start, position - 1) if finding is None else ():
+                before = sums[:, first - 1] if first else 0
+                if np.array_equal((sums[:, position - 1] - before) & mask, column):
+                    finding = Finding("checksum", position, (first, position - 1), "sum")
+                    break
+                before = xors[:, first - 1] if first else 0
+                if np.array_equal(xors[:, position - 1] ^ before, column):
+                    finding = Finding("checksum", position, (first, position - 1), "xor")
+                    break
+            if finding is not None:
+                findings.append(finding)
+        start += length
+    return findings
+
+
+def _bit_range(bits) -> str:
+    if list(bits) == list(range(bits[0], bits[-1] + 1)) and len(bits) > 1:
+        return "{}-{}".format(bits[0], bits[-1])
+    return ",".join(str(bit) for bit in bits)
+
+
+def _nibbles(data):
+    nibbles = np.empty((data.shape[0], data.shape[1] * 2), dtype=np.uint8)
+    nibbles[:, 0::2] = data >> 4
+    nibbles[:, 1::2] = data & 0xf
+    return nibbles
+
+
+class Analysis:
+    """
+    Analysis of a set of labelled captures of one remote control
+    """
+
+    def __init__(self, captures, lsb_first=None, min_score: float = 0.5):
+        """
+        :param captures: iterable of Capture (or of (pulses, labels))
+        :param lsb_first: bit order of the bytes, guessed from the checksums found when None
+        :param min_score: minimum dependence of a bit on a field for it to be part of the field
+        """
+        captures = [Capture(*capture) for capture in captures]
+        self.timings = estimate_timings(captures)
+        decoded = [decode_bits(capture.pulses, self.timings) for capture in captures]
+        # captures of another layout (i.e. truncated ones) are left out
+        layouts = Counter(frames for _, frames in decoded)
+        self.frames, _ = layouts.most_common(1)[0]
+        kept = [i for i, (_, frames) in enumerate(decoded) if frames == self.frames]
+        self.rejected = len(captures) - len(kept)
+        self.captures = [captures[i] for i in kept]
+        self.matrix = np.array([decoded[i][0] for i in kept], dtype=np.uint8)
+        self.min_score = min_score
+
+        self.fields = sorted({field for capture in self.captures for field in capture.labels})
+        self.labels = {}
+        self.dependence = {}
+        self.correlation = {}
+        for field in self.fields:
+            # captures which don't carry the field (i.e. temperature in FAN mode) are left out of its analysis
+            labelled = np.array([capture.labels.get(field) is not None for capture in self.captures])
+            codes, uniques, numeric = _label_codes([capture.labels[field] for capture in self.captures
+                                                    if capture.labels.get(field) is not None])
+            self.labels[field] = (labelled, codes, uniques, numeric)
+            self.dependence[field] = dependence(self.matrix[labelled], codes, len(uniques))
+            if numeric is not None:
+                self.correlation[field] = correlation(self.matrix[labelled], numeric)
+
+        if lsb_first is None:
+            lsb_first = max((True, False), key=lambda order: sum(
+                finding.kind == "checksum" for finding in find_structure(*to_bytes(self.matrix, self.frames, order))))
+        self.lsb_first = lsb_first
+        self.bytes, self.byte_frames = to_bytes(self.matrix, self.frames, lsb_first)
+        self.findings = {finding.position: finding for finding in find_structure(self.bytes, self.byte_frames)}
+        self.nibble_findings = {
+            finding.position: finding
+            for finding in find_structure(_nibbles(self.bytes), tuple(2 * length for length in self.byte_frames), 4)
+            if finding.kind != "constant" and finding.position // 2 not in self.findings}
+
+    def _bit_index(self, byte, bit) -> int:
+        """
+        index in the bit matrix of a value bit of a byte
+        """
+        start = 0
+        for frame_bits, frame_bytes in zip(self.frames, self.byte_frames):
+            if byte < frame_bytes:
+                index = start + byte * 8 + (bit if self.lsb_first else 7 - bit)
+                return index if index < start + frame_bits else None
+            byte -= frame_bytes
+            start += frame_bits
+        return None
+
+    def field_slices(self) -> list:
+        """
+        Bits of each byte (not explained by another one) carrying each field
+        :return: list of FieldSlice
+        """
+        slices = []
+        derived = set(self.findings) | {position // 2 for position in self.nibble_findings
+                                        if self.nibble_findings[position].kind != "checksum"}
+        for byte in range(self.bytes.shape[1]):
+            if byte in self.findings:
+                continue
+            best = {}
+            for bit in range(8):
+                index = self._bit_index(byte, bit)
+                if index is None:
+                    continue
+                scores = {field: self.dependence[field][index] for field in self.fields}
+                field = max(scores, key=scores.get, default=None)
+                if field is not None and scores[field] >= self.min_score:
+                    best.setdefault(field, []).append((bit, scores[field]))
+            for field, bits in best.items():
+                if byte in derived and all(self.nibble_findings.get(2 * byte + (bit < 4)) for bit, _ in bits):
+                    continue
+                positions = [bit for bit, _ in bits]
+                encoding, table = self._encoding(field, byte, positions)
+                slices.append(FieldSlice(field, byte, positions, float(np.mean([score for _, score in bits])),
+                                         encoding, table))
+        return slices
+
+    def _encoding(self, field, byte, positions) -> tuple:
+        labelled, codes, uniques, numeric = self.labels[field]
+        bits = np.array(positions)
+        values = ((self.bytes[labelled, byte, None] >> bits) & 1) @ (1 << np.arange(len(bits)))
+        table = {label: set() for label in uniques}
+        for code, value in zip(codes, values):
+            table.setdefault(uniques[code], set()).add(int(value))
+        if any(len(values) > 1 for values in table.values()):
+            return "partial", {label: sorted(values) for label, values in table.items()}
+        table = {label: values.pop() for label, values in table.items()}
+        if numeric is not None and len(table) > 1:
+            labels = np.array(list(table), dtype=np.float64)
+            width = len(bits)
+            for prefix, encoded in (("", list(table.values())),
+                                    ("reversed ", [int("{:0{}b}".format(value, width)[::-1], 2)
+                                                   for value in table.values()])):
+                scale, offset = (int(round(value)) for value in np.polyfit(labels, encoded, 1))
+                if scale and np.array_equal(scale * labels + offset, encoded):
+                    if scale == 1:
+                        return "{}offset {:+d}".format(prefix, offset), table
+                    return "{}scale {:d} offset {:+d}".format(prefix, scale, offset), table
+        return "table", table
+
+    def report(self) -> str:
+        """
+        Human readable description of the timings and the proposed layout
+        """
+        timings = self.timings
+        lines = ["{} captures ({} rejected), frames of {} bits".format(
+            len(self.captures), self.rejected, ", ".join(str(length) for length in self.frames)),
+            "mark {}us, zero space {}us, one space {}us, bytes {} first".format(
+                timings.mark, timings.zero_space, timings.one_space, "LSB" if self.lsb_first else "MSB")]
+        slices = {}
+        for field_slice in self.field_slices():
+            slices.setdefault(field_slice.byte, []).append(field_slice)
+        byte = 0
+        for frame, length in enumerate(self.byte_frames):
+            lines.append("frame {}".format(frame))
+            for position in range(byte, byte + length):
+                description = []
+                finding = self.findings.get(position)
+                if finding is not None:
+                    if finding.kind == "checksum":
+                        description.append("{} of bytes {}-{}".format(finding.detail, *finding.source))
+                    elif finding.kind == "constant":
+                        description.append("constant {}".format(finding.detail))
+                    else:
+                        description.append("{} of byte {}".format(finding.kind, finding.source))
+                for nibble in (2 * position, 2 * position + 1):
+                    finding = self.nibble_findings.get(nibble)
+                    if finding is not None:
+                        source = finding.source if finding.kind != "checksum" else "{}-{}".format(*finding.source)
+                        description.append("{} nibble : {}{} of nibble {}".format(
+                            "high" if nibble % 2 == 0 else "low", finding.kind,
+                            " ({})".format(finding.detail) if finding.detail else "", source))
+                for field_slice in slices.get(position, ()):
+                    description.append("{} bits {} : {}{}".format(
+                        field_slice.field, _bit_range(field_slice.bits),
+                        field_slice.encoding,
+                        " {}".format(field_slice.table) if field_slice.encoding in ("table", "partial") else ""))
+                lines.append("  byte {:3d} : {}".format(position, "; ".join(description) or "unknown"))
+            byte += length
+        return "\n".join(lines)
+
+
+def load_captures(lines) -> list:
+    """
+    Reads captures from json lines {"pulses": [...], "labels": {...}}
+    :param lines: iterable of str
+    :return: list of Capture
+    """
+    captures = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            captures.append(Capture(record["pulses"], record["labels"]))
+        except (KeyError, ValueError):
+            logging.error("line {} isn't a capture".format(number))
+    return captures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m eakon.reverse", description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", nargs="?", help="json lines of captures, standard input when omitted")
+    parser.add_argument("--bit-order", choices=("auto", "lsb", "msb"), default="auto")
+    parser.add_argument("--min-score", type=float, default=0.5,
+                        help="minimum dependence of a bit on a field for it to be part of the field")
+    parser.add_argument("--demo", metavar="MODEL", help="analyses captures generated by an implemented model instead")
+    args = parser.parse_args(argv)
+    if args.demo:
+        _demo_reverse(args.demo)
+        return
+    if args.input is None:
+        captures = load_captures(sys.stdin)
+    else:
+        with open(args.input) as input_file:
+            captures = load_captures(input_file)
+    analysis = Analysis(captures, lsb_first={"auto": None, "lsb": True, "msb": False}[args.bit_order],
+                        min_score=args.min_score)
+    print(analysis.report())
+
+
+def _demo_reverse(model="toshiba", count=500):
+    """
+    Analyses captures produced by one of the implemented models, labelled with their settings
+    """
+    import random
+    from time import perf_counter
+    from eakon import get_model_class
+    model_class = get_model_class(model)
+    space = model_class.state_space()
+    random.seed(1)
+    captures = []
+    for index in random.sample(range(len(space)), min(count, len(space))):
+        state = space.index_to_state(index)
+        unit = model_class(**state)
+        labels = {field: value if field == "temperature" else value.name
+                  for field, value in state.items() if value is not None}
+        captures.append(Capture(unit.wave, labels))
+    start = perf_counter()
+    analysis = Analysis(captures)
+    elapsed = perf_counter() - start
+    print(analysis.report())
+    print("analysis of {} captures : {:.0f} ms".format(len(captures), elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Timers of a fleet : daily, weekly and one-shot rules applying settings to units or groups.
+
+All the rules share a single min-heap of their next fire time, so that each tick only looks at the top of the heap
+(O(log n) per fired rule, whatever the number of rules). When a rule fires, its settings are applied to its targets
+with Fleet.apply, and the resulting waves are handed off to a Scheduler.
+Rules are kept in a json store, loaded (and heapified) at boot.
+
+    engine = ScheduleEngine(fleet, scheduler, store="schedule.json")
+    engine.add(DailyRule("wake_up", "bedrooms", "06:30", power="ON", mode="HEAT", temperature=22))
+    engine.add(WeeklyRule("office_off", "office", "19:00", days=("mon", "tue", "wed", "thu", "fri"), power="OFF"))
+    engine.add(OnceRule("guest", "guest_room", "2021-12-24T18:00", power="ON", mode="HEAT"))
+    await engine.run()
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def _parse_time(at: str) -> tuple:
+    hour, _, minute = at.partition(":")
+    minute, _, second = minute.partition(":")
+    hour, minute, second = int(hour), int(minute or 0), int(second or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        raise ValueError("invalid time of day {}".format(at))
+    return hour, minute, second
+
+
+def _check_settings(settings: dict) -> dict:
+    from eakon.capabilities import FIELDS
+    unknown = [name for name in settings if name not in FIELDS and name != "temperature"]
+    if unknown:
+        raise ValueError("unknown settings {}".format(", ".join(sorted(unknown))))
+    return settings
+
+
+class Rule:
+    """
+    Base class of the rules : settings (as given to Fleet.apply) applied to targets (unit id, group name, or list of
+    those, all the units when None) at the times the rule defines
+    """
+    kind = None
+
+    def __init__(self, rule_id: str, targets, **settings):
+        self.rule_id = rule_id
+        self.targets = targets
+        self.settings = _check_settings(settings)
+
+    def next_fire(self, after: datetime):
+        """
+        Next fire time, strictly after a given time
+        :param after: local time
+        :return: datetime, or None when the rule won't fire anymore
+        """
+        raise NotImplementedError
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "rule_id": self.rule_id, "targets": self.targets, "settings": self.settings}
+
+    @staticmethod
+    def from_dict(rule_dict: dict) -> "Rule":
+        """
+        Creates a rule from a dictionary produced by to_dict
+        :param rule_dict:
+        :return: Rule
+        """
+        rule_dict = dict(rule_dict)
+        rule_class = _RULES[rule_dict.pop("kind")]
+        settings = rule_dict.pop("settings", {})
+        # the settings are kept apart from the arguments of the rule, whatever their names
+        rule = rule_class(**rule_dict)
+        rule.settings = _check_settings(dict(settings))
+        return rule
+
+    def __repr__(self):
+        return "<{} {}>".format(type(self).__name__, self.rule_id)
+
+
+class DailyRule(Rule):
+    """
+    Fires every day at a time of day ("HH:MM" or "HH:MM:SS")
+    """
+    kind = "daily"
+
+    def __init__(self, rule_id: str, targets, at: str, **settings):
+        super().__init__(rule_id, targets, **settings)
+        self.at = at
+        self._time = _parse_time(at)
+
+    def _days(self):
+        return range(7)
+
+    def next_fire(self, after: datetime):
+        hour, minute, second = self._time
+        days = self._days()
+        for offset in range(8):
+            day = after + timedelta(days=offset)
+            candidate = day.replace(hour=hour, minute=minute, second=second, microsecond=0)
+            if candidate > after and candidate.weekday() in days:
+                return candidate
+        return None
+
+    def to_dict(self) -> dict:
+        rule_dict = super().to_dict()
+        rule_dict["at"] = self.at
+        return rule_dict
+
+
+class WeeklyRule(DailyRule):
+    """
+    Fires at a time of day, on some days of the week ("mon" ... "sun")
+    """
+    kind = "weekly"
+
+    def __init__(self, rule_id: str, targets, at: str, days=DAYS, **settings):
+        super().__init__(rule_id, targets, at, **settings)
+        unknown = set(days) - set(DAYS)
+        if unknown or not days:
+            raise ValueError("invalid days {}".format(", ".join(sorted(unknown)) or "(none)"))
+        self.days = tuple(day for day in DAYS if day in days)
+        self._weekdays = frozenset(DAYS.index(day) for day in self.days)
+
+    def _days(self):
+        return self._weekdays
+
+    def to_dict(self) -> dict:
+        rule_dict = super().to_dict()
+        rule_dict["days"] = list(self.days)
+        return rule_dict
+
+
+class OnceRule(Rule):
+    """
+    Fires once, at a given date and time (datetime or ISO 8601 string)
+    """
+    kind = "once"
+
+    def __init__(self, rule_id: str, targets, at, **settings):
+        super().__init__(rule_id, targets, **settings)
+        self.at = datetime.fromisoformat(at) if isinstance(at, str) else at
+
+    def next_fire(self, after: datetime):
+        return self.at if self.at > after else None
+
+    def to_dict(self) -> dict:
+        rule_dict = super().to_dict()
+        rule_dict["at"] = self.at.isoformat()
+        return rule_dict
+
+
+_RULES = {rule_class.kind: rule_class for rule_class in (DailyRule, WeeklyRule, OnceRule)}
+
+
+class ScheduleStore:
+    """
+    Json file holding the rules
+    """
+
+    def __init__(self, path):
+        from pathlib import Path
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def load(self) -> list:
+        """
+        :return: list of Rule
+        """
+        import json
+        if not self.path.exists():
+            return []
+        rules = []
+        for rule_dict in json.loads(self.path.read_text()):
+            try:
+                rules.append(Rule.from_dict(rule_dict))
+            except (KeyError, TypeError, ValueError):
+                logging.exception("{} has an improperly formatted rule : {}".format(self.path, rule_dict))
+        return rules
+
+    def save(self, rules):
+        """
+        Writes the rules, atomically
+        :param rules: iterable of Rule
+        """
+        import json
+        tmp_file = self.path.with_name(self.path.name + ".tmp")
+        tmp_file.write_text(json.dumps([rule.to_dict() for rule in rules]))
+        tmp_file.replace(self.path)
+
+
+class ScheduleEngine:
+    """
+    Fires the rules of a fleet, from a min-heap of their next fire times
+    """
+
+    def __init__(self, fleet, scheduler=None, emitter=None, store=None, clock=time.time, grace: float = 3600.):
+        """
+        :param fleet: eakon.fleet.Fleet
+        :param scheduler: eakon.scheduler.Scheduler the waves are submitted to, None to only apply the settings
+        :param emitter: emitter of a unit, as a dict of unit id -> emitter or a callable, the unit id when None
+        :param store: ScheduleStore or path of the json store, the rules being loaded from it
+        :param clock: returns the current time as a timestamp
+        :param grace: when loading, one-shot rules missed by less than grace seconds still fire
+        """
+        self.fleet = fleet
+        self.scheduler = scheduler
+        self.emitter = emitter
+        self.store = ScheduleStore(store) if store is not None and not isinstance(store, ScheduleStore) else store
+        self.clock = clock
+        self.grace = grace
+        self.rules = {}
+        self._heap = []
+        self._generations = {}
+        self._counter = itertools.count()
+        self._wakeup = None
+        self.fired = 0
+        self.listeners = []
+        if self.store is not None:
+            self.load()
+
+    # --- rules ---
+
+    def _now(self) -> datetime:
+        return datetime.fromtimestamp(self.clock())
+
+    def _push(self, rule, after: datetime):
+        fire = rule.next_fire(after)
+        if fire is not None:
+            heapq.heappush(self._heap, (fire.timestamp(), next(self._counter), rule.rule_id,
+                                        self._generations[rule.rule_id]))
+
+    def load(self):
+        """
+        Loads the rules from the store, in a single heapify
+        """
+        now = self._now()
+        missed = now - timedelta(seconds=self.grace)
+        self.rules = {}
+        self._heap = []
+        for rule in self.store.load():
+            self.rules[rule.rule_id] = rule
+            self._generations[rule.rule_id] = self._generations.get(rule.rule_id, 0) + 1
+            fire = rule.next_fire(missed if isinstance(rule, OnceRule) else now)
+            if fire is not None:
+                self._heap.append((fire.timestamp(), next(self._counter), rule.rule_id,
+                                   self._generations[rule.rule_id]))
+        heapq.heapify(self._heap)
+        logging.info("loaded {} rules from {}".format(len(self.rules), self.store.path))
+
+    def add(self, rule: Rule, save: bool = True):
+        """
+        Adds (or replaces) a rule
+        :param rule:
+        :param save: writes the store
+        """
+        self.rules[rule.rule_id] = rule
+        # entries of the replaced rule stay in the heap, and are skipped when popped
+        self._generations[rule.rule_id] = self._generations.get(rule.rule_id, 0) + 1
+        self._push(rule, self._now())
+        self._changed(save)
+
+    def remove(self, rule_id: str, save: bool = True) -> Rule:
+        """
+        Removes a rule
+        :param rule_id:
+        :param save: writes the store
+        :return: the removed rule
+        """
+        rule = self.rules.pop(rule_id)
+        self._generations[rule_id] += 1
+        self._changed(save)
+        return rule
+
+    def _changed(self, save):
+        if save and self.store is not None:
+            self.store.save(self.rules.values())
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def next_fire(self):
+        """
+        Time of the next rule to fire
+        :return: timestamp, or None
+        """
+        while self._heap:
+            timestamp, _, rule_id, generation = self._heap[0]
+            if self._generations.get(rule_id) == generation and rule_id in self.rules:
+                return timestamp
+            heapq.heappop(self._heap)
+        return None
+
+    # --- firing ---
+
+    def _emitter(self, unit_id):
+        if self.emitter is None:
+            return unit_id
+        if callable(self.emitter):
+            return self.emitter(unit_id)
+        return self.emitter.get(unit_id, unit_id)
+
+    def fire_due(self) -> list:
+        """
+        Fires the rules whose time has come
+        :return: list of (rule, results of Fleet.apply)
+        """
+        now = self.clock()
+        fired = []
+        while True:
+            timestamp = self.next_fire()
+            if timestamp is None or timestamp > now:
+                break
+            _, _, rule_id, _ = heapq.heappop(self._heap)
+            rule = self.rules[rule_id]
+            try:
+                fired.append((rule, self._fire(rule)))
+            except Exception:
+                logging.exception("rule {} failed to fire".format(rule_id))
+            finally:
+                # a failing rule still fires at its next time
+                self._push(rule, datetime.fromtimestamp(max(now, timestamp)))
+                if isinstance(rule, OnceRule):
+                    self.remove(rule_id)
+        return fired
+
+    def _fire(self, rule) -> dict:
+        self.fired += 1
+        try:
+            results = self.fleet.apply(rule.targets, **rule.settings)
+        except KeyError:
+            logging.exception("rule {} targets unknown units or groups".format(rule.rule_id))
+            return {}
+        for unit_id, result in results.items():
+            if result.error is not None:
+                logging.error("rule {} failed for unit {} : {!r}".format(rule.rule_id, unit_id, result.error))
+            elif self.scheduler is not None:
+                self.scheduler.submit(unit_id, result.wave, emitter=self._emitter(unit_id))
+        for listener in self.listeners:
+            try:
+                listener(rule, results)
+            except Exception:
+                logging.exception("schedule listener {} failed".format(listener))
+        return results
+
+    async def run(self):
+        """
+        Fires the rules on time, until cancelled
+        """
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self.fire_due()
+                timestamp = self.next_fire()
+                self._wakeup.clear()
+                timeout = None if timestamp is None else max(0., timestamp - self.clock())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+
+def _bench_schedule(units=10000, rules=10000):
+    import random
+    import tempfile
+    from time import perf_counter
+    from eakon.fleet import Fleet
+    fleet = Fleet()
+    for i in range(units):
+        fleet.add("unit{}".format(i), "daikin")
+    clock = [datetime(2021, 6, 7, 0, 0).timestamp()]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = ScheduleEngine(fleet, store=directory + "/schedule.json", clock=lambda: clock[0])
+        random.seed(1)
+        for i in range(rules):
+            at = "{:02d}:{:02d}".format(random.randrange(24), random.randrange(60))
+            engine.add(WeeklyRule("rule{}".format(i), "unit{}".format(i % units), at,
+                                  days=random.sample(DAYS, 3), power="ON", mode="COOL",
+                                  temperature=random.randint(20, 28)), save=False)
+        engine.store.save(engine.rules.values())
+        start = perf_counter()
+        ticks = 0
+        for minute in range(24 * 60):
+            clock[0] += 60
+            engine.fire_due()
+            ticks += 1
+        elapsed = perf_counter() - start
+        print("{} rules, one day of ticks : {} fired, {:.1f} us per tick".format(
+            rules, engine.fired, elapsed / ticks * 1e6))
+        start = perf_counter()
+        reloaded = ScheduleEngine(fleet, store=engine.store, clock=lambda: clock[0])
+        print("reload of {} rules : {:.1f} ms".format(len(reloaded.rules), (perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    _bench_schedule()
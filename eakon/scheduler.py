@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Asyncio transmission scheduler.
+
+Each unit has at most one pending command : submitting a new one while the previous is still waiting replaces it
+(last write wins), so only the final state is transmitted when automation fires several changes quickly.
+Transmissions on the same emitter are serialized and spaced by a minimum gap, different emitters run concurrently.
+"""
+import abc
+import asyncio
+import logging
+from collections import deque
+
+from eakon import HVAC
+
+
+class Transmitter(abc.ABC):
+    """
+    Interface of the (asynchronous) backends actually emitting the waves
+    """
+
+    @abc.abstractmethod
+    async def transmit(self, emitter, wave):
+        """
+        Emits a wave, returning once it has been sent
+        :param emitter: identifier of the IR emitter to use
+        :param wave: sequence of mark/space durations in microseconds
+        """
+
+
+class FakeTransmitter(Transmitter):
+    """
+    In-memory transmitter, recording the transmissions instead of emitting them.
+    When realtime is set, transmitting takes as long as the wave lasts.
+    """
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.transmissions = []
+
+    async def transmit(self, emitter, wave):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if self.realtime:
+            await asyncio.sleep(sum(wave) / 1e6)
+        else:
+            await asyncio.sleep(0)
+        self.transmissions.append((emitter, wave, start, loop.time()))
+
+
+class _Pending:
+    __slots__ = ("emitter", "wave", "futures")
+
+    def __init__(self, emitter, wave):
+        self.emitter = emitter
+        self.wave = wave
+        self.futures = []
+
+
+class Scheduler:
+    """
+    Schedules the transmissions of many units over a set of emitters.
+    """
+
+    def __init__(self, transmitter: Transmitter, min_gap: float = 0.2):
+        """
+        :param transmitter: backend emitting the waves
+        :param min_gap: minimum time in seconds between the end of a transmission and the start of the next one on
+        the same emitter
+        """
+        self.transmitter = transmitter
+        self.min_gap = min_gap
+        self._pending = {}
+        self._queues = {}
+        self._workers = {}
+        self._last_end = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.transmitted = 0
+        self.failed = 0
+
+    def submit(self, unit_id, wave, emitter=None) -> asyncio.Future:
+        """
+        Queues the transmission of a unit state, replacing the pending one of that unit if any.
+        :param unit_id:
+        :param wave: sequence of durations, or an HVAC instance (encoded when actually transmitted, with its state
+        at that time)
+        :param emitter: emitter reaching the unit
+        :return: future resolved once the unit state (or a newer one) has been transmitted
+        """
+        self.submitted += 1
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(unit_id)
+        if pending is not None and pending.emitter == emitter:
+            pending.wave = wave
+            self.coalesced += 1
+        else:
+            if pending is not None:
+                # the unit moved to another emitter : its previous command is superseded there
+                self._queues[pending.emitter].remove(unit_id)
+                self.coalesced += 1
+                futures = pending.futures
+                pending = self._pending[unit_id] = _Pending(emitter, wave)
+                pending.futures.extend(futures)
+            else:
+                pending = self._pending[unit_id] = _Pending(emitter, wave)
+            self._queues.setdefault(emitter, deque()).append(unit_id)
+            if emitter not in self._workers:
+                self._workers[emitter] = asyncio.ensure_future(self._run(emitter))
+        pending.futures.append(future)
+        return future
+
+    @property
+    def pending(self) -> int:
+        """
+        number of units waiting for a transmission
+        :return:
+        """
+        return len(self._pending)
+
+    async def join(self):
+        """
+        Waits until all pending transmissions are done
+        """
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    async def _run(self, emitter):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[emitter]
+        try:
+            while queue:
+                delay = self._last_end.get(emitter, float("-inf")) + self.min_gap - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if not queue:
+                        # the units waiting moved to other emitters meanwhile
+                        break
+                # taken only now, so that commands submitted while waiting are coalesced
+                unit_id = queue.popleft()
+                pending = self._pending.pop(unit_id)
+                try:
+                    wave = pending.wave.wave if isinstance(pending.wave, HVAC) else pending.wave
+                    await self.transmitter.transmit(emitter, wave)
+                except Exception as exc:
+                    self.failed += 1
+                    logging.exception("transmission for unit {} on emitter {} failed".format(unit_id, emitter))
+                    for future in pending.futures:
+                        if not future.done():
+                            future.set_exception(exc)
+                else:
+                    self.transmitted += 1
+                    for future in pending.futures:
+                        if not future.done():
+                            future.set_result(True)
+                finally:
+                    self._last_end[emitter] = loop.time()
+        finally:
+            del self._workers[emitter]
+            if not queue:
+                del self._queues[emitter]
+
+
+async def _demo_scheduler():
+    transmitter = FakeTransmitter()
+    scheduler = Scheduler(transmitter, min_gap=0.05)
+    for temperature in range(20, 30):
+        for unit in range(10):
+            scheduler.submit("unit{}".format(unit), [temperature], emitter=unit % 2)
+    await scheduler.join()
+    print("submitted {}, coalesced {}, transmitted {}".format(scheduler.submitted, scheduler.coalesced,
+                                                             scheduler.transmitted))
+
+
+if __name__ == '__main__':
+    asyncio.run(_demo_scheduler())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Asyncio HTTP control service for a fleet of units.
+
+    python -m eakon.server --fleet fleet.json --unit living=daikin --unit bedroom=toshiba --port 8080
+
+Endpoints (JSON in and out) :
+    GET  /units                         state of all units
+    GET  /units/<id>                    state of a unit
+    PUT  /units/<id>                    creates a unit : {"model": "daikin", "state": {"power": "ON", ...}}
+    POST /units/<id>                    updates a unit : {"mode": "COOL", "temperature": 25}
+    POST /units                         batch update : {"units": ["living", ...] or a group name, "settings": {...}}
+    GET  /units/<id>/wave?format=...    wave of a unit, format being one of pigpio (default),
+                                        bitstring, binary, pronto, lirc or broadlink
+    GET  /events                        stream of state changes, one JSON object per line
+
+Waves are served from the fleet encode cache, and the fleet is saved in a worker thread (coalescing the updates made
+while a save is running), so that the event loop never blocks on the disk.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+from eakon.fleet import Fleet
+
+_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """
+    Error turned into an HTTP error response
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _format_wave(unit, wave, wave_format):
+    if wave_format == "pigpio":
+        return "application/json", json.dumps(list(wave)).encode()
+    if wave_format == "bitstring":
+        return "text/plain", unit.bitstring.encode()
+    if wave_format == "binary":
+        return "application/octet-stream", unit.export("binary")
+    if wave_format in ("pronto", "lirc", "broadlink"):
+        return "text/plain", unit.export(wave_format).encode()
+    raise HTTPError(400, "unknown wave format {}".format(wave_format))
+
+
+class FleetServer:
+    """
+    Serves a Fleet over HTTP/1.1 (with keep-alive)
+    """
+    WAVE_FORMATS = ("pigpio", "bitstring", "binary", "pronto", "lirc", "broadlink")
+
+    def __init__(self, fleet: Fleet, wave_cache_size=1024, event_queue_size=256, max_body_size=1 << 20):
+        """
+        :param fleet:
+        :param wave_cache_size: number of formatted waves kept
+        :param event_queue_size: number of state changes queued for an event stream, a client lagging further behind
+        being disconnected
+        :param max_body_size: maximum size of a request body in bytes
+        """
+        self.fleet = fleet
+        self.event_queue_size = event_queue_size
+        self.max_body_size = max_body_size
+        self._subscribers = set()
+        self._wave_cache = {}
+        self._wave_cache_size = wave_cache_size
+        self._saving = None
+        self._dirty = False
+        self.requests = 0
+
+    # --- persistence ---
+
+    def _schedule_save(self):
+        if self.fleet.json_file is None:
+            return
+        self._dirty = True
+        if self._saving is None or self._saving.done():
+            self._saving = asyncio.ensure_future(self._save())
+
+    async def _save(self):
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            self._dirty = False
+            # snapshot taken in the loop, written in a worker thread
+            await loop.run_in_executor(None, self.fleet.save, self.fleet.to_dict())
+
+    async def flush(self):
+        """
+        Waits for the pending save to complete
+        """
+        if self._saving is not None:
+            await self._saving
+
+    # --- events ---
+
+    def _publish(self, unit_ids):
+        if not self._subscribers:
+            return
+        for unit_id in unit_ids:
+            line = (json.dumps({"unit": unit_id, "state": self.fleet[unit_id].to_dict()}) + "\n").encode()
+            for queue in list(self._subscribers):
+                try:
+                    queue.put_nowait(line)
+                except asyncio.QueueFull:
+                    # the client doesn't keep up : its stream is ended rather than buffering without limit
+                    logging.warning("dropping an event stream lagging {} changes behind".format(queue.qsize()))
+                    self._subscribers.discard(queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+
+    # --- handlers ---
+
+    def _unit(self, unit_id):
+        if unit_id not in self.fleet:
+            raise HTTPError(404, "unknown unit {}".format(unit_id))
+        return self.fleet[unit_id]
+
+    def _unit_dict(self, unit_id):
+        unit = self._unit(unit_id)
+        return {"model": self.fleet.model(unit_id), "state": unit.to_dict()}
+
+    def _check_settings(self, settings, unit_id=None):
+        """
+        Rejects the names which aren't settings (of the unit, when given), so that a request can't reach other
+        attributes or arguments of Fleet.apply
+        """
+        if not isinstance(settings, dict):
+            raise HTTPError(400, "settings must be an object")
+        from eakon.capabilities import FIELDS
+        fields = FIELDS.keys() | {"temperature"} if unit_id is None else self.fleet[unit_id].capabilities.fields
+        unknown = [name for name in settings if name not in fields]
+        if unknown:
+            raise HTTPError(400, "unknown settings {}".format(", ".join(sorted(map(str, unknown)))))
+
+    def _apply(self, targets, settings):
+        self._check_settings(settings)
+        try:
+            results = self.fleet.apply(targets, persist=False, **settings)
+        except KeyError as exc:
+            raise HTTPError(404, "unknown group or unit {}".format(exc))
+        updated = [unit_id for unit_id, result in results.items() if result.error is None]
+        self._schedule_save()
+        self._publish(updated)
+        return {unit_id: {"ok": True} if result.error is None else {"ok": False, "error": repr(result.error)}
+                for unit_id, result in results.items()}
+
+    def _wave(self, unit_id, wave_format):
+        unit = self._unit(unit_id)
+        key = (unit.state_key, wave_format)
+        response = self._wave_cache.get(key)
+        if response is None:
+            response = _format_wave(unit, self.fleet.wave(unit_id), wave_format)
+            if len(self._wave_cache) >= self._wave_cache_size:
+                self._wave_cache.pop(next(iter(self._wave_cache)))
+            self._wave_cache[key] = response
+        return response
+
+    def handle(self, method, path, query, body):
+        """
+        Routes a request
+        :return: (status, content type, body bytes)
+        """
+        if method in ("POST", "PUT") and not isinstance(body, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        parts = [part for part in path.split("/") if part]
+        if not parts or parts[0] != "units":
+            raise HTTPError(404, "not found")
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, {unit_id: self._unit_dict(unit_id) for unit_id in self.fleet}
+            if method == "POST":
+                return 200, self._apply(body.get("units"), body.get("settings", {}))
+        elif len(parts) == 2:
+            unit_id = parts[1]
+            if method == "GET":
+                return 200, self._unit_dict(unit_id)
+            if method == "POST":
+                self._unit(unit_id)
+                self._check_settings(body, unit_id)
+                result = self._apply([unit_id], body)[unit_id]
+                if not result["ok"]:
+                    raise HTTPError(400, result["error"])
+                return 200, self._unit_dict(unit_id)
+            if method == "PUT":
+                if unit_id in self.fleet:
+                    raise HTTPError(409, "unit {} already exists".format(unit_id))
+                try:
+                    self.fleet.add(unit_id, body["model"])
+                except (KeyError, NotImplementedError) as exc:
+                    raise HTTPError(400, str(exc))
+                try:
+                    self._check_settings(body.get("state", {}), unit_id)
+                    result = self._apply([unit_id], body.get("state", {}))[unit_id]
+                    if not result["ok"]:
+                        raise HTTPError(400, result["error"])
+                except HTTPError:
+                    self.fleet.remove(unit_id)
+                    raise
+                return 201, self._unit_dict(unit_id)
+        elif len(parts) == 3 and parts[2] == "wave" and method == "GET":
+            wave_format = query.get("format", ["pigpio"])[0]
+            return (200,) + self._wave(parts[1], wave_format)
+        else:
+            raise HTTPError(404, "not found")
+        raise HTTPError(405, "method not allowed")
+
+    # --- HTTP ---
+
+    @staticmethod
+    async def _write_response(writer, status, content_type, payload, keep_alive):
+        headers = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+            status, _REASONS.get(status, ""), content_type, len(payload), "keep-alive" if keep_alive else "close")
+        writer.write(headers.encode() + payload)
+        await writer.drain()
+
+    async def _stream_events(self, writer):
+        queue = asyncio.Queue(maxsize=self.event_queue_size)
+        self._subscribers.add(queue)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+            await writer.drain()
+            while True:
+                line = await queue.get()
+                if line is None:
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                    break
+                writer.write("{:x}\r\n".format(len(line)).encode() + line + b"\r\n")
+                await writer.drain()
+        finally:
+            self._subscribers.discard(queue)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # malformed request line, or a line over the stream limit
+                    await self._write_response(writer, 400, "application/json", b'{"error": "bad request"}', False)
+                    break
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= self.max_body_size:
+                    # the body can't be skipped reliably : the connection is closed after the error
+                    status, message = (400, "invalid content length") if length < 0 else (413, "body too large")
+                    await self._write_response(writer, status, "application/json",
+                                               json.dumps({"error": message}).encode(), False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                self.requests += 1
+
+                url = urlsplit(target)
+                if method == "GET" and url.path.rstrip("/") == "/events":
+                    await self._stream_events(writer)
+                    break
+                try:
+                    body = json.loads(raw_body) if raw_body else {}
+                    status, *response = self.handle(method, url.path, parse_qs(url.query), body)
+                    if len(response) == 1:
+                        content_type, payload = "application/json", json.dumps(response[0]).encode()
+                    else:
+                        content_type, payload = response
+                except HTTPError as exc:
+                    status, content_type = exc.status, "application/json"
+                    payload = json.dumps({"error": str(exc)}).encode()
+                except ValueError as exc:
+                    status, content_type = 400, "application/json"
+                    payload = json.dumps({"error": str(exc)}).encode()
+                except Exception as exc:
+                    logging.exception("failed to handle {} {}".format(method, target))
+                    status, content_type = 500, "application/json"
+                    payload = json.dumps({"error": repr(exc)}).encode()
+                await self._write_response(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=8080):
+        """
+        Serves until cancelled
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        logging.info("eakon server listening on {}:{}".format(host, port))
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                await self.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m eakon.server", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fleet", help="fleet json file, restored at startup and saved on updates")
+    parser.add_argument("--unit", action="append", default=[], metavar="ID=MODEL", help="unit to serve")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    fleet = Fleet(args.fleet)
+    if args.fleet:
+        fleet.restore()
+    for unit in args.unit:
+        unit_id, _, model = unit.partition("=")
+        if unit_id not in fleet:
+            fleet.add(unit_id, model)
+    try:
+        asyncio.run(FleetServer(fleet).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Shared memory structures for gateways running several worker processes.
+
+SharedStateTable holds the state of the units in a multiprocessing.shared_memory block, one fixed 64 bytes record
+per unit, so that any process reads or updates a unit without file I/O or pickling :
+
+    offset  size  content
+    0       4     version (uint32), odd while the record is being written
+    4       32    unit id (utf-8, zero padded), empty for a free slot
+    36      16    model name (ascii, zero padded)
+    52      10    ordinal of each field (uint8, in the order of capabilities.FIELDS, 255 for unset)
+    62      2     temperature in tenth of degrees (int16, -32768 for unset)
+
+Writers are serialized by a lock, readers don't lock : they retry when the version changed while they were reading
+(seqlock). A reader retrying too many times (i.e. a writer died while writing) falls back to a read under the lock. HVAC instances can be bound to a slot (see SharedStateTable.bind), their settings being then read from
+and written to the table instead of their private attributes.
+
+SharedWaveCache holds encoded waves in a shared memory arena of fixed size slots of uint16 durations, so that all the
+workers share one cache (and its warm-up) :
+
+    header   magic, slots, slot size, tick, inserts, evictions
+    slot     version (uint32), length (uint32), last access tick (uint32), padding, key (16 bytes), durations
+
+A (model, state) key hashes to a set of ways consecutive slots. Readers look the set up without locking and get a
+read-only view of the durations (zero-copy), validated by the slot version. Misses are encoded by the reader with the
+model _get_wave implementation, and inserted by one writer at a time (under the lock), evicting the least recently
+used slot of the set.
+"""
+import hashlib
+import logging
+import struct
+import zlib
+from multiprocessing import shared_memory
+
+from eakon.capabilities import get_capabilities
+from eakon.packing import FIELD_ORDER as _FIELDS, NO_TEMPERATURE as _NO_TEMPERATURE, STATE as _STATE, \
+    UNSET as _UNSET, decode_temperature as _decode_temperature, encode_temperature as _encode_temperature, \
+    get_codec as _codec, pack_state
+
+_MAGIC = b"EAKS"
+_HEADER = struct.Struct("<4sI8x")
+_RECORD = struct.Struct("<I32s16s10Bh")
+_VERSION = struct.Struct("<I")
+_STATE_OFFSET = 52
+# optimistic reads attempted before reading under the lock, and how long to wait for the lock
+_MAX_RETRIES = 10000
+_LOCK_TIMEOUT = 5.0
+
+
+class SharedStateTable:
+    """
+    State table in shared memory, one record per unit
+    """
+
+    def __init__(self, name=None, slots: int = 1024, create: bool = True, lock=None):
+        """
+        :param name: shared memory block name, generated when None
+        :param slots: number of units the table can hold (when creating it)
+        :param create: create the block, else attach to an existing one
+        :param lock: lock serializing the writers of all processes (i.e. a multiprocessing.Lock inherited by the
+        workers), a new multiprocessing.Lock when None
+        """
+        if lock is None:
+            import multiprocessing
+            lock = multiprocessing.Lock()
+        self._lock = lock
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER.size + slots * _RECORD.size)
+            self._shm.buf[:_HEADER.size + slots * _RECORD.size] = bytes(_HEADER.size + slots * _RECORD.size)
+            _HEADER.pack_into(self._shm.buf, 0, _MAGIC, slots)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            magic, slots = _HEADER.unpack_from(self._shm.buf, 0)
+            if magic != _MAGIC:
+                raise ValueError("{} isn't an eakon state table".format(name))
+        self.slots = slots
+        self._buf = self._shm.buf
+        self._index = {}
+        self.retries = 0
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        """
+        Attaches to an existing table
+        :param name:
+        :param lock: lock shared with the other processes
+        :return: SharedStateTable
+        """
+        return cls(name, create=False, lock=lock)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __getstate__(self):
+        # workers attach to the same block (the lock can only be passed when spawning the worker)
+        return {"name": self.name, "lock": self._lock}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], create=False, lock=state["lock"])
+
+    def _offset(self, slot) -> int:
+        if not 0 <= slot < self.slots:
+            raise IndexError("slot {} out of range".format(slot))
+        return _HEADER.size + slot * _RECORD.size
+
+    # --- seqlock ---
+
+    def _read(self, slot) -> tuple:
+        offset = self._offset(slot)
+        for _ in range(_MAX_RETRIES):
+            version, = _VERSION.unpack_from(self._buf, offset)
+            if version & 1 == 0:
+                record = _RECORD.unpack_from(self._buf, offset)
+                if record[0] == version:
+                    return record
+            self.retries += 1
+        return self._locked_read(slot, offset)
+
+    def _locked_read(self, slot, offset) -> tuple:
+        if not self._lock.acquire(timeout=_LOCK_TIMEOUT):
+            raise TimeoutError("slot {} is being written for too long".format(slot))
+        try:
+            record = _RECORD.unpack_from(self._buf, offset)
+        finally:
+            self._lock.release()
+        if record[0] & 1:
+            # no writer holds the lock : the one writing the record died
+            raise RuntimeError("slot {} was left half written".format(slot))
+        return record
+
+    def _write_state(self, slot, values):
+        offset = self._offset(slot)
+        with self._lock:
+            version, = _VERSION.unpack_from(self._buf, offset)
+            _VERSION.pack_into(self._buf, offset, version + 1)
+            _STATE.pack_into(self._buf, offset + _STATE_OFFSET, *values)
+            _VERSION.pack_into(self._buf, offset, version + 2)
+
+    # --- slots ---
+
+    def slot(self, unit_id: str, model=None) -> int:
+        """
+        Slot of a unit
+        :param unit_id:
+        :param model: HVAC subclass, allocates a slot for the unit when given and it has none
+        :return: slot index
+        """
+        key = unit_id.encode()
+        if len(key) > 32:
+            raise ValueError("unit id {} is longer than 32 bytes".format(unit_id))
+        slot = self._index.get(unit_id)
+        if slot is not None and self._read(slot)[1].rstrip(b"\0") == key:
+            return slot
+        with self._lock:
+            free = None
+            for slot in range(self.slots):
+                # no writer can be active : records are read as is, which would otherwise wait for the lock
+                version, record_id = _RECORD.unpack_from(self._buf, self._offset(slot))[:2]
+                if version & 1:
+                    logging.warning("state table slot {} was left half written, skipping it".format(slot))
+                    continue
+                record_id = record_id.rstrip(b"\0")
+                if record_id == key:
+                    self._index[unit_id] = slot
+                    return slot
+                if not record_id and free is None:
+                    free = slot
+            if model is None:
+                raise KeyError("unknown unit {}".format(unit_id))
+            if free is None:
+                raise MemoryError("state table is full ({} slots)".format(self.slots))
+            offset = self._offset(free)
+            version, = _VERSION.unpack_from(self._buf, offset)
+            state = [_UNSET] * len(_FIELDS) + [_NO_TEMPERATURE]
+            _RECORD.pack_into(self._buf, offset, version + 1, key, model.__name__.lower().encode(), *state)
+            _VERSION.pack_into(self._buf, offset, version + 2)
+            self._index[unit_id] = free
+            return free
+
+    def release(self, unit_id: str):
+        """
+        Frees the slot of a unit
+        :param unit_id:
+        """
+        slot = self.slot(unit_id)
+        offset = self._offset(slot)
+        with self._lock:
+            version, = _VERSION.unpack_from(self._buf, offset)
+            _RECORD.pack_into(self._buf, offset, version + 1, b"", b"", *([_UNSET] * len(_FIELDS)),
+                              _NO_TEMPERATURE)
+            _VERSION.pack_into(self._buf, offset, version + 2)
+        self._index.pop(unit_id, None)
+
+    def units(self) -> dict:
+        """
+        Units in the table
+        :return: dict of unit id -> model name
+        """
+        units = {}
+        for slot in range(self.slots):
+            record = self._read(slot)
+            unit_id = record[1].rstrip(b"\0").decode()
+            if unit_id:
+                units[unit_id] = record[2].rstrip(b"\0").decode()
+        return units
+
+    # --- states ---
+
+    def read(self, unit_id: str) -> dict:
+        """
+        Consistent state of a unit
+        :param unit_id:
+        :return: dict of property name -> value, as HVAC.state
+        """
+        from eakon import get_model_class
+        record = self._read(self.slot(unit_id))
+        model_class = get_model_class(record[2].rstrip(b"\0").decode())
+        return self._decode(model_class, record[3:])
+
+    def write(self, unit_id: str, model_class, state: dict):
+        """
+        Writes the state of a unit, allocating a slot if needed
+        :param unit_id:
+        :param model_class: HVAC subclass
+        :param state: dict of property name -> value, as HVAC.state
+        """
+        slot = self.slot(unit_id, model_class)
+        codec = _codec(model_class)
+        values = [codec.ordinal(i, state.get(field)) for i, field in enumerate(_FIELDS)]
+        values.append(_encode_temperature(state.get("temperature")))
+        self._write_state(slot, values)
+
+    @staticmethod
+    def _decode(model_class, values) -> dict:
+        return _codec(model_class).state(values)
+
+    def _get(self, slot, index):
+        return self._read(slot)[3 + index]
+
+    def _set(self, slot, index, value):
+        offset = self._offset(slot)
+        with self._lock:
+            version, = _VERSION.unpack_from(self._buf, offset)
+            _VERSION.pack_into(self._buf, offset, version + 1)
+            if index == len(_FIELDS):
+                struct.pack_into("<h", self._buf, offset + _STATE_OFFSET + index, value)
+            else:
+                struct.pack_into("<B", self._buf, offset + _STATE_OFFSET + index, value)
+            _VERSION.pack_into(self._buf, offset, version + 2)
+
+    # --- binding ---
+
+    def bind(self, unit, unit_id: str) -> int:
+        """
+        Binds an HVAC instance to the slot of a unit : its settings are then stored in the table.
+        When the unit already has a slot, the instance takes its state, else the slot gets the instance state.
+        :param unit: HVAC instance
+        :param unit_id:
+        :return: slot index
+        """
+        model_class = getattr(unit, "_unbound_class", type(unit))
+        model = model_class.__name__.lower()
+        try:
+            slot = self.slot(unit_id)
+            existing = self._read(slot)[2].rstrip(b"\0").decode()
+            if existing != model:
+                raise ValueError("unit {} is a {}, not a {}".format(unit_id, existing, model))
+            adopt = True
+        except KeyError:
+            slot = None
+            adopt = False
+        if not adopt:
+            state = {field: getattr(unit, "_" + field) for field in _FIELDS}
+            state["temperature"] = unit._temperature
+            self.write(unit_id, model_class, state)
+            slot = self.slot(unit_id)
+        unit._table = self
+        unit._slot = slot
+        unit.__class__ = _bound_class(model_class)
+        return slot
+
+    @staticmethod
+    def unbind(unit):
+        """
+        Unbinds an HVAC instance, which keeps the current state of its slot in its private attributes
+        :param unit:
+        """
+        model_class = getattr(unit, "_unbound_class", None)
+        if model_class is None:
+            return
+        values = {name: getattr(unit, name) for name in ["_" + field for field in _FIELDS] + ["_temperature"]}
+        unit.__class__ = model_class
+        unit.__dict__.update(values)
+        del unit._table, unit._slot
+
+    def close(self):
+        """
+        Detaches from the shared memory block
+        """
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Destroys the shared memory block (once all processes have closed it)
+        """
+        self._shm.unlink()
+
+
+def _slot_property(index, field):
+    if field == "temperature":
+        def getter(self):
+            return _decode_temperature(self._table._get(self._slot, index))
+
+        def setter(self, value):
+            self._table._set(self._slot, index, _encode_temperature(value))
+    else:
+        def getter(self):
+            return _codec(self._unbound_class).member(index, self._table._get(self._slot, index))
+
+        def setter(self, value):
+            self._table._set(self._slot, index, _codec(self._unbound_class).ordinal(index, value))
+    return property(getter, setter)
+
+
+_bound_classes = {}
+
+
+def _bound_class(model_class):
+    """
+    Subclass of a model whose private setting attributes are stored in the table slot of the instance
+    """
+    bound = _bound_classes.get(model_class)
+    if bound is None:
+        namespace = {"_" + field: _slot_property(i, field) for i, field in enumerate(_FIELDS)}
+        namespace["_temperature"] = _slot_property(len(_FIELDS), "temperature")
+        namespace["_unbound_class"] = model_class
+        namespace["state_key"] = property(lambda self: (model_class,) + model_class.state_key.fget(self)[1:])
+        namespace["capabilities"] = property(lambda self: get_capabilities(model_class, self._enum))
+        namespace["__module__"] = model_class.__module__
+        namespace["__doc__"] = model_class.__doc__
+        bound = _bound_classes[model_class] = type(model_class.__name__, (model_class,), namespace)
+        logging.debug("created shared state bound class of {}".format(model_class.__name__))
+    return bound
+
+
+_CACHE_MAGIC = b"EAKW"
+_CACHE_HEADER = struct.Struct("<4sIIIQQ")
+_SLOT_HEADER = struct.Struct("<III4x16s")
+_TICK_OFFSET = 12
+_UINT16_MAX = 0xFFFF
+
+
+_model_tags = {}
+
+
+def wave_key(unit) -> bytes:
+    """
+    Key of the wave of a unit in its current state, identical in all processes
+    :param unit: HVAC instance
+    :return: 16 bytes : a tag of the model name (and of the calibration profile, if any), and the packed state (see
+    eakon.packing)
+    """
+    model_class = getattr(unit, "_unbound_class", type(unit))
+    profile = unit._profile
+    tag = _model_tags.get((model_class, profile))
+    if tag is None:
+        name = model_class.__name__ if profile is None else "{}{}".format(model_class.__name__, tuple(profile))
+        tag = _model_tags[(model_class, profile)] = hashlib.blake2b(name.encode(), digest_size=4).digest()
+    return tag + pack_state(unit)
+
+
+class SharedWaveCache:
+    """
+    Wave cache in shared memory, shared by the worker processes
+    """
+
+    def __init__(self, name=None, slots: int = 1024, slot_pulses: int = 1024, ways: int = 8, create: bool = True,
+                 lock=None):
+        """
+        :param name: shared memory block name, generated when None
+        :param slots: number of waves the cache can hold (when creating it)
+        :param slot_pulses: maximum number of durations of a wave (when creating it), longer waves aren't cached
+        :param ways: number of slots a key may be stored in
+        :param create: create the block, else attach to an existing one
+        :param lock: lock serializing the writers of all processes, a new multiprocessing.Lock when None
+        """
+        if lock is None:
+            import multiprocessing
+            lock = multiprocessing.Lock()
+        self._lock = lock
+        if create:
+            size = _CACHE_HEADER.size + slots * (_SLOT_HEADER.size + 2 * slot_pulses)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+            _CACHE_HEADER.pack_into(self._shm.buf, 0, _CACHE_MAGIC, slots, slot_pulses, 0, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            magic, slots, slot_pulses = _CACHE_HEADER.unpack_from(self._shm.buf, 0)[:3]
+            if magic != _CACHE_MAGIC:
+                raise ValueError("{} isn't an eakon wave cache".format(name))
+        self.slots = slots
+        self.slot_pulses = slot_pulses
+        self.ways = max(1, min(ways, slots))
+        self._slot_size = _SLOT_HEADER.size + 2 * slot_pulses
+        self._buf = self._shm.buf
+        self._durations = self._buf.cast("B")
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+        self.uncacheable = 0
+
+    @classmethod
+    def attach(cls, name, ways: int = 8, lock=None):
+        """
+        Attaches to an existing cache
+        :param name:
+        :param ways: same as the other processes
+        :param lock: lock shared with the other processes
+        :return: SharedWaveCache
+        """
+        return cls(name, ways=ways, create=False, lock=lock)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __getstate__(self):
+        return {"name": self.name, "ways": self.ways, "lock": self._lock}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], ways=state["ways"], create=False, lock=state["lock"])
+
+    def _slot_offset(self, slot) -> int:
+        return _CACHE_HEADER.size + slot * self._slot_size
+
+    def _ways(self, key):
+        first = zlib.crc32(key) % self.slots
+        for way in range(self.ways):
+            yield (first + way) % self.slots
+
+    def _tick(self) -> int:
+        # not atomic : concurrent readers may lose a tick, which only makes the LRU approximate
+        tick = struct.unpack_from("<I", self._buf, _TICK_OFFSET)[0] + 1 & 0xFFFFFFFF
+        struct.pack_into("<I", self._buf, _TICK_OFFSET, tick)
+        return tick
+
+    def lookup(self, key: bytes):
+        """
+        Looks a wave up
+        :param key: see wave_key
+        :return: read-only memoryview of the uint16 durations, or None. The view is only guaranteed to be valid as
+        long as the wave isn't evicted : use get for a copy.
+        """
+        for slot in self._ways(key):
+            offset = self._slot_offset(slot)
+            for _ in range(_MAX_RETRIES):
+                version, length, _, slot_key = _SLOT_HEADER.unpack_from(self._buf, offset)
+                if version & 1:
+                    self.retries += 1
+                    continue
+                if slot_key != key or not length:
+                    break
+                view = self._durations[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + 2 * length]
+                if struct.unpack_from("<I", self._buf, offset)[0] != version:
+                    self.retries += 1
+                    continue
+                struct.pack_into("<I", self._buf, offset + 8, self._tick())
+                self.hits += 1
+                return view.toreadonly().cast("H")
+            else:
+                self._repair(slot, offset)
+        self.misses += 1
+        return None
+
+    def _repair(self, slot, offset):
+        """
+        Called when a slot keeps being written : waits for its writer, and empties the slot if the writer died while
+        writing it (the wave being then a miss)
+        """
+        if not self._lock.acquire(timeout=_LOCK_TIMEOUT):
+            raise TimeoutError("slot {} is being written for too long".format(slot))
+        try:
+            version = struct.unpack_from("<I", self._buf, offset)[0]
+            if version & 1:
+                logging.warning("wave cache slot {} was left half written, emptying it".format(slot))
+                _SLOT_HEADER.pack_into(self._buf, offset, version, 0, 0, bytes(16))
+                struct.pack_into("<I", self._buf, offset, version + 1)
+        finally:
+            self._lock.release()
+
+    def insert(self, key: bytes, wave) -> bool:
+        """
+        Stores a wave, evicting the least recently used one of its set if needed
+        :param key: see wave_key
+        :param wave: sequence of durations in microseconds
+        :return: False when the wave can't be cached (too long, or durations over 65535us)
+        """
+        if len(wave) > self.slot_pulses or max(wave, default=0) > _UINT16_MAX:
+            self.uncacheable += 1
+            return False
+        from array import array
+        data = array("H", wave).tobytes()
+        with self._lock:
+            victim = None
+            for slot in self._ways(key):
+                version, length, tick, slot_key = _SLOT_HEADER.unpack_from(self._buf, self._slot_offset(slot))
+                if slot_key == key and length:
+                    return True
+                if not length:
+                    victim, victim_tick = slot, -1
+                    break
+                if victim is None or tick < victim_tick:
+                    victim, victim_tick = slot, tick
+            offset = self._slot_offset(victim)
+            version = struct.unpack_from("<I", self._buf, offset)[0]
+            struct.pack_into("<I", self._buf, offset, version + 1)
+            self._buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(data)] = data
+            _SLOT_HEADER.pack_into(self._buf, offset, version + 1, len(wave), self._tick(), key)
+            struct.pack_into("<I", self._buf, offset, version + 2)
+            magic, slots, slot_pulses, tick, inserts, evictions = _CACHE_HEADER.unpack_from(self._buf, 0)
+            _CACHE_HEADER.pack_into(self._buf, 0, magic, slots, slot_pulses, tick, inserts + 1,
+                                    evictions + (victim_tick >= 0))
+        return True
+
+    def get(self, key: bytes):
+        """
+        Copy of a cached wave
+        :param key: see wave_key
+        :return: tuple of durations, or None
+        """
+        while True:
+            view = self.lookup(key)
+            if view is None:
+                return None
+            wave = tuple(view)
+            # the slot may have been rewritten while copying
+            if self.lookup(key) is not None:
+                self.hits -= 1
+                return wave
+
+    def wave(self, unit):
+        """
+        Wave of a unit in its current state, encoded (and cached) on a miss
+        :param unit: HVAC instance
+        :return: memoryview of uint16 durations, or a list when the wave can't be cached
+        """
+        key = wave_key(unit)
+        view = self.lookup(key)
+        if view is None:
+            wave = unit._get_wave()
+            if not self.insert(key, wave):
+                return wave
+            view = self.lookup(key)
+            if view is None:
+                return wave
+            self.hits -= 1
+        return view
+
+    def stats(self) -> dict:
+        """
+        Statistics of the cache : hits, misses and retries are those of this process, inserts and evictions those of
+        all processes
+        :return: dict
+        """
+        inserts, evictions = _CACHE_HEADER.unpack_from(self._buf, 0)[4:]
+        used = sum(1 for slot in range(self.slots)
+                   if _SLOT_HEADER.unpack_from(self._buf, self._slot_offset(slot))[1])
+        lookups = self.hits + self.misses
+        return {"slots": self.slots, "used": used, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0., "retries": self.retries,
+                "uncacheable": self.uncacheable, "inserts": inserts, "evictions": evictions}
+
+    def close(self):
+        """
+        Detaches from the shared memory block
+        """
+        self._durations.release()
+        self._buf = self._durations = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Destroys the shared memory block (once all processes have closed it)
+        """
+        self._shm.unlink()
+
+
+def _worker(table, unit_id, temperatures):
+    from eakon.daikin import Daikin
+    unit = Daikin()
+    table.bind(unit, unit_id)
+    for temperature in temperatures:
+        unit.temperature = temperature
+    table.close()
+
+
+def _demo_shared_state():
+    import multiprocessing
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+    table = SharedStateTable(slots=16)
+    try:
+        living = Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=25)
+        table.bind(living, "living")
+        workers = [multiprocessing.Process(target=_worker, args=(table, "living", range(18, 18 + i)))
+                   for i in range(1, 5)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        print(table.units(), table.read("living"))
+        print(living.mode, living.temperature, living.wave[:8])
+        table.unbind(living)
+        print(type(living), living.temperature)
+    finally:
+        table.close()
+        table.unlink()
+
+
+_bench_cache = None
+
+
+def _bench_init(cache):
+    # the cache lock can only be passed to the workers when they start
+    global _bench_cache
+    _bench_cache = cache
+
+
+def _bench_worker(args):
+    from time import process_time
+    import random
+    cache = _bench_cache
+    states, lookups, seed = args
+    from eakon.daikin import Daikin
+    random.seed(seed)
+    units = [Daikin(**state) for state in states]
+    local = {}
+    encodes = 0
+    start = process_time()
+    for _ in range(lookups):
+        # popular states first : a few states make most of the requests
+        unit = units[min(int(random.paretovariate(0.8)) - 1, len(units) - 1)]
+        if cache is None:
+            key = unit.state_key
+            wave = local.get(key)
+            if wave is None:
+                wave = local[key] = tuple(unit._get_wave())
+                encodes += 1
+        else:
+            misses = cache.misses
+            wave = cache.wave(unit)
+            encodes += cache.misses - misses
+        sum(wave)
+    elapsed = process_time() - start
+    memory = sum(2 * len(wave) for wave in local.values())
+    hit_rate = cache.stats()["hit_rate"] if cache is not None else 1 - encodes / lookups
+    return elapsed, encodes, memory, hit_rate
+
+
+def _bench_shared_wave_cache(workers=8, lookups=5000):
+    import multiprocessing
+    from eakon.daikin import Daikin
+    states = list(Daikin.iter_states())
+    for shared in (False, True):
+        cache = SharedWaveCache(slots=1024, slot_pulses=1024) if shared else None
+        try:
+            with multiprocessing.Pool(workers, initializer=_bench_init, initargs=(cache,)) as pool:
+                results = pool.map(_bench_worker, [(states, lookups, seed) for seed in range(workers)])
+            print("{:<18} {} workers : {:.2f}s of cpu, {} encodes, hit rate {:.3f}, {} KiB of private cache".format(
+                "shared cache" if shared else "per-process cache", workers, sum(r[0] for r in results),
+                sum(r[1] for r in results), sum(r[3] for r in results) / workers, sum(r[2] for r in results) // 1024))
+            if shared:
+                stats = cache.stats()
+                print("shared arena : {} KiB, {} waves, {} inserts, {} evictions".format(
+                    cache.slots * cache._slot_size // 1024, stats["used"], stats["inserts"], stats["evictions"]))
+        finally:
+            if cache is not None:
+                cache.close()
+                cache.unlink()
+
+
+if __name__ == '__main__':
+    _demo_shared_state()
+    _bench_shared_wave_cache()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Simulated air conditioner receivers, for load testing the command pipeline without real units.
+
+Receivers consume pulse buffers (mark/space durations in microseconds) as a real IR receiver would : they check the
+header, the timings and the checksums, update their unit (an instance of the model) and count accepted and rejected
+commands. SimTransmitter plugs them behind a Scheduler or a Plan, many receivers running in one asyncio loop :
+
+    simulation = Simulation()
+    simulation.add("living", "daikin", emitter="led1")
+    scheduler = Scheduler(simulation.transmitter)
+    async with simulation:
+        await scheduler.submit("living", fleet["living"], emitter="led1")
+    simulation["living"].unit.state
+"""
+import asyncio
+import random
+
+from eakon.scheduler import Transmitter
+from eakon.sim.daikin import DaikinReceiver
+from eakon.sim.hitachi import HitachiReceiver
+from eakon.sim.panasonic import PanasonicReceiver
+from eakon.sim.receiver import DecodeError, Receiver
+from eakon.sim.toshiba import ToshibaReceiver
+
+__all__ = ["DecodeError", "Receiver", "DaikinReceiver", "HitachiReceiver", "PanasonicReceiver", "ToshibaReceiver",
+           "get_receiver_class", "SimTransmitter", "Simulation"]
+
+RECEIVERS = {receiver.model: receiver for receiver in (DaikinReceiver, HitachiReceiver, PanasonicReceiver,
+                                                       ToshibaReceiver)}
+
+
+def get_receiver_class(model: str):
+    """
+    Simulated receiver class of a model
+    :param model: model name
+    :return: Receiver subclass
+    """
+    try:
+        return RECEIVERS[model.lower()]
+    except KeyError:
+        raise NotImplementedError("no simulated receiver for model {}".format(model))
+
+
+class SimTransmitter(Transmitter):
+    """
+    Transmitter delivering the waves to the simulated receivers an emitter reaches, optionally degrading them
+    """
+
+    def __init__(self, reach=None, realtime: bool = False, jitter: int = 0, drop_rate: float = 0., seed=None):
+        """
+        :param reach: dict of emitter -> list of receivers
+        :param realtime: when set, transmitting takes as long as the wave lasts
+        :param jitter: maximum deviation added to each duration, in microseconds
+        :param drop_rate: probability for a receiver to miss a transmission
+        :param seed: seed of the random generator used for jitter and drops
+        """
+        self.reach = reach if reach is not None else {}
+        self.realtime = realtime
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self.transmitted = 0
+        self.dropped = 0
+
+    async def transmit(self, emitter, wave):
+        if self.realtime:
+            await asyncio.sleep(sum(wave) / 1e6)
+        self.transmitted += 1
+        for receiver in self.reach.get(emitter, ()):
+            if self.drop_rate and self._random.random() < self.drop_rate:
+                self.dropped += 1
+                continue
+            if self.jitter:
+                span, draw = 2 * self.jitter + 1, self._random.random
+                receiver.deliver([max(0, duration - self.jitter + int(draw() * span)) for duration in wave])
+            else:
+                receiver.deliver(wave)
+
+
+class Simulation:
+    """
+    A set of simulated receivers, run concurrently in the asyncio loop
+    """
+
+    def __init__(self, **transmitter_options):
+        """
+        :param transmitter_options: see SimTransmitter
+        """
+        self.receivers = {}
+        self.transmitter = SimTransmitter(**transmitter_options)
+        self._tasks = []
+
+    def add(self, unit_id, model: str, emitter=None, **options) -> Receiver:
+        """
+        Adds a simulated unit
+        :param unit_id:
+        :param model: model name
+        :param emitter: emitter(s) reaching the unit, the unit id when None
+        :param options: see Receiver
+        :return: the receiver
+        """
+        receiver = self.receivers[unit_id] = get_receiver_class(model)(unit_id, **options)
+        emitters = [unit_id] if emitter is None else emitter if isinstance(emitter, (list, tuple, set)) else [emitter]
+        for name in emitters:
+            self.transmitter.reach.setdefault(name, []).append(receiver)
+        if self._tasks:
+            self._tasks.append(asyncio.ensure_future(receiver.run()))
+        return receiver
+
+    def __getitem__(self, unit_id) -> Receiver:
+        return self.receivers[unit_id]
+
+    def start(self):
+        """
+        Starts the receivers tasks (in the running loop)
+        """
+        self._tasks = [asyncio.ensure_future(receiver.run()) for receiver in self.receivers.values()]
+
+    async def drain(self):
+        """
+        Waits until all the delivered pulse buffers have been handled
+        """
+        await asyncio.gather(*(receiver.inbox.join() for receiver in self.receivers.values()))
+
+    async def stop(self):
+        """
+        Handles the pending pulse buffers, then stops the receivers
+        """
+        await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    def stats(self) -> dict:
+        """
+        Statistics of all the receivers
+        :return: dict of accepted, rejected and rejection reasons counts
+        """
+        stats = {"accepted": 0, "rejected": 0, "reasons": {}}
+        for receiver in self.receivers.values():
+            stats["accepted"] += receiver.accepted
+            stats["rejected"] += receiver.rejected
+            for reason, count in receiver.reasons.items():
+                stats["reasons"][reason] = stats["reasons"].get(reason, 0) + count
+        return stats
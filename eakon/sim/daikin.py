@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Simulated Daikin receiver
+"""
+from eakon.sim.receiver import DecodeError, Receiver, reverse_byte
+
+_HEADER = (0x11, 0xda, 0x27)
+
+
+class DaikinReceiver(Receiver):
+    """
+    Daikin ARC478A5 receiver : a preamble, then two frames of 20 and 19 bytes (least significant bit first), each
+    starting with the 11 DA 27 header and ending with a checksum
+    """
+    model = "daikin"
+
+    def _set_profile(self, profile):
+        super()._set_profile(profile)
+        self._preamble = (profile.mark, profile.zero_space) * 5
+        self._frame_start = (profile.mark, profile.gap, profile.header_mark, profile.header_space)
+
+    def _frame(self, pulses, position, length) -> tuple:
+        position = self._expect(pulses, position, self._frame_start)
+        data, position = self._bytes(pulses, position, length)
+        data = [reverse_byte(byte) for byte in data]
+        if tuple(data[:3]) != _HEADER:
+            raise DecodeError("header", "frame header {}".format(data[:3]))
+        if sum(data[:-1]) & 0xff != data[-1]:
+            raise DecodeError("checksum")
+        return data, position
+
+    def decode(self, pulses) -> dict:
+        enum = self._enum
+        position = self._expect(pulses, 0, self._preamble)
+        frame1, position = self._frame(pulses, position, 20)
+        frame2, position = self._frame(pulses, position, 19)
+        position = self._expect(pulses, position, (self.mark,), "trailer")
+        if position != len(pulses):
+            raise DecodeError("length")
+        try:
+            power = enum.Power(frame2[5] & 0xf)
+            mode = enum.Mode(frame2[5] >> 4)
+            fan_power = enum.FanPower(frame2[8] >> 4)
+            if frame2[8] & 0xf == 0xf:
+                fan_vertical_mode = enum.FanVerticalMode.SWING
+            else:
+                fan_vertical_mode = enum.FanVerticalMode(frame1[12])
+        except ValueError as exc:
+            raise DecodeError("value", str(exc))
+        if (frame1[11] == 0x00) != (power == enum.Power.ON):
+            raise DecodeError("value", "frames disagree on the power")
+        settings = {"power": power, "mode": mode, "fan_power": fan_power, "fan_vertical_mode": fan_vertical_mode}
+        if mode in (enum.Mode.COOL, enum.Mode.HEAT):
+            settings["temperature"] = frame2[6] // 2
+        return settings
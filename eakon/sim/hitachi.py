@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Simulated Hitachi receiver
+"""
+from eakon.sim.receiver import DecodeError, Receiver
+
+_HEADER = (0x80, 0x08, 0x00)
+_REVERSED_NIBBLE = tuple(int("{:04b}".format(nibble)[::-1], 2) for nibble in range(16))
+
+
+class HitachiReceiver(Receiver):
+    """
+    Hitachi SP-RC4 receiver : a 3 bytes header then 25 bytes, each followed by its complement
+    """
+    model = "hitachi"
+    _temp_min = 16
+    _temp_max = 32
+
+    def _set_profile(self, profile):
+        super()._set_profile(profile)
+        # the leader mark isn't part of the profile timings
+        self._frame_start = (self.unit.leader_mark, profile.gap, profile.header_mark, profile.header_space)
+
+    def decode(self, pulses) -> dict:
+        enum = self._enum
+        position = self._expect(pulses, 0, self._frame_start)
+        data, position = self._bytes(pulses, position, 53)
+        position = self._expect(pulses, position, (self.mark,), "trailer")
+        if position != len(pulses):
+            raise DecodeError("length")
+        if tuple(data[:3]) != _HEADER:
+            raise DecodeError("header", "frame header {}".format(data[:3]))
+        values = data[3::2]
+        if any(value ^ 0xff != complement for value, complement in zip(values, data[4::2])):
+            raise DecodeError("checksum", "complement mismatch")
+        # values[i] is the byte b(2i + 1) of the frame
+        temperature_code = values[5]
+        if temperature_code & 0x3 == 1:
+            temperature = self._temp_max
+        else:
+            temperature = _REVERSED_NIBBLE[temperature_code >> 2 & 0xf] + self._temp_min
+        try:
+            return {
+                "temperature": temperature,
+                "mode": enum.Mode(values[11]),
+                "power": enum.Power(values[12]),
+            }
+        except ValueError as exc:
+            raise DecodeError("value", str(exc))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Simulated Panasonic receiver
+"""
+from eakon.sim.receiver import DecodeError, Receiver, reverse_byte
+
+_HEADER = (0x02, 0x20, 0xe0, 0x04, 0x00)
+
+
+class PanasonicReceiver(Receiver):
+    """
+    Panasonic ACRA75C receiver : a frame of 19 bytes (least significant bit first) ending with a checksum
+    """
+    model = "panasonic"
+
+    def _set_profile(self, profile):
+        super()._set_profile(profile)
+        self._frame_start = (profile.header_mark, profile.header_space)
+
+    def decode(self, pulses) -> dict:
+        enum = self._enum
+        position = self._expect(pulses, 0, self._frame_start)
+        data, position = self._bytes(pulses, position, 19)
+        position = self._expect(pulses, position, (self.mark,), "trailer")
+        if position != len(pulses):
+            raise DecodeError("length")
+        data = [reverse_byte(byte) for byte in data]
+        if tuple(data[:5]) != _HEADER:
+            raise DecodeError("header", "frame header {}".format(data[:5]))
+        if sum(data[:-1]) & 0xff != data[-1]:
+            raise DecodeError("checksum")
+        fan = reverse_byte(data[8])
+        try:
+            return {
+                "power": enum.Power(data[5] & 0x0f),
+                "mode": enum.Mode(data[5] & 0xf0),
+                "temperature": reverse_byte(data[6]) // 2,
+                "fan_vertical_mode": enum.FanVerticalMode(fan & 0xf0),
+                "fan_power": enum.FanPower(fan & 0x0f),
+                "fan_high_power": enum.FanHighPower(data[13] & 0xfd),
+                "room_clean": enum.RoomClean(data[13] & 0x02),
+            }
+        except ValueError as exc:
+            raise DecodeError("value", str(exc))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Base class of the simulated receivers : decoding helpers, statistics and the asyncio inbox.
+"""
+import abc
+import asyncio
+import logging
+from collections import Counter
+
+_REVERSED = tuple(int("{:08b}".format(byte)[::-1], 2) for byte in range(256))
+
+
+def reverse_byte(byte: int) -> int:
+    """
+    Byte with its bits in the reverse order
+    :param byte:
+    :return:
+    """
+    return _REVERSED[byte]
+
+
+class DecodeError(ValueError):
+    """
+    Raised when a pulse buffer isn't a valid command, reason being a short identifier of the failed check
+    """
+
+    def __init__(self, reason, message=None):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class Receiver(abc.ABC):
+    """
+    Simulated IR receiver of an air conditioner : it decodes the pulse buffers it gets, checks their header, timings
+    and checksums, and applies valid commands to its unit (an instance of the model).
+    The expected timings are the ones of a calibration profile of the model, the default one unless given.
+    Subclasses implement decode, and extend _set_profile for the timings of their frames.
+    """
+    model = None
+    mark = None
+    one_space = None
+    zero_space = None
+
+    def __init__(self, unit_id=None, tolerance: float = 0.25, min_tolerance: int = 150, profile=None):
+        """
+        :param unit_id:
+        :param tolerance: accepted relative deviation of the durations
+        :param min_tolerance: accepted deviation of the durations in microseconds, for short ones
+        :param profile: eakon.calibration.Profile or profile name of the remote, the model timings when None
+        """
+        from eakon import get_model_class
+        from eakon.calibration import default_profile, get_profile
+        self.unit_id = unit_id
+        self.tolerance = tolerance
+        self.min_tolerance = min_tolerance
+        if profile is None:
+            profile = default_profile(self.model)
+        elif isinstance(profile, str):
+            profile = get_profile(self.model, profile)
+        self.unit = get_model_class(self.model)()
+        self._enum = self.unit._enum
+        self._set_profile(profile)
+        self.accepted = 0
+        self.rejected = 0
+        self.reasons = Counter()
+        self.inbox = asyncio.Queue()
+        self.last_error = None
+
+    def _set_profile(self, profile):
+        """
+        Sets the expected timings
+        :param profile: eakon.calibration.Profile
+        """
+        self.profile = profile
+        self.mark, self.one_space, self.zero_space = profile.mark, profile.one_space, profile.zero_space
+        self._threshold = (self.one_space + self.zero_space) / 2
+
+    # --- timing checks ---
+
+    def _matches(self, duration, expected) -> bool:
+        return abs(duration - expected) <= max(expected * self.tolerance, self.min_tolerance)
+
+    def _expect(self, pulses, position, expected, reason="header") -> int:
+        """
+        Checks the durations at a position
+        :return: position after them
+        """
+        if len(pulses) < position + len(expected):
+            raise DecodeError("truncated")
+        for i, duration in enumerate(expected):
+            if not self._matches(pulses[position + i], duration):
+                raise DecodeError(reason, "{} : {}us at {} instead of {}us".format(
+                    reason, pulses[position + i], position + i, duration))
+        return position + len(expected)
+
+    def _bytes(self, pulses, position, count) -> tuple:
+        """
+        Decodes count bytes, most significant bit first
+        :return: (list of bytes, position after them)
+        """
+        end = position + 16 * count
+        if len(pulses) < end:
+            raise DecodeError("truncated")
+        mark, one_space, zero_space, threshold = self.mark, self.one_space, self.zero_space, self._threshold
+        data = []
+        byte = 0
+        for i in range(position, end, 2):
+            if not self._matches(pulses[i], mark):
+                raise DecodeError("timing", "mark of {}us at {}".format(pulses[i], i))
+            space = pulses[i + 1]
+            bit = space > threshold
+            if not self._matches(space, one_space if bit else zero_space):
+                raise DecodeError("timing", "space of {}us at {}".format(space, i + 1))
+            byte = byte << 1 | bit
+            if (i - position) % 16 == 14:
+                data.append(byte)
+                byte = 0
+        return data, end
+
+    # --- decoding ---
+
+    @abc.abstractmethod
+    def decode(self, pulses) -> dict:
+        """
+        Decodes a pulse buffer
+        :param pulses: sequence of mark/space durations in microseconds
+        :return: dict of property name -> value, for the settings the command carries
+        :raise DecodeError:
+        """
+
+    def receive(self, pulses) -> bool:
+        """
+        Handles a pulse buffer as the unit would : valid commands update the unit, others are ignored
+        :param pulses:
+        :return: True if the command was accepted
+        """
+        try:
+            settings = self.decode(pulses)
+        except DecodeError as exc:
+            self.rejected += 1
+            self.reasons[exc.reason] += 1
+            self.last_error = exc
+            return False
+        for field, value in settings.items():
+            setattr(self.unit, field, value)
+        self.accepted += 1
+        return True
+
+    # --- asyncio ---
+
+    def deliver(self, pulses):
+        """
+        Queues a pulse buffer, handled by run
+        :param pulses:
+        """
+        self.inbox.put_nowait(pulses)
+
+    async def run(self):
+        """
+        Handles the delivered pulse buffers until cancelled
+        """
+        while True:
+            pulses = await self.inbox.get()
+            try:
+                self.receive(pulses)
+            except Exception:
+                logging.exception("receiver {} failed".format(self.unit_id))
+            finally:
+                self.inbox.task_done()
+
+    def stats(self) -> dict:
+        """
+        :return: dict of accepted, rejected and rejection reasons counts
+        """
+        return {"accepted": self.accepted, "rejected": self.rejected, "reasons": dict(self.reasons)}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Simulated Toshiba receiver
+"""
+from eakon.sim.receiver import DecodeError, Receiver
+
+_HEADER = (0xc2, 0x3d)
+# temperature code -> temperature, 16 and 17 sharing the code 0 (told apart by the footer)
+_TEMPERATURES = {0: 17, 1: 18, 3: 19, 2: 20, 6: 21, 7: 22, 5: 23, 4: 24, 12: 25, 13: 26, 9: 27, 8: 28, 10: 29, 11: 30}
+
+
+class ToshibaReceiver(Receiver):
+    """
+    Toshiba RG66J5 receiver : a 6 bytes frame sent twice, each nibble being followed by its complement, then a 6
+    bytes footer
+    """
+    model = "toshiba"
+
+    def _set_profile(self, profile):
+        super()._set_profile(profile)
+        self._frame_start = (profile.header_mark, profile.header_space)
+        self._repeat = (profile.gap, profile.header_mark, profile.header_space)
+
+    def decode(self, pulses) -> dict:
+        enum = self._enum
+        position = self._expect(pulses, 0, self._frame_start)
+        frame, position = self._bytes(pulses, position, 6)
+        position = self._expect(pulses, position, (self.mark,) + self._repeat, "repeat")
+        repeated, position = self._bytes(pulses, position, 6)
+        position = self._expect(pulses, position, (self.mark,) + self._repeat, "repeat")
+        footer, position = self._bytes(pulses, position, 6)
+        position = self._expect(pulses, position, (self.mark,), "trailer")
+        if position != len(pulses):
+            raise DecodeError("length")
+        if tuple(frame[:2]) != _HEADER:
+            raise DecodeError("header", "frame header {}".format(frame[:2]))
+        if repeated != frame:
+            raise DecodeError("checksum", "repeated frame differs")
+        # n5 n6 / n7 n8 / n9 n10 / n11 n12 : n7 = ~n5, n11 = ~n9, n12 = ~n10
+        n5, n7 = frame[2] >> 4, frame[3] >> 4
+        n9, n10, n11, n12 = frame[4] >> 4, frame[4] & 0xf, frame[5] >> 4, frame[5] & 0xf
+        if n7 != n5 ^ 0xf or n11 != n9 ^ 0xf or n12 != n10 ^ 0xf:
+            raise DecodeError("checksum", "complement mismatch")
+        if footer[0] != 0xd5:
+            raise DecodeError("header", "footer header {:02x}".format(footer[0]))
+        try:
+            mode = enum.Mode(n10)
+            temperature = _TEMPERATURES[n9]
+        except (ValueError, KeyError) as exc:
+            raise DecodeError("value", str(exc))
+        if temperature == 17 and footer[3] == 0x10:
+            temperature = 16
+        return {"mode": mode, "temperature": temperature}
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Lazy enumeration of all the valid states of a model.
+A state is a dictionary of property name -> value, which can be passed as is to the model constructor.
+
+States are ordered by mode first, then by the other fields (in the order of capabilities.FIELDS, temperature last),
+so that each state has a stable ordinal index : large state spaces can be split in ranges of indexes and processed by
+several workers without ever being materialized.
+"""
+from bisect import bisect_right
+from itertools import product
+
+from eakon.capabilities import FIELDS, get_capabilities
+
+_EXCLUDED_NAMES = ("UNDEFINED", "NOT_AVAILABLE")
+
+
+class StateSpace:
+    """
+    Constrained state space of a model.
+    Constraints are given per field, either as a single value (fixing the field) or as an iterable of values
+    (restricting the field), values being enumeration members, option names, or temperatures.
+    When dedupe is set, fields which have no effect in a given mode (see Capabilities.ignored_fields) are set to None,
+    so that equivalent states are only enumerated once.
+    """
+
+    def __init__(self, model_class, exclude=None, dedupe=True, **constraints):
+        self.model_class = model_class
+        self.capabilities = capabilities = get_capabilities(model_class)
+        self.dedupe = dedupe
+        self.fields = capabilities.fields
+        unknown = set(constraints) - set(self.fields) | set(exclude or {}) - set(self.fields)
+        if unknown:
+            raise KeyError("{} has no field {}".format(capabilities.model, ", ".join(sorted(unknown))))
+
+        options = {}
+        for field in self.fields:
+            values = self._field_options(field)
+            if field in constraints:
+                allowed = self._normalize(field, constraints[field])
+                values = tuple(v for v in values if v in allowed)
+            if exclude and field in exclude:
+                excluded = self._normalize(field, exclude[field])
+                values = tuple(v for v in values if v not in excluded)
+            options[field] = values
+        self.options = options
+
+        # one block per mode, each block being a mixed radix number over the other fields
+        self._other_fields = tuple(field for field in self.fields if field != "mode")
+        modes = options.get("mode", (None,))
+        self._blocks = []
+        self._offsets = []
+        size = 0
+        for mode in modes:
+            radices = tuple(self._block_options(mode, field) for field in self._other_fields)
+            block_size = 1
+            for values in radices:
+                block_size *= len(values)
+            if block_size:
+                self._offsets.append(size)
+                self._blocks.append((mode, radices, block_size))
+                size += block_size
+        self._size = size
+        self._mode_blocks = {mode: i for i, (mode, _, _) in enumerate(self._blocks)}
+
+    def _field_options(self, field):
+        if field == "temperature":
+            return self.capabilities.temperatures
+        enum = self.capabilities.enums[FIELDS[field]]
+        return tuple(member for member in enum if member.name not in _EXCLUDED_NAMES)
+
+    def _block_options(self, mode, field):
+        if self.dedupe and mode is not None and not self.capabilities.is_relevant(field, mode):
+            return (None,) if self.options[field] else ()
+        return self.options[field]
+
+    def _normalize(self, field, values):
+        if isinstance(values, (str, int, float)) or hasattr(values, "name"):
+            values = (values,)
+        if field == "temperature":
+            return set(values)
+        enum = self.capabilities.enums[FIELDS[field]]
+        return {enum[v] if isinstance(v, str) else v for v in values}
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        other_fields = self._other_fields
+        has_mode = "mode" in self.options
+        for mode, radices, _ in self._blocks:
+            for values in product(*radices):
+                state = dict(zip(other_fields, values))
+                if has_mode:
+                    state["mode"] = mode
+                yield state
+
+    def __contains__(self, state):
+        try:
+            self.state_to_index(state)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def state_to_index(self, state) -> int:
+        """
+        Returns the ordinal index of a state in this space
+        :param state: dict of property name -> value, or an HVAC instance
+        :return: int
+        """
+        if not isinstance(state, dict):
+            state = {field: getattr(state, field) for field in self.fields}
+        block = self._mode_blocks.get(state.get("mode"))
+        if block is None:
+            raise ValueError("mode {} is not part of this state space".format(state.get("mode")))
+        mode, radices, _ = self._blocks[block]
+        index = 0
+        for field, values in zip(self._other_fields, radices):
+            if values == (None,):
+                digit = 0
+            else:
+                try:
+                    digit = values.index(state[field])
+                except ValueError:
+                    raise ValueError("{}={} is not part of this state space".format(field, state[field]))
+            index = index * len(values) + digit
+        return self._offsets[block] + index
+
+    def index_to_state(self, index: int) -> dict:
+        """
+        Returns the state at a given ordinal index
+        :param index:
+        :return: dict of property name -> value
+        """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("state index out of range")
+        block = bisect_right(self._offsets, index) - 1
+        mode, radices, _ = self._blocks[block]
+        index -= self._offsets[block]
+        state = {}
+        for field, values in zip(reversed(self._other_fields), reversed(radices)):
+            index, digit = divmod(index, len(values))
+            state[field] = values[digit]
+        state = {field: state[field] for field in self._other_fields}
+        if "mode" in self.options:
+            state["mode"] = mode
+        return state
+
+    def shard(self, worker: int, workers: int) -> range:
+        """
+        Returns the contiguous range of indexes a worker should process
+        :param worker: index of the worker, from 0 to workers - 1
+        :param workers: number of workers
+        :return: range
+        """
+        if not 0 <= worker < workers:
+            raise ValueError("worker must be in [0, {}[".format(workers))
+        chunk, rest = divmod(self._size, workers)
+        start = worker * chunk + min(worker, rest)
+        return range(start, start + chunk + (1 if worker < rest else 0))
+
+    def iter_range(self, indexes: range):
+        """
+        Lazily yields the states of a range of indexes, i.e. a shard
+        :param indexes: range
+        :return:
+        """
+        for index in indexes:
+            yield self.index_to_state(index)
@@ -6,13 +6,13 @@ Air conditioner classes
 
 import logging
 
-import bitstring
-
-from eakon import HVAC
+from eakon import HVAC, _LazyModule
 from eakon.enums import toshiba_enum
 
+bitstring = _LazyModule("bitstring")
+
 
-class Toshiba(HVAC):
+class Toshiba(HVAC, enum=toshiba_enum):
     """
     Toshiba RG66J5
     """
@@ -23,35 +23,31 @@ class Toshiba(HVAC):
     __ZERO_SPACE = 521
     __temp_max = 30
     __temp_min = 16
-    __start_mark = [__HDR_FIRST_MARK, __HDR_FIRST_SPACE]
-    __repeat_mark = [__HDR_FIRST_SPACE, __HDR_FIRST_MARK, __HDR_FIRST_SPACE]
+    # frames are repeated after a gap as long as the header space
+    _timings = {"mark": __MARK, "one_space": __ONE_SPACE, "zero_space": __ZERO_SPACE,
+                "header_mark": __HDR_FIRST_MARK, "header_space": __HDR_FIRST_SPACE, "gap": __HDR_FIRST_SPACE}
 
     frame = None
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs, enum=toshiba_enum)
-        self.one_mark = self.__MARK
-        self.one_space = self.__ONE_SPACE
-        self.zero_mark = self.__MARK
-        self.zero_space = self.__ZERO_SPACE
+    # power and fan settings aren't encoded yet
+    _ignored_fields_by_mode = {mode.name: ("power", "fan_vertical_mode", "fan_power") for mode in toshiba_enum.Mode}
 
     def _get_wave(self):
-        wave = self.__start_mark.copy()
-        for x in self._get_bitstring():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        profile = self.profile
+        repeat_mark = [profile.gap, profile.header_mark, profile.header_space]
+        frame = self._get_pulses(self._get_bitstring())
+        wave = [profile.header_mark, profile.header_space]
+        wave.extend(frame)
+        wave.append(profile.mark)
 
-        wave.extend(self.__repeat_mark)
+        wave.extend(repeat_mark)
 
-        for x in self._get_bitstring():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        wave.extend(frame)
+        wave.append(profile.mark)
 
-        wave.extend(self.__repeat_mark)
+        wave.extend(repeat_mark)
 
-        for x in self._get_footer():
-            wave.extend(self._get_zero() if x == "0" else self._get_one())
-        wave.extend([self.__MARK])
+        wave.extend(self._get_pulses(self._get_footer()))
+        wave.append(profile.mark)
 
         return wave
 
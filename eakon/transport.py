@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""
+Transmission backends.
+
+PigpioBackend sends waves through a pigpio daemon (http://abyz.me.uk/rpi/pigpio/) :
+- connections to each daemon are kept in a bounded, health-checked pool and reused across commands,
+- a wave is modulated on the IR carrier (see eakon.modulation) and uploaded in bulk (one wave_add_generic request per
+  wave chunk) instead of pulse by pulse,
+- waves created on a daemon are kept in a bounded LRU keyed by a hash of their content, so that sending the same
+  state again is a single "send wave id" request. Evicted waves are deleted from the daemon.
+
+FakePigpio mimics the subset of the pigpio module used here, so that pooling and throughput can be tested without a
+Raspberry Pi.
+"""
+import abc
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from eakon import _LazyModule
+from eakon.scheduler import Transmitter
+
+pigpio = _LazyModule("pigpio")
+
+
+class Backend(abc.ABC):
+    """
+    Interface of the (blocking) transmission backends
+    """
+
+    @abc.abstractmethod
+    def send(self, wave):
+        """
+        Emits a wave, returning once it has been sent
+        :param wave: sequence of mark/space durations in microseconds
+        """
+
+    def close(self):
+        """
+        Releases the resources held by the backend
+        """
+
+
+class WaveIdCache:
+    """
+    Bounded LRU of the waves created on a daemon : content hash -> wave ids
+    """
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._wave_ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(wave, *params) -> bytes:
+        """
+        Content hash of a wave and of the parameters it is modulated with
+        :param wave: sequence of durations
+        :param params: i.e. gpio, frequency, duty cycle
+        :return:
+        """
+        digest = hashlib.blake2b(array("I", wave).tobytes(), digest_size=16)
+        digest.update(repr(params).encode())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        :param key:
+        :return: wave ids, or None on a miss
+        """
+        wave_ids = self._wave_ids.get(key)
+        if wave_ids is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._wave_ids.move_to_end(key)
+        return wave_ids
+
+    def put(self, key, wave_ids) -> list:
+        """
+        Stores the wave ids of a wave
+        :param key:
+        :param wave_ids:
+        :return: list of the wave ids evicted, to be deleted from the daemon
+        """
+        self._wave_ids[key] = wave_ids
+        evicted = []
+        while len(self._wave_ids) > self.capacity:
+            evicted.extend(self.pop_oldest())
+        return evicted
+
+    def pop_oldest(self) -> list:
+        """
+        Evicts the least recently used wave
+        :return: its wave ids
+        """
+        self.evictions += 1
+        return self._wave_ids.popitem(last=False)[1]
+
+    def discard(self, key) -> list:
+        """
+        Forgets a wave, i.e. when the daemon no longer knows it
+        :param key:
+        :return: its wave ids
+        """
+        return self._wave_ids.pop(key, [])
+
+    def clear(self) -> list:
+        """
+        Forgets all waves
+        :return: all the wave ids
+        """
+        wave_ids = [wave_id for ids in self._wave_ids.values() for wave_id in ids]
+        self._wave_ids.clear()
+        return wave_ids
+
+    def __len__(self):
+        return len(self._wave_ids)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def metrics(self) -> dict:
+        """
+        :return: dict of the cache counters
+        """
+        return {"size": len(self), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hit_rate}
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections to one pigpio daemon.
+    Idle connections are checked before being reused, broken ones are discarded and replaced.
+    """
+
+    def __init__(self, host, port=8888, size=4, timeout=10.0, health_check_interval=30.0, wave_cache_size=16,
+                 pigpio_module=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._pigpio = pigpio_module or pigpio
+        self._idle = []
+        self._count = 0
+        self._condition = threading.Condition()
+        # the daemon builds and transmits a single wave at a time, whatever the connection
+        self.wave_lock = threading.Lock()
+        # waves are created daemon wide : their ids are valid on any connection
+        self.wave_ids = WaveIdCache(wave_cache_size)
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _connect(self):
+        pi = self._pigpio.pi(self.host, self.port)
+        if not pi.connected:
+            raise ConnectionError("Could not connect to pigpiod on {}:{}".format(self.host, self.port))
+        self.created += 1
+        return pi
+
+    def _healthy(self, pi, idle_since) -> bool:
+        if not pi.connected:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            pi.get_current_tick()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pi):
+        self.discarded += 1
+        try:
+            pi.stop()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """
+        Takes a connection from the pool, opening a new one if the pool isn't full, waiting otherwise.
+        :return: pigpio.pi
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                while self._idle:
+                    pi, idle_since = self._idle.pop()
+                    if self._healthy(pi, idle_since):
+                        self.reused += 1
+                        return pi
+                    self._count -= 1
+                    self._discard(pi)
+                if self._count < self.size:
+                    self._count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise TimeoutError("no pigpio connection available for {}:{}".format(self.host, self.port))
+        try:
+            return self._connect()
+        except Exception:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, pi, broken=False):
+        """
+        Gives a connection back to the pool
+        :param pi:
+        :param broken: discard the connection instead of keeping it
+        """
+        with self._condition:
+            if broken or not pi.connected:
+                self._count -= 1
+                self._discard(pi)
+            else:
+                self._idle.append((pi, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager lending a connection, discarded if an error occurs while in use
+        """
+        pi = self.acquire()
+        try:
+            yield pi
+        except Exception:
+            self.release(pi, broken=True)
+            raise
+        else:
+            self.release(pi)
+
+    def close(self):
+        """
+        Closes the idle connections
+        """
+        with self._condition:
+            while self._idle:
+                pi, _ = self._idle.pop()
+                self._count -= 1
+                self._discard(pi)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, port=8888, pigpio_module=None, **kwargs) -> ConnectionPool:
+    """
+    Returns the connection pool of a daemon, shared by all the backends using it
+    :param host:
+    :param port:
+    :param pigpio_module: pigpio (default) or a FakePigpio
+    :param kwargs: ConnectionPool arguments, used when the pool is created
+    :return: ConnectionPool
+    """
+    key = (host, port, id(pigpio_module))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(host, port, pigpio_module=pigpio_module, **kwargs)
+        return pool
+
+
+class PigpioBackend(Backend):
+    """
+    Sends waves on a GPIO of a pigpio daemon, modulated on the IR carrier
+    """
+
+    def __init__(self, host="localhost", port=8888, gpio=17, frequency=38000, duty_cycle=0.5, pool_size=4,
+                 pigpio_module=None):
+        from eakon.modulation import Modulator
+        self.gpio = gpio
+        self.frequency = frequency
+        self.duty_cycle = duty_cycle
+        self.modulator = Modulator(frequency, duty_cycle)
+        self._pigpio = pigpio_module or pigpio
+        self.pool = get_pool(host, port, pigpio_module=pigpio_module, size=pool_size)
+        self._initialized = set()
+
+    def _pulses(self, wave) -> list:
+        import numpy as np
+        rows = self.modulator.pulses(wave, self.gpio)
+        # a wave only has a handful of distinct pulses (carrier on, carrier off, and its spaces) : each one is built
+        # once and shared, rather than building thousands of pulse objects
+        keys = rows[:, 2].astype(np.int64) << 2 | (rows[:, 0] != 0) | (rows[:, 1] != 0) << 1
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        pulse = self._pigpio.pulse
+        distinct = [pulse(*row) for row in rows[first].tolist()]
+        return [distinct[i] for i in inverse.tolist()]
+
+    def _create_waves(self, pi, pulses) -> list:
+        max_pulses = pi.wave_get_max_pulses()
+        wave_ids = []
+        try:
+            for start in range(0, len(pulses), max_pulses):
+                # the daemon keeps the pulses of a failed wave_create : each wave starts from an empty one
+                pi.wave_add_new()
+                pi.wave_add_generic(pulses[start:start + max_pulses])
+                wave_id = pi.wave_create()
+                if wave_id < 0:
+                    raise RuntimeError("pigpio failed to create a wave ({})".format(wave_id))
+                wave_ids.append(wave_id)
+        except Exception:
+            for wave_id in wave_ids:
+                pi.wave_delete(wave_id)
+            raise
+        return wave_ids
+
+    def _transmit(self, pi, wave_ids, duration):
+        if len(wave_ids) == 1:
+            pi.wave_send_once(wave_ids[0])
+        else:
+            pi.wave_chain(wave_ids)
+        # sleeps most of the wave duration at once, then polls for its end
+        end = time.monotonic() + duration / 1e6
+        while pi.wave_tx_busy():
+            time.sleep(max(0.001, end - time.monotonic()))
+
+    def _setup(self, pi):
+        if id(pi) not in self._initialized:
+            pi.set_mode(self.gpio, self._pigpio.OUTPUT)
+            self._initialized.add(id(pi))
+
+    def _cached_waves(self, pi, key, wave) -> list:
+        cache = self.pool.wave_ids
+        wave_ids = cache.get(key)
+        if wave_ids is None:
+            pulses = self._pulses(wave)
+            while True:
+                try:
+                    wave_ids = self._create_waves(pi, pulses)
+                    break
+                except Exception:
+                    if not len(cache):
+                        raise
+                    # the daemon may be out of wave resources : frees the least recently used wave and retries
+                    self._delete_waves(pi, cache.pop_oldest())
+            self._delete_waves(pi, cache.put(key, wave_ids))
+        return wave_ids
+
+    @staticmethod
+    def _delete_waves(pi, wave_ids):
+        for wave_id in wave_ids:
+            pi.wave_delete(wave_id)
+
+    def send(self, wave):
+        key = WaveIdCache.key(wave, self.gpio, self.frequency, self.duty_cycle)
+        with self.pool.connection() as pi, self.pool.wave_lock:
+            self._setup(pi)
+            wave_ids = self._cached_waves(pi, key, wave)
+            try:
+                self._transmit(pi, wave_ids, sum(wave))
+            except Exception:
+                # the daemon may have been restarted, forgetting the waves it had : the cached ids are dropped, and
+                # deleted in case it still holds them
+                for wave_id in self.pool.wave_ids.discard(key):
+                    try:
+                        pi.wave_delete(wave_id)
+                    except Exception:
+                        logging.debug("failed to delete wave {}".format(wave_id), exc_info=True)
+                raise
+
+    @property
+    def metrics(self) -> dict:
+        """
+        wave id cache counters of the daemon
+        :return:
+        """
+        return self.pool.wave_ids.metrics()
+
+    def close(self):
+        with self.pool.connection() as pi, self.pool.wave_lock:
+            self._delete_waves(pi, self.pool.wave_ids.clear())
+        self.pool.close()
+
+
+class BackendTransmitter(Transmitter):
+    """
+    Adapts blocking backends to the asyncio scheduler : emitter -> backend, sends run in a thread pool
+    """
+
+    def __init__(self, backends: dict):
+        self.backends = backends
+
+    async def transmit(self, emitter, wave):
+        await asyncio.get_running_loop().run_in_executor(None, self.backends[emitter].send, wave)
+
+
+class FakePigpio:
+    """
+    Stand-in for the pigpio module, backed by in-memory daemons (one per host).
+    When realtime is set, waves take their actual duration to be transmitted.
+    """
+    OUTPUT = 1
+    pulse = namedtuple("pulse", ["gpio_on", "gpio_off", "delay"])
+
+    def __init__(self, max_pulses=12000, max_waves=250, realtime=False):
+        self.max_pulses = max_pulses
+        self.max_waves = max_waves
+        self.realtime = realtime
+        self.daemons = {}
+        self._lock = threading.Lock()
+
+    def daemon(self, host):
+        with self._lock:
+            if host not in self.daemons:
+                self.daemons[host] = _FakeDaemon(self)
+            return self.daemons[host]
+
+    def pi(self, host="localhost", port=8888):
+        return _FakePi(self.daemon(host))
+
+
+class _FakeDaemon:
+    def __init__(self, fake):
+        self.fake = fake
+        self.connections = 0
+        self.requests = 0
+        self.pulses_uploaded = 0
+        self.waves = {}
+        self.sent = []
+        self._next_id = 0
+        self._pending = []
+        self._busy_until = 0
+        self.lock = threading.Lock()
+
+
+class _FakePi:
+    def __init__(self, daemon):
+        self._daemon = daemon
+        self.connected = True
+        with daemon.lock:
+            daemon.connections += 1
+
+    def _request(self):
+        if not self.connected:
+            raise ConnectionError("connection closed")
+        self._daemon.requests += 1
+
+    def get_current_tick(self):
+        self._request()
+        return int(time.monotonic() * 1e6) & 0xffffffff
+
+    def set_mode(self, gpio, mode):
+        self._request()
+
+    def wave_get_max_pulses(self):
+        self._request()
+        return self._daemon.fake.max_pulses
+
+    def wave_add_new(self):
+        self._request()
+        with self._daemon.lock:
+            self._daemon._pending = []
+
+    def wave_add_generic(self, pulses):
+        self._request()
+        with self._daemon.lock:
+            if len(self._daemon._pending) + len(pulses) > self._daemon.fake.max_pulses:
+                raise RuntimeError("too many pulses")
+            self._daemon._pending.extend(pulses)
+            self._daemon.pulses_uploaded += len(pulses)
+        return len(self._daemon._pending)
+
+    def wave_create(self):
+        self._request()
+        with self._daemon.lock:
+            if len(self._daemon.waves) >= self._daemon.fake.max_waves:
+                # as the daemon, the pending pulses are kept
+                return -67  # PI_NO_WAVEFORM_ID
+            wave_id = self._daemon._next_id
+            self._daemon._next_id += 1
+            self._daemon.waves[wave_id] = self._daemon._pending
+            self._daemon._pending = []
+        return wave_id
+
+    def wave_send_once(self, wave_id):
+        self.wave_chain([wave_id])
+
+    def wave_chain(self, wave_ids):
+        self._request()
+        with self._daemon.lock:
+            duration = sum(p.delay for wave_id in wave_ids for p in self._daemon.waves[wave_id])
+            self._daemon.sent.append(tuple(wave_ids))
+            if self._daemon.fake.realtime:
+                self._daemon._busy_until = time.monotonic() + duration / 1e6
+
+    def wave_tx_busy(self):
+        self._request()
+        return int(time.monotonic() < self._daemon._busy_until)
+
+    def wave_delete(self, wave_id):
+        self._request()
+        with self._daemon.lock:
+            del self._daemon.waves[wave_id]
+
+    def stop(self):
+        self.connected = False
+
+
+def _bench_transport(sends=2000, threads=8):
+    from concurrent.futures import ThreadPoolExecutor
+    from eakon.enums import daikin_enum
+    from eakon.daikin import Daikin
+
+    fake = FakePigpio(max_waves=8)
+    backend = PigpioBackend("gateway", pigpio_module=fake, pool_size=4)
+    waves = [Daikin(power=daikin_enum.Power.ON, mode=daikin_enum.Mode.COOL, temperature=temperature).wave
+             for temperature in range(16, 31)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda i: backend.send(waves[i % 3 if i % 7 else i % len(waves)]), range(sends)))
+    elapsed = time.perf_counter() - start
+    daemon = fake.daemons["gateway"]
+    print("{} sends in {:.3f}s ({:.0f}/s), {} connections, {} requests, {} pulses uploaded".format(
+        sends, elapsed, sends / elapsed, daemon.connections, daemon.requests, daemon.pulses_uploaded))
+    print(backend.metrics)
+
+
+if __name__ == '__main__':
+    _bench_transport()
@@ -17,6 +17,8 @@ setuptools.setup(
     url="https://github.com/KurisuD/eakon",
     packages=setuptools.find_packages(),
     install_requires=['bitstring', 'pathlib'],
+    extras_require={'pigpio': ['pigpio', 'numpy'], 'analysis': ['numpy']},
+    entry_points={'console_scripts': ['eakon=eakon.cli:main']},
     classifiers=[
         "Programming Language :: Python :: 3 :: Only",
         "Programming Language :: Python :: 3.5",
@@ -0,0 +1,95 @@
+# coding=utf-8
+"""
+Behaviour of the transmission scheduler, on the in-memory FakeTransmitter
+"""
+import asyncio
+import unittest
+
+from eakon.scheduler import FakeTransmitter, Scheduler
+
+
+class _FailingTransmitter(FakeTransmitter):
+    async def transmit(self, emitter, wave):
+        raise RuntimeError("emitter {} unplugged".format(emitter))
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_coalesces_pending_commands(self):
+        async def run():
+            transmitter = FakeTransmitter()
+            scheduler = Scheduler(transmitter, min_gap=0)
+            futures = [scheduler.submit("unit", [temperature], emitter=0) for temperature in range(20, 25)]
+            await scheduler.join()
+            return transmitter, scheduler, futures
+
+        transmitter, scheduler, futures = asyncio.run(run())
+        # only the last state is sent, and it resolves all the futures
+        self.assertEqual([(emitter, wave) for emitter, wave, _, _ in transmitter.transmissions], [(0, [24])])
+        self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual((scheduler.submitted, scheduler.coalesced, scheduler.transmitted), (5, 4, 1))
+        self.assertEqual(scheduler.pending, 0)
+
+    def test_spaces_transmissions_on_an_emitter(self):
+        async def run():
+            transmitter = FakeTransmitter()
+            scheduler = Scheduler(transmitter, min_gap=0.05)
+            scheduler.submit("first", [1], emitter=0)
+            scheduler.submit("second", [2], emitter=0)
+            scheduler.submit("other", [3], emitter=1)
+            await scheduler.join()
+            return transmitter
+
+        transmissions = asyncio.run(run()).transmissions
+        self.assertEqual(len(transmissions), 3)
+        by_wave = {tuple(wave): (start, end) for _, wave, start, end in transmissions}
+        self.assertGreaterEqual(by_wave[(2,)][0] - by_wave[(1,)][1], 0.05)
+        # other emitters aren't held by the gap
+        self.assertLess(by_wave[(3,)][0], by_wave[(2,)][0])
+
+    def test_unit_moved_to_another_emitter(self):
+        async def run():
+            transmitter = FakeTransmitter()
+            scheduler = Scheduler(transmitter, min_gap=0)
+            first = scheduler.submit("unit", [1], emitter=0)
+            second = scheduler.submit("unit", [2], emitter=1)
+            await scheduler.join()
+            return transmitter, scheduler, [first, second]
+
+        transmitter, scheduler, futures = asyncio.run(run())
+        self.assertEqual([(emitter, wave) for emitter, wave, _, _ in transmitter.transmissions], [(1, [2])])
+        self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual(scheduler.coalesced, 1)
+
+    def test_unit_moved_while_its_emitter_waits(self):
+        async def run():
+            transmitter = FakeTransmitter()
+            scheduler = Scheduler(transmitter, min_gap=0.05)
+            await scheduler.submit("busy", [1], emitter=0)
+            # emitter 0 now waits for the gap, with only this unit queued, which then moves away
+            scheduler.submit("unit", [2], emitter=0)
+            await asyncio.sleep(0.01)
+            moved = scheduler.submit("unit", [3], emitter=1)
+            await scheduler.join()
+            return transmitter, scheduler, moved
+
+        transmitter, scheduler, moved = asyncio.run(run())
+        self.assertEqual([(emitter, wave) for emitter, wave, _, _ in transmitter.transmissions], [(0, [1]), (1, [3])])
+        self.assertTrue(moved.result())
+        self.assertEqual((scheduler.failed, scheduler.pending), (0, 0))
+
+    def test_failed_transmission(self):
+        async def run():
+            scheduler = Scheduler(_FailingTransmitter(), min_gap=0)
+            future = scheduler.submit("unit", [1], emitter=0)
+            await scheduler.join()
+            return scheduler, future
+
+        with self.assertLogs(level="ERROR"):
+            scheduler, future = asyncio.run(run())
+        self.assertIsInstance(future.exception(), RuntimeError)
+        self.assertEqual((scheduler.failed, scheduler.transmitted), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# coding=utf-8
+"""
+Behaviour of the pigpio backend, on the in-memory FakePigpio
+"""
+import threading
+import unittest
+from unittest import mock
+
+from eakon.transport import FakePigpio, PigpioBackend, _FakePi
+
+
+def _wave(bits):
+    return [3400, 1750] + [d for bit in bits for d in (430, 1300 if bit else 430)] + [430]
+
+
+class PigpioBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakePigpio()
+        # pools are shared per daemon : each test uses its own
+        self.host = self.id()
+        self.backend = PigpioBackend(self.host, pigpio_module=self.fake, pool_size=2)
+        self.daemon = self.fake.daemon(self.host)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_sends_the_modulated_wave(self):
+        wave = _wave([1, 0, 1, 1])
+        self.backend.send(wave)
+        self.assertEqual(len(self.daemon.sent), 1)
+        pulses = [pulse for wave_id in self.daemon.sent[0] for pulse in self.daemon.waves[wave_id]]
+        self.assertEqual(pulses, self.backend._pulses(wave))
+
+    def test_reuses_connections(self):
+        threads = [threading.Thread(target=self.backend.send, args=(_wave([i & 1, i & 2]),)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.daemon.sent), 8)
+        self.assertLessEqual(self.daemon.connections, 2)
+
+    def test_failed_transmission_deletes_the_waves(self):
+        with mock.patch.object(_FakePi, "wave_chain", side_effect=ConnectionError("daemon restarted")):
+            with self.assertRaises(ConnectionError):
+                self.backend.send(_wave([1, 0]))
+        self.assertEqual(self.daemon.waves, {})
+        self.assertEqual(len(self.backend.pool.wave_ids), 0)
+        # the broken connection was discarded, the next send opens a new one
+        self.backend.send(_wave([1, 0]))
+        self.assertEqual(len(self.daemon.sent), 1)
+        self.assertEqual(self.backend.pool.discarded, 1)
+
+    def test_failed_wave_creation_deletes_the_chunks(self):
+        self.fake.max_pulses = 16
+        wave = _wave([1, 0, 1, 1])
+        create = _FakePi.wave_create
+        calls = []
+
+        def fail_third(pi):
+            calls.append(pi)
+            return -67 if len(calls) == 3 else create(pi)
+
+        with mock.patch.object(_FakePi, "wave_create", fail_third):
+            with self.assertRaises(RuntimeError):
+                self.backend.send(wave)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.daemon.waves, {})
+        self.assertEqual(self.daemon.sent, [])
+
+    def test_close_deletes_the_waves(self):
+        self.backend.send(_wave([1]))
+        self.backend.send(_wave([0]))
+        self.backend.close()
+        self.assertEqual(self.daemon.waves, {})
+
+
+
+class WaveIdCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakePigpio()
+        self.host = self.id()
+        self.backend = PigpioBackend(self.host, pigpio_module=self.fake, pool_size=1)
+        self.daemon = self.fake.daemon(self.host)
+
+    def tearDown(self):
+        self.backend.close()
+
+    def _sent_pulses(self, index=-1):
+        return [pulse for wave_id in self.daemon.sent[index] for pulse in self.daemon.waves[wave_id]]
+
+    def test_same_wave_is_uploaded_once(self):
+        wave = _wave([1, 1, 0])
+        self.backend.send(wave)
+        uploaded = self.daemon.pulses_uploaded
+        self.backend.send(list(wave))
+        self.assertEqual(self.daemon.pulses_uploaded, uploaded)
+        self.assertEqual(self.daemon.sent[0], self.daemon.sent[1])
+        metrics = self.backend.metrics
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["size"]), (1, 1, 1))
+
+    def test_modulation_is_part_of_the_key(self):
+        wave = _wave([1, 1, 0])
+        other = PigpioBackend(self.host, pigpio_module=self.fake, gpio=18)
+        self.backend.send(wave)
+        other.send(wave)
+        self.assertNotEqual(self.daemon.sent[0], self.daemon.sent[1])
+        self.assertEqual(len(self.daemon.waves), 2)
+
+    def test_evicts_the_least_recently_used_wave(self):
+        self.backend.pool.wave_ids.capacity = 2
+        first, second, third = _wave([0]), _wave([1]), _wave([1, 1])
+        self.backend.send(first)
+        self.backend.send(second)
+        self.backend.send(first)
+        self.backend.send(third)
+        # second was the least recently used : its wave was deleted from the daemon
+        self.assertEqual(len(self.daemon.waves), 2)
+        self.backend.send(first)
+        self.assertEqual(self.backend.metrics["hits"], 2)
+        self.backend.send(second)
+        self.assertEqual(self._sent_pulses(), self.backend._pulses(second))
+        self.assertEqual(self.backend.metrics["evictions"], 2)
+
+    def test_retries_when_the_daemon_is_full(self):
+        self.fake.max_waves = 2
+        waves = [_wave([0]), _wave([1]), _wave([1, 1]), _wave([1, 0, 1])]
+        for wave in waves:
+            self.backend.send(wave)
+            # the pulses left by the failed wave_create aren't added to the retried wave
+            self.assertEqual(self._sent_pulses(), self.backend._pulses(wave))
+        self.assertEqual(len(self.daemon.waves), 2)
+        self.assertEqual(self.backend.metrics["evictions"], 2)
+
+    def test_chunked_waves_are_retried_whole(self):
+        self.fake.max_pulses = 64
+        self.fake.max_waves = 12
+        waves = [_wave([0, 1]), _wave([1, 0]), _wave([1, 1])]
+        for wave in waves:
+            self.backend.send(wave)
+            self.assertGreater(len(self.daemon.sent[-1]), 1)
+            self.assertEqual(self._sent_pulses(), self.backend._pulses(wave))
+            self.assertTrue(all(len(pulses) <= 64 for pulses in self.daemon.waves.values()))
+        self.assertLessEqual(len(self.daemon.waves), 12)
+        self.assertEqual(self.backend.metrics["evictions"], 1)
+
+    def test_too_large_for_the_daemon(self):
+        self.fake.max_waves = 0
+        with self.assertRaises(RuntimeError):
+            self.backend.send(_wave([1]))
+        self.assertEqual(self.daemon.waves, {})
+
+
+if __name__ == '__main__':
+    unittest.main()